@@ -2,15 +2,19 @@
 WhatsApp Bot Trieste - App principale Flask
 """
 
-from flask import Flask, jsonify, render_template, session, redirect, send_file
-import io
+from flask import Flask, Response, jsonify, render_template, request, session, redirect, send_file
 from routes.webhook import webhook_bp
 from routes.dashboard_api import dashboard_api_bp
 from routes.auth import auth_bp, login_required
-from database import get_db_session, ClienteDB, FAQDB, MessaggioDB, init_db
+from database import get_db_session, get_read_session, ClienteDB, FAQDB, MessaggioDB, prepara_database, init_sessioni_app, stato_pool
 from config import Config
+import atexit
 import os
-from utils.analytics import get_analytics_dashboard, get_report_giornaliero, get_report_mensile
+from utils.analytics import get_analytics_dashboard, get_report_giornaliero, get_report_mensile, get_serie_temporale, get_latenze, get_efficacia_faq
+from utils.statistiche import oggi_locale
+from utils.cache import in_cache, invalida_cache, statistiche_cache
+from utils.backup import avvia_ripristino, catena_da_stato, stato_ripristino
+from werkzeug.utils import secure_filename
 from utils.integrations import invia_report_settimanale, notifica_admin_nuovo_cliente
 from datetime import datetime, timedelta
 from utils.scheduler import start_scheduler, stop_scheduler
@@ -18,12 +22,19 @@ from utils.data_export import (
     export_clienti_csv, export_faq_csv, export_messaggi_csv,
     export_backup_completo, import_clienti_da_csv, import_faq_da_csv
 )
+from utils.importazione import crea_job_import, stato_job
 
 # from utils.integrations import invia_report_settimanale, notifica_admin_nuovo_cliente
 
 
-# Avvia lo scheduler
+# Schema allineato ai modelli prima di servire richieste o avviare lo
+# scheduler (anche sotto gunicorn, dove __main__ non viene eseguito)
+prepara_database()
+
+# Avvia lo scheduler (i task girano solo nel processo leader, vedi utils/scheduler.py)
 start_scheduler()
+# Uscita pulita del worker = lease lasciato subito a un altro processo
+atexit.register(stop_scheduler)
 
 # Crea l'app Flask
 app = Flask(__name__)
@@ -34,6 +45,9 @@ app.config.from_object(Config)
 # Imposta la chiave segreta per le sessioni
 app.secret_key = Config.SECRET_KEY if hasattr(Config, 'SECRET_KEY') else 'dev-secret-key-change-in-production'
 
+# Chiude le sessioni DB a fine richiesta (e segnala quelle dimenticate)
+init_sessioni_app(app)
+
 # Registra le blueprint
 app.register_blueprint(webhook_bp)
 app.register_blueprint(dashboard_api_bp)
@@ -52,21 +66,89 @@ app.register_blueprint(auth_bp)
 @login_required
 def analytics_dashboard():
     """Analytics dashboard completo"""
-    return jsonify(get_analytics_dashboard())
+    return jsonify(in_cache("analytics_dashboard", Config.CACHE_TTL_ANALYTICS, get_analytics_dashboard))
 
 
 @app.route('/api/analytics/report/giornaliero', methods=['GET'])
 @login_required
 def report_giornaliero():
     """Report giornaliero"""
-    return jsonify(get_report_giornaliero())
+    return jsonify(in_cache("report_giornaliero", Config.CACHE_TTL_ANALYTICS, get_report_giornaliero))
 
 
 @app.route('/api/analytics/report/mensile', methods=['GET'])
 @login_required
 def report_mensile():
     """Report mensile"""
-    return jsonify(get_report_mensile())
+    return jsonify(in_cache("report_mensile", Config.CACHE_TTL_ANALYTICS, get_report_mensile))
+
+
+@app.route('/api/analytics/timeseries', methods=['GET'])
+@login_required
+def analytics_timeseries():
+    """
+    Serie temporale densa per i grafici
+    
+    ?metric=messaggi_totali&from=2025-01-01&to=2025-01-31&bucket=day&settore=sport
+    from/to sono giorni locali (Europe/Rome); default ultimi 30 giorni.
+    """
+    try:
+        oggi = oggi_locale()
+        giorno_a = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else oggi
+        giorno_da = (datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from')
+                     else giorno_a - timedelta(days=29))
+        metrica = request.args.get('metric', 'messaggi_totali')
+        bucket = request.args.get('bucket', 'day')
+        settore = request.args.get('settore', '')
+        
+        serie = in_cache(
+            "analytics_timeseries", Config.CACHE_TTL_ANALYTICS, get_serie_temporale,
+            metrica, giorno_da, giorno_a, bucket, settore
+        )
+        return jsonify(serie)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route('/api/analytics/latency', methods=['GET'])
+@login_required
+def analytics_latency():
+    """
+    Percentili di latenza delle risposte (p50/p90/p99)
+    
+    ?from=2025-01-01&to=2025-01-07 (giorni locali, default ultimi 7 giorni)
+    """
+    try:
+        oggi = oggi_locale()
+        giorno_a = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else oggi
+        giorno_da = (datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from')
+                     else giorno_a - timedelta(days=6))
+        
+        return jsonify(in_cache("analytics_latency", Config.CACHE_TTL_ANALYTICS, get_latenze, giorno_da, giorno_a))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route('/api/analytics/faq', methods=['GET'])
+@login_required
+def analytics_faq():
+    """
+    Classifica FAQ (hit, quasi match, score medio) e domande senza match più frequenti
+    
+    ?from=2025-01-01&to=2025-01-31&limite=20 (giorni locali, default ultimi 30 giorni)
+    """
+    try:
+        oggi = oggi_locale()
+        giorno_a = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else oggi
+        giorno_da = (datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from')
+                     else giorno_a - timedelta(days=29))
+        limite = min(request.args.get('limite', 20, type=int), 100)
+        
+        return jsonify(in_cache(
+            "analytics_faq", Config.CACHE_TTL_ANALYTICS, get_efficacia_faq, giorno_da, giorno_a, limite
+        ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
 
 @app.route('/api/analytics/report/invia-email', methods=['POST'])
@@ -89,9 +171,12 @@ def invia_report_email():
 @login_required
 def scheduler_status():
     """Status dello scheduler"""
-    from utils.scheduler import scheduler
+    from utils.scheduler import scheduler, is_leader, stato_lease, PROPRIETARIO
     return jsonify({
         "running": scheduler.running,
+        "leader": is_leader(),  # solo il leader esegue i task
+        "processo": PROPRIETARIO,
+        "lease": stato_lease(),
         "jobs": len(scheduler.get_jobs()),
         "jobs_list": [
             {
@@ -104,6 +189,74 @@ def scheduler_status():
     })
 
 
+@app.route('/admin/db/status', methods=['GET'])
+@login_required
+def db_status():
+    """Stato del pool connessioni database"""
+    return jsonify(stato_pool())
+
+
+@app.route('/admin/cache/status', methods=['GET'])
+@login_required
+def cache_status():
+    """Stato della cache risposte (hit ratio)"""
+    return jsonify(statistiche_cache())
+
+
+@app.route('/admin/backup/ripristina', methods=['POST'])
+@login_required
+def ripristina_backup_admin():
+    """
+    Avvia il ripristino di un backup (sovrascrive il database!)
+    
+    - multipart con 'file': un backup completo caricato (.ndjson.gz, .ndjson.zst o vecchio .json)
+    - JSON {"file": ["completo...", "incrementale..."]}: file già in BACKUP_DIR, in ordine
+    - JSON vuoto: la catena corrente (ultimo completo + incrementali)
+    'ricostruisci_indici' (true/false) toglie e ricrea gli indici durante il caricamento.
+    L'avanzamento si legge da /admin/backup/ripristina/stato.
+    """
+    if session.get('ruolo') != 'admin':
+        return jsonify({"error": "Solo admin può ripristinare un backup"}), 403
+    
+    dati = request.get_json(silent=True) or {}
+    ricostruisci = str(request.form.get('ricostruisci_indici', dati.get('ricostruisci_indici', False))).lower() in ('true', '1')
+    
+    try:
+        if 'file' in request.files:
+            file = request.files['file']
+            nome = secure_filename(file.filename or '')
+            if not nome:
+                return jsonify({"error": "Nome file non valido"}), 400
+            
+            cartella = os.path.join(Config.BACKUP_DIR, 'caricati')
+            os.makedirs(cartella, exist_ok=True)
+            percorsi = [os.path.join(cartella, nome)]
+            file.save(percorsi[0])
+        elif dati.get('file'):
+            percorsi = [os.path.join(Config.BACKUP_DIR, os.path.basename(f)) for f in dati['file']]
+        else:
+            percorsi = catena_da_stato()
+        
+        avvia_ripristino(percorsi, ricostruisci)
+    except (ValueError, FileNotFoundError) as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    
+    return jsonify({
+        "success": True,
+        "file": [os.path.basename(p) for p in percorsi],
+        "stato": "/admin/backup/ripristina/stato"
+    }), 202
+
+
+@app.route('/admin/backup/ripristina/stato', methods=['GET'])
+@login_required
+def stato_ripristino_admin():
+    """Avanzamento dell'ultimo ripristino"""
+    return jsonify(stato_ripristino())
+
+
 @app.route('/', methods=['GET'])
 def home():
     """Home page - Mostra che il bot è online"""
@@ -143,7 +296,12 @@ def dashboard():
 @app.route('/api/status', methods=['GET'])
 def api_status():
     """Status del bot - mostra statistiche"""
-    db = get_db_session()
+    return jsonify(in_cache("status", Config.CACHE_TTL_STATUS, calcola_status)), 200
+
+
+def calcola_status():
+    """Statistiche per /api/status (calcolate fuori dalla richiesta, per la cache)"""
+    db = get_read_session()
     
     try:
         # Conta clienti
@@ -166,7 +324,7 @@ def api_status():
             MessaggioDB.data_messaggio.desc()
         ).limit(5).all()
         
-        return jsonify({
+        return {
             "status": "running",
             "clienti": {
                 "totali": clienti_totali,
@@ -187,7 +345,7 @@ def api_status():
                 }
                 for m in ultimi_messaggi
             ]
-        }), 200
+        }
     finally:
         db.close()
 
@@ -218,88 +376,99 @@ def api_clienti():
 # EXPORT/IMPORT ROUTES
 # ============================================================================
 
+def risposta_csv(generatore, filename):
+    """Risposta HTTP che invia il CSV man mano che viene generato"""
+    return Response(
+        generatore,
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
 @app.route('/api/export/clienti', methods=['GET'])
 @login_required
 def download_clienti_csv():
     """Download clienti in CSV"""
-    csv_content, filename = export_clienti_csv()
-    
-    si = io.StringIO(csv_content)
-    si.seek(0)
-    
-    return send_file(
-        io.BytesIO(csv_content.encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=filename
-    )
+    return risposta_csv(*export_clienti_csv())
 
 
 @app.route('/api/export/faq', methods=['GET'])
 @login_required
 def download_faq_csv():
     """Download FAQ in CSV"""
-    csv_content, filename = export_faq_csv()
-    
-    return send_file(
-        io.BytesIO(csv_content.encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=filename
-    )
+    return risposta_csv(*export_faq_csv())
 
 
 @app.route('/api/export/messaggi', methods=['GET'])
 @login_required
 def download_messaggi_csv():
-    """Download messaggi in CSV"""
-    csv_content, filename = export_messaggi_csv()
+    """
+    Download messaggi in CSV
     
-    return send_file(
-        io.BytesIO(csv_content.encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=filename
-    )
+    ?from=2025-01-01&to=2025-12-31 opzionali (giorni locali, estremi inclusi)
+    """
+    try:
+        giorno_da = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else None
+        giorno_a = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else None
+    except ValueError:
+        return jsonify({"error": "Date non valide (formato YYYY-MM-DD)"}), 400
+    
+    return risposta_csv(*export_messaggi_csv(giorno_da, giorno_a))
 
 
 @app.route('/api/export/backup', methods=['GET'])
 @login_required
 def download_backup():
-    """Download backup completo in JSON"""
-    import json
-    backup_data, filename = export_backup_completo()
-    
-    json_content = json.dumps(backup_data, indent=2, ensure_ascii=False)
+    """Download backup completo (NDJSON compresso)"""
+    percorso, filename = export_backup_completo()
     
     return send_file(
-        io.BytesIO(json_content.encode('utf-8')),
-        mimetype='application/json',
+        os.path.abspath(percorso),
+        mimetype='application/gzip' if filename.endswith('.gz') else 'application/zstd',
         as_attachment=True,
         download_name=filename
     )
 
 
-@app.route('/api/import/clienti', methods=['POST'])
-@login_required
-def upload_clienti_csv():
-    """Upload e importa clienti da CSV"""
+def avvia_import_csv(tipo):
+    """
+    Importa il CSV caricato.
+    
+    Di norma lo salva in IMPORT_DIR e avvia un job in background (202 + id).
+    Con ?sincrono=1, con IMPORT_IN_BACKGROUND=False o se IMPORT_DIR non è
+    scrivibile lo importa subito leggendo lo stream dell'upload, senza file
+    intermedi, e risponde con il risultato.
+    """
     
     if 'file' not in request.files:
         return jsonify({"error": "File non fornito"}), 400
     
     file = request.files['file']
+    nome = secure_filename(file.filename or '')
     
-    if not file.filename.endswith('.csv'):
+    if not nome.lower().endswith('.csv'):
         return jsonify({"error": "Solo file CSV sono accettati"}), 400
     
+    sincrono = request.args.get('sincrono', '').lower() in ('1', 'true') or not Config.IMPORT_IN_BACKGROUND
+    
     try:
-        # Salva temporaneamente
-        filepath = f"/tmp/{file.filename}"
-        file.save(filepath)
+        if not sincrono:
+            try:
+                job_id = crea_job_import(tipo, file.stream, nome)
+                
+                return jsonify({
+                    "success": True,
+                    "message": "Importazione avviata",
+                    "job_id": job_id,
+                    "stato": f"/api/import/jobs/{job_id}"
+                }), 202
+            except OSError as e:
+                print(f"⚠️  {Config.IMPORT_DIR} non scrivibile ({e}): import diretto dallo stream")
+                file.stream.seek(0)
         
-        # Importa
-        aggiunti, duplicati, errori = import_clienti_da_csv(filepath)
+        importa = import_clienti_da_csv if tipo == 'clienti' else import_faq_da_csv
+        aggiunti, duplicati, errori = importa(file.stream, nome)
+        invalida_cache()
         
         return jsonify({
             "success": True,
@@ -313,35 +482,28 @@ def upload_clienti_csv():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/import/clienti', methods=['POST'])
+@login_required
+def upload_clienti_csv():
+    """Upload e importa clienti da CSV (in background)"""
+    return avvia_import_csv('clienti')
+
+
 @app.route('/api/import/faq', methods=['POST'])
 @login_required
 def upload_faq_csv():
-    """Upload e importa FAQ da CSV"""
-    
-    if 'file' not in request.files:
-        return jsonify({"error": "File non fornito"}), 400
-    
-    file = request.files['file']
-    
-    if not file.filename.endswith('.csv'):
-        return jsonify({"error": "Solo file CSV sono accettati"}), 400
-    
-    try:
-        filepath = f"/tmp/{file.filename}"
-        file.save(filepath)
-        
-        aggiunti, duplicati, errori = import_faq_da_csv(filepath)
-        
-        return jsonify({
-            "success": True,
-            "message": "Importazione completata",
-            "aggiunti": aggiunti,
-            "duplicati": duplicati,
-            "errori": errori[:10]
-        })
-    
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    """Upload e importa FAQ da CSV (in background)"""
+    return avvia_import_csv('faq')
+
+
+@app.route('/api/import/jobs/<job_id>', methods=['GET'])
+@login_required
+def stato_import_job(job_id):
+    """Avanzamento di un import: righe, velocità, errori, tempo stimato"""
+    stato = stato_job(job_id)
+    if stato is None:
+        return jsonify({"error": "Job non trovato"}), 404
+    return jsonify(stato)
 
 
 @app.route('/api/faq', methods=['GET'])
@@ -405,9 +567,6 @@ def internal_error(error):
 # ============================================================================
 
 if __name__ == '__main__':
-    # Inizializza il database
-    init_db()
-    
     print("\n" + "="*70)
     print("🚀 WHATSAPP BOT TRIESTE")
     print("="*70)
@@ -29,6 +29,24 @@ class Config:
     # ===== DATABASE =====
     # Caricato da database.py
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///bot_database.db")
+    # Opzionale: replica in sola lettura per analytics, report ed export
+    DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "")
+    
+    # ===== POOL CONNESSIONI =====
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))  # connessioni sempre aperte
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))  # connessioni extra nei picchi
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))  # secondi di attesa per una connessione libera
+    # Segnala (e chiude) le sessioni rimaste aperte a fine richiesta
+    DB_LEAK_DETECTION = os.getenv("DB_LEAK_DETECTION", "True") == "True"
+    
+    # ===== PROFILO PRESTAZIONI SQLITE =====
+    # Applicato a ogni nuova connessione (solo se DATABASE_URL è SQLite)
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")  # WAL = letture e scritture concorrenti
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # NORMAL è sicuro con WAL
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 268435456))  # byte (256 MB)
+    SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -65536))  # negativo = KiB (64 MB)
+    SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))  # ms di attesa su lock
+    SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY")
     
     # ===== WHATSAPP API =====
     WHATSAPP_API_URL = "https://graph.facebook.com/v18.0"
@@ -40,9 +58,70 @@ class Config:
     PERPLEXITY_API_KEY = os.getenv("PERPLEXITY_API_KEY", "")
     PERPLEXITY_API_URL = "https://api.perplexity.ai/chat/completions"
     
+    # ===== TELEFONI =====
+    # Prefisso internazionale per i numeri scritti senza (es. "333 1234567" -> +39...)
+    TELEFONO_PREFISSO = os.getenv("TELEFONO_PREFISSO", "39")
+    
     # ===== IMPOSTAZIONI BOT =====
     # Quanto deve somigliare una domanda a una keyword per essere FAQ match
     FUZZY_MATCH_THRESHOLD = 70  # 0-100, >= significa match
+    # Risposte Perplexity con score entro questo margine dalla soglia = "quasi match"
+    FAQ_NEAR_MISS_MARGINE = int(os.getenv("FAQ_NEAR_MISS_MARGINE", 15))
+    
+    # ===== ANALYTICS =====
+    # Fuso orario per i confini dei giorni nelle statistiche
+    TIMEZONE = os.getenv("TIMEZONE", "Europe/Rome")
+    
+    # ===== CACHE RISPOSTE =====
+    CACHE_ABILITATA = os.getenv("CACHE_ABILITATA", "True") == "True"
+    CACHE_TTL_ANALYTICS = int(os.getenv("CACHE_TTL_ANALYTICS", 60))  # secondi
+    CACHE_TTL_STATUS = int(os.getenv("CACHE_TTL_STATUS", 10))  # secondi
+    # Oltre questa età un valore vecchio non viene più servito mentre si ricalcola
+    CACHE_STALE_MAX = int(os.getenv("CACHE_STALE_MAX", 300))  # secondi
+    
+    # ===== BACKUP =====
+    BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+    BACKUP_COMPRESSIONE = os.getenv("BACKUP_COMPRESSIONE", "gzip")  # "gzip" o "zstd" (richiede zstandard)
+    # Backup incrementale ogni ora (dall'ultimo backup della catena)
+    BACKUP_INCREMENTALE_ABILITATO = os.getenv("BACKUP_INCREMENTALE_ABILITATO", "True") == "True"
+    
+    # ===== IMPORT CSV =====
+    # False = gli upload vengono importati subito dallo stream, senza file su disco
+    # (niente ripresa dopo un crash; per filesystem in sola lettura)
+    IMPORT_IN_BACKGROUND = os.getenv("IMPORT_IN_BACKGROUND", "True") == "True"
+    IMPORT_DIR = os.getenv("IMPORT_DIR", "imports")  # CSV caricati in attesa di import
+    # Un job senza progressi da più di così viene considerato interrotto e ripreso
+    IMPORT_JOB_TIMEOUT = int(os.getenv("IMPORT_JOB_TIMEOUT", 120))  # secondi
+    IMPORT_JOB_TENTATIVI = int(os.getenv("IMPORT_JOB_TENTATIVI", 3))
+    # Processi per leggere e validare il CSV in parallelo (1 = nel processo del job)
+    IMPORT_PROCESSI = int(os.getenv("IMPORT_PROCESSI", 1))
+    
+    # ===== CATALOGO FAQ =====
+    # File sincronizzato da scripts/sincronizza_faq.py (.json, .csv o .yaml)
+    FAQ_CATALOGO = os.getenv("FAQ_CATALOGO", "faq/catalogo.json")
+    
+    # ===== DASHBOARD =====
+    # Per quanti secondi riusare il "totale" nella paginazione a cursore
+    CONTEGGI_CACHE_TTL = int(os.getenv("CONTEGGI_CACHE_TTL", 30))
+    
+    # ===== SCHEDULER =====
+    # Con più worker i task girano solo nel processo che tiene il lease nel DB
+    SCHEDULER_LEASE_DURATA = int(os.getenv("SCHEDULER_LEASE_DURATA", 60))  # secondi senza rinnovo -> failover
+    SCHEDULER_LEASE_RINNOVO = int(os.getenv("SCHEDULER_LEASE_RINNOVO", 15))  # secondi tra un rinnovo e l'altro
+    # Esecuzioni perse (leader giù, riavvio) recuperate se in ritardo di al massimo così
+    SCHEDULER_MISFIRE_GRACE = int(os.getenv("SCHEDULER_MISFIRE_GRACE", 900))  # secondi
+    # task_pulizia_dati elimina i messaggi più vecchi; il rollup
+    # statistiche_giornaliere di quei giorni resta (storico delle analytics)
+    MESSAGGI_CONSERVAZIONE_GIORNI = int(os.getenv("MESSAGGI_CONSERVAZIONE_GIORNI", 90))
+    
+    # ===== SEGMENTI SCHEDULER =====
+    # Vuoto = tutti i clienti. Tag multipli: "VIP|Attivo" (li deve avere tutti)
+    REMINDER_SETTORE = os.getenv("REMINDER_SETTORE", "")
+    REMINDER_TAG = os.getenv("REMINDER_TAG", "")
+    UPSELL_SETTORE = os.getenv("UPSELL_SETTORE", "")
+    UPSELL_TAG = os.getenv("UPSELL_TAG", "")
+    # Invii falliti (API WhatsApp) riprovati alle esecuzioni successive fino a
+    OUTBOUND_TENTATIVI = int(os.getenv("OUTBOUND_TENTATIVI", 3))
     
     # ===== FLASK =====
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production")
@@ -2,13 +2,22 @@
 Database - Gestione del database PostgreSQL/SQLite
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text
+from sqlalchemy import create_engine, event, inspect, Column, Integer, String, Date, DateTime, Boolean, Text, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from flask import g, has_app_context, has_request_context, request
 from config import Config
 from datetime import datetime
 import bcrypt
+import hashlib
 import os
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: restano solo i tentativi di prepara_database
+    fcntl = None
 
 # ============================================================================
 # CONFIGURAZIONE DATABASE
@@ -16,17 +25,149 @@ import os
 
 print(f"\n📦 Usando database: {Config.DATABASE_URL}")
 
+# Valori ammessi per i pragma testuali del profilo SQLite
+SQLITE_JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+SQLITE_SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+SQLITE_TEMP_STORES = ("DEFAULT", "FILE", "MEMORY")
+
+
+def profilo_sqlite():
+    """
+    Ritorna il profilo prestazioni SQLite letto da Config.
+    
+    Solleva ValueError se un valore non è valido, così un errore
+    di configurazione blocca l'avvio invece di passare inosservato.
+    """
+    profilo = {
+        "journal_mode": Config.SQLITE_JOURNAL_MODE.upper(),
+        "synchronous": Config.SQLITE_SYNCHRONOUS.upper(),
+        "mmap_size": Config.SQLITE_MMAP_SIZE,
+        "cache_size": Config.SQLITE_CACHE_SIZE,
+        "busy_timeout": Config.SQLITE_BUSY_TIMEOUT,
+        "temp_store": Config.SQLITE_TEMP_STORE.upper(),
+    }
+    
+    if profilo["journal_mode"] not in SQLITE_JOURNAL_MODES:
+        raise ValueError(f"SQLITE_JOURNAL_MODE non valido: {profilo['journal_mode']}")
+    if profilo["synchronous"] not in SQLITE_SYNCHRONOUS_MODES:
+        raise ValueError(f"SQLITE_SYNCHRONOUS non valido: {profilo['synchronous']}")
+    if profilo["temp_store"] not in SQLITE_TEMP_STORES:
+        raise ValueError(f"SQLITE_TEMP_STORE non valido: {profilo['temp_store']}")
+    if profilo["mmap_size"] < 0:
+        raise ValueError("SQLITE_MMAP_SIZE deve essere >= 0")
+    if profilo["busy_timeout"] < 0:
+        raise ValueError("SQLITE_BUSY_TIMEOUT deve essere >= 0")
+    if profilo["cache_size"] == 0:
+        raise ValueError("SQLITE_CACHE_SIZE non può essere 0")
+    
+    return profilo
+
+
+def crea_engine(database_url, sola_lettura=False):
+    """
+    Crea il motore del database.
+    
+    Su SQLite applica il profilo prestazioni (WAL, synchronous, mmap,
+    cache, busy_timeout, temp_store) a ogni nuova connessione, così
+    webhook e scheduler possono scrivere in parallelo senza
+    "database is locked".
+    
+    Con sola_lettura=True ogni connessione rifiuta le scritture
+    (PRAGMA query_only su SQLite, default_transaction_read_only su
+    PostgreSQL): usato per l'engine di lettura (replica).
+    """
+    is_sqlite = database_url.startswith("sqlite")
+    in_memoria = is_sqlite and (":memory:" in database_url or database_url.rstrip("/") == "sqlite:")
+    
+    # Il database in memoria usa un pool a connessione singola senza overflow
+    pool_args = {}
+    if not in_memoria:
+        pool_args = {
+            "pool_size": Config.DB_POOL_SIZE,
+            "max_overflow": Config.DB_MAX_OVERFLOW,
+            "pool_timeout": Config.DB_POOL_TIMEOUT,
+        }
+    
+    connect_args = {}
+    if is_sqlite:
+        profilo = profilo_sqlite()
+        # Il timeout del driver (secondi) copre anche il BEGIN iniziale
+        connect_args = {
+            "check_same_thread": False,
+            "timeout": profilo["busy_timeout"] / 1000,
+        }
+        if sola_lettura:
+            profilo = dict(profilo, query_only="ON")
+    elif sola_lettura and database_url.startswith("postgres"):
+        connect_args = {"options": "-c default_transaction_read_only=on"}
+    
+    nuovo_engine = create_engine(
+        database_url,
+        echo=False,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        connect_args=connect_args,
+        **pool_args
+    )
+    
+    if is_sqlite:
+        @event.listens_for(nuovo_engine, "connect")
+        def applica_profilo_sqlite(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for nome, valore in profilo.items():
+                    cursor.execute(f"PRAGMA {nome}={valore}")
+            finally:
+                cursor.close()
+    
+    return nuovo_engine
+
+
+def verifica_profilo_sqlite(engine_da_verificare):
+    """
+    Rilegge i pragma dalla connessione e li confronta col profilo.
+    
+    Ritorna il dizionario dei valori effettivi ({} se non è SQLite).
+    Un database in memoria, per esempio, non può usare WAL: in quel
+    caso viene stampato un avviso ma l'avvio prosegue.
+    """
+    if engine_da_verificare.dialect.name != "sqlite":
+        return {}
+    
+    profilo = profilo_sqlite()
+    effettivi = {}
+    
+    with engine_da_verificare.connect() as conn:
+        for nome in profilo:
+            effettivi[nome] = conn.exec_driver_sql(f"PRAGMA {nome}").scalar()
+    
+    # synchronous e temp_store vengono riletti come numeri
+    attesi = dict(profilo)
+    attesi["journal_mode"] = profilo["journal_mode"].lower()
+    attesi["synchronous"] = SQLITE_SYNCHRONOUS_MODES.index(profilo["synchronous"])
+    attesi["temp_store"] = SQLITE_TEMP_STORES.index(profilo["temp_store"])
+    
+    for nome, atteso in attesi.items():
+        if effettivi[nome] != atteso:
+            print(f"⚠️  PRAGMA {nome}: atteso {atteso}, effettivo {effettivi[nome]}")
+    
+    return effettivi
+
+
 # Crea il motore del database
-engine = create_engine(
-    Config.DATABASE_URL,
-    echo=False,
-    pool_pre_ping=True,
-    pool_recycle=3600,
-    connect_args={"check_same_thread": False} if "sqlite" in Config.DATABASE_URL else {}
-)
+engine = crea_engine(Config.DATABASE_URL)
+
+# Motore di lettura (replica) per analytics, report ed export.
+# Senza DATABASE_READ_URL coincide con il primario.
+if Config.DATABASE_READ_URL:
+    print(f"📦 Database di lettura: {Config.DATABASE_READ_URL}")
+    read_engine = crea_engine(Config.DATABASE_READ_URL, sola_lettura=True)
+else:
+    read_engine = engine
 
 # Crea la sessione
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLettura = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 # Crea la classe Base per gli ORM
 Base = declarative_base()
@@ -69,6 +210,11 @@ class ClienteDB(Base):
     Tabella CLIENTI - Dati di ogni cliente WhatsApp
     """
     __tablename__ = "clienti"
+    __table_args__ = (
+        # Paginazione a cursore della dashboard su (colonna, id)
+        Index('ix_clienti_data_creazione_id', 'data_creazione', 'id'),
+        Index('ix_clienti_ultima_interazione_id', 'ultima_interazione', 'id'),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     phone = Column(String(20), unique=True, index=True)  # +393331234567
@@ -76,17 +222,49 @@ class ClienteDB(Base):
     azienda = Column(String(150))
     settore = Column(String(50))  # "finanza", "sport", "coworking", "generico"
     email = Column(String(100))
-    etichette = Column(Text, default="")  # "VIP|Attivo"
+    etichette = Column(Text, default="")  # "VIP|Attivo" (copia testuale, i filtri usano cliente_tag)
     note = Column(Text, default="")
     data_creazione = Column(DateTime, default=datetime.utcnow)
     ultima_interazione = Column(DateTime, default=datetime.utcnow)
     numero_messaggi = Column(Integer, default=0)
     stato = Column(String(20), default="attivo")  # "attivo", "inattivo", "blocked"
+    # Ultima modifica della riga (backup incrementali)
+    data_modifica = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def __repr__(self):
         return f"<ClienteDB {self.nome} - {self.phone}>"
 
 
+class TagDB(Base):
+    """
+    Tabella TAG - Etichette dei clienti ("VIP", "Attivo", ...)
+    """
+    __tablename__ = "tag"
+    
+    id = Column(Integer, primary_key=True)
+    nome = Column(String(50), unique=True, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f"<TagDB {self.nome}>"
+
+
+class ClienteTagDB(Base):
+    """
+    Tabella CLIENTE_TAG - Associazione clienti ↔ tag
+    """
+    __tablename__ = "cliente_tag"
+    __table_args__ = (
+        # La PK copre "tag di un cliente", questo indice "clienti con un tag"
+        Index('ix_cliente_tag_tag_cliente', 'tag_id', 'cliente_id'),
+    )
+    
+    cliente_id = Column(Integer, ForeignKey('clienti.id', ondelete='CASCADE'), primary_key=True)
+    tag_id = Column(Integer, ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True)
+    
+    def __repr__(self):
+        return f"<ClienteTagDB {self.cliente_id} - {self.tag_id}>"
+
+
 class FAQDB(Base):
     """
     Tabella FAQ - Domande frequenti e risposte
@@ -100,28 +278,169 @@ class FAQDB(Base):
     settore = Column(String(50), default="")  # "" = tutti, "sport" = solo sport
     priorita = Column(Integer, default=5)  # 1-10
     data_creazione = Column(DateTime, default=datetime.utcnow)
+    # Ultima modifica della riga (backup incrementali)
+    data_modifica = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def __repr__(self):
         return f"<FAQDB {self.domanda_completa[:30]}...>"
 
 
+class CatalogoFAQDB(Base):
+    """
+    Tabella CATALOGO_FAQ - Ultima sincronizzazione del catalogo FAQ
+
+    Impronta del catalogo applicato e stato della tabella faq subito dopo
+    (vedi utils/catalogo_faq.py): se non è cambiato nessuno dei due, la
+    sincronizzazione successiva non confronta le FAQ una per una.
+    """
+    __tablename__ = "catalogo_faq"
+
+    id = Column(Integer, primary_key=True)  # una sola riga (1)
+    impronta = Column(String(64), nullable=False)  # sha256 di voci + elimina
+    stato_faq = Column(String(100), nullable=False)  # "righe:max_id:ultima modifica"
+    sincronizzato_il = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CatalogoFAQDB {self.impronta[:12]} {self.sincronizzato_il}>"
+
+
 class MessaggioDB(Base):
     """
     Tabella MESSAGGI - Log di tutti i messaggi scambiati
     """
     __tablename__ = "messaggi"
     
+    __table_args__ = (
+        # Storico e conteggi per cliente = scansione di un intervallo dell'indice
+        Index('ix_messaggi_cliente_data', 'cliente_id', 'data_messaggio'),
+    )
+    
     id = Column(Integer, primary_key=True, index=True)
+    cliente_id = Column(Integer, ForeignKey('clienti.id', ondelete='SET NULL'), nullable=True)
     cliente_phone = Column(String(20), index=True)
     testo_cliente = Column(Text)
     testo_risposta = Column(Text)
     tipo_risposta = Column(String(20))  # "faq" o "perplexity"
+    # FAQ più simile trovata (anche sotto soglia) e il suo score 0-100
+    faq_id = Column(Integer, ForeignKey('faq.id', ondelete='SET NULL'), nullable=True, index=True)
+    match_score = Column(Integer, nullable=True)
     data_messaggio = Column(DateTime, default=datetime.utcnow)
     
+    # Tempi della pipeline del webhook (UTC) per misurare la latenza
+    ricevuto_il = Column(DateTime, nullable=True)        # arrivo nel webhook
+    abbinato_il = Column(DateTime, nullable=True)        # fine ricerca FAQ
+    llm_completato_il = Column(DateTime, nullable=True)  # risposta Perplexity (solo tipo "perplexity")
+    inviato_il = Column(DateTime, nullable=True)         # risposta inviata a WhatsApp
+    
     def __repr__(self):
         return f"<MessaggioDB {self.id}>"
 
 
+class MessaggioOutboundDB(Base):
+    """
+    Tabella MESSAGGI_OUTBOUND - Registro degli invii delle campagne automatiche
+
+    Una riga per (cliente, campagna, periodo): il benvenuto una volta sola,
+    il reminder una volta a settimana, ecc. I task dello scheduler
+    escludono i clienti che hanno già la riga (vedi utils/outbound.py).
+    """
+    __tablename__ = "messaggi_outbound"
+    __table_args__ = (
+        UniqueConstraint('cliente_id', 'campagna', 'periodo', name='uq_outbound_cliente_campagna_periodo'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    cliente_id = Column(Integer, ForeignKey('clienti.id', ondelete='CASCADE'), nullable=False)
+    campagna = Column(String(50), nullable=False)  # "benvenuto", "reminder", "upsell"
+    periodo = Column(String(20), nullable=False)  # "unico", "2025-W03", "2025-01"
+    stato = Column(String(20), nullable=False, default="in_invio")  # "in_invio", "inviato", "fallito"
+    tentativi = Column(Integer, nullable=False, default=1)
+    creato_il = Column(DateTime, default=datetime.utcnow)
+    inviato_il = Column(DateTime)
+    
+    def __repr__(self):
+        return f"<MessaggioOutboundDB {self.cliente_id} {self.campagna} {self.periodo} {self.stato}>"
+
+
+class StatisticaGiornalieraDB(Base):
+    """
+    Tabella STATISTICHE_GIORNALIERE - Rollup per giorno (ora di Roma) e settore
+    
+    Aggiornata a ogni messaggio da utils/statistiche.py e ricalcolata
+    ogni notte dai dati grezzi. Le analytics leggono da qui.
+    """
+    __tablename__ = "statistiche_giornaliere"
+    __table_args__ = (
+        UniqueConstraint('giorno', 'settore', name='uq_statistiche_giorno_settore'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    giorno = Column(Date, nullable=False)
+    settore = Column(String(50), nullable=False, default="generico")
+    messaggi_totali = Column(Integer, nullable=False, default=0)
+    messaggi_faq = Column(Integer, nullable=False, default=0)
+    messaggi_perplexity = Column(Integer, nullable=False, default=0)
+    nuovi_clienti = Column(Integer, nullable=False, default=0)
+    clienti_attivi = Column(Integer, nullable=False, default=0)  # clienti distinti che hanno scritto
+    
+    def __repr__(self):
+        return f"<StatisticaGiornalieraDB {self.giorno} {self.settore}>"
+
+
+class ImportJobDB(Base):
+    """
+    Tabella IMPORT_JOBS - Import CSV eseguiti in background
+
+    Contatori e righe lette vengono salvati nella stessa transazione di
+    ogni blocco importato: dopo un crash il job riparte dal primo blocco
+    non ancora salvato (vedi utils/importazione.py).
+    """
+    __tablename__ = "import_jobs"
+
+    id = Column(String(32), primary_key=True)  # uuid4 esadecimale
+    tipo = Column(String(20), nullable=False)  # "clienti" o "faq"
+    file = Column(String(500), nullable=False)  # CSV salvato in Config.IMPORT_DIR
+    nome_file = Column(String(255))  # nome originale del file caricato
+    stato = Column(String(20), default="in_attesa", index=True)  # "in_attesa", "in_corso", "completato", "fallito"
+    dimensione_file = Column(Integer, default=0)  # byte
+    byte_letti = Column(Integer, default=0)
+    righe = Column(Integer, default=0)  # righe già salvate = punto di ripresa
+    aggiunti = Column(Integer, default=0)
+    duplicati = Column(Integer, default=0)
+    numero_errori = Column(Integer, default=0)
+    errori = Column(Text, default="[]")  # JSON, solo i primi errori
+    messaggio_errore = Column(Text)  # errore che ha fermato il job
+    tentativi = Column(Integer, default=0)
+    creato_il = Column(DateTime, default=datetime.utcnow)
+    ripreso_il = Column(DateTime)  # inizio dell'esecuzione corrente
+    righe_ripresa = Column(Integer, default=0)  # righe già salvate a ripreso_il
+    aggiornato_il = Column(DateTime, default=datetime.utcnow)  # ultimo blocco (battito)
+    completato_il = Column(DateTime)
+
+    def __repr__(self):
+        return f"<ImportJobDB {self.id} {self.tipo} {self.stato}>"
+
+
+class SchedulerLeaseDB(Base):
+    """
+    Tabella SCHEDULER_LEASE - Chi esegue i task programmati
+
+    Con più worker/processi solo chi tiene il lease (rinnovato ogni
+    pochi secondi) avvia i task; se smette di rinnovarlo, alla scadenza
+    lo prende un altro processo (vedi utils/scheduler.py).
+    """
+    __tablename__ = "scheduler_lease"
+
+    nome = Column(String(50), primary_key=True)  # "scheduler"
+    proprietario = Column(String(100), default="")  # host:pid:casuale del leader
+    scade_il = Column(DateTime, nullable=False)
+    acquisito_il = Column(DateTime)  # inizio della leadership corrente
+    rinnovato_il = Column(DateTime)
+
+    def __repr__(self):
+        return f"<SchedulerLeaseDB {self.nome} {self.proprietario}>"
+
+
 # ============================================================================
 # INIZIALIZZAZIONE DATABASE
 # ============================================================================
@@ -130,9 +449,23 @@ def init_db():
     """Inizializza il database creando tutte le tabelle"""
     try:
         Base.metadata.create_all(bind=engine)
+        aggiorna_schema()
+        
+        # Indici full-text per la ricerca della dashboard
+        from utils.ricerca import init_ricerca_fulltext
+        init_ricerca_fulltext()
+        
+        # Rollup delle analytics: storico ricostruito se la tabella è vuota
+        from utils.statistiche import popola_statistiche_se_vuote
+        popola_statistiche_se_vuote()
         
         print("✅ Database creato/connesso con successo")
-        print(f"   Tabelle: users, clienti, faq, messaggi")
+        
+        profilo = verifica_profilo_sqlite(engine)
+        if profilo:
+            print(f"   Profilo SQLite: journal_mode={profilo['journal_mode']}, "
+                  f"busy_timeout={profilo['busy_timeout']}ms")
+        print(f"   Tabelle: users, clienti, tag, cliente_tag, faq, messaggi, statistiche_giornaliere, messaggi_outbound, import_jobs, scheduler_lease")
         
         # Crea utente admin
         crea_utente_predefinito()
@@ -142,6 +475,78 @@ def init_db():
         raise
 
 
+def prepara_database(tentativi=5):
+    """
+    init_db() all'avvio di ogni processo (app.py, anche sotto gunicorn).
+    
+    Su un database esistente crea le tabelle nuove (scheduler_lease, ...),
+    le colonne e gli indici mancanti e gli indici full-text: senza, lo
+    scheduler e le query del webhook falliscono dopo un aggiornamento.
+    I worker della stessa macchina lo fanno uno alla volta (lock su file);
+    se processi di macchine diverse si scontrano sugli stessi ALTER TABLE,
+    chi perde riprova e trova lo schema già allineato.
+    """
+    percorso_lock = os.path.join(
+        tempfile.gettempdir(),
+        f"whatsapp_bot_schema_{hashlib.sha1(Config.DATABASE_URL.encode()).hexdigest()[:12]}.lock"
+    )
+    
+    with open(percorso_lock, "w") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            for tentativo in range(1, tentativi + 1):
+                try:
+                    init_db()
+                    return
+                except Exception:
+                    if tentativo == tentativi:
+                        raise
+                    print(f"🔁 Aggiornamento schema: nuovo tentativo ({tentativo + 1}/{tentativi})")
+                    time.sleep(1)
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def aggiorna_schema():
+    """
+    Allinea le tabelle esistenti ai modelli.
+    
+    create_all() crea solo le tabelle mancanti: qui aggiungiamo le
+    colonne e gli indici introdotti dopo la creazione del database.
+    Le colonne nuove sono sempre nullable, i dati esistenti vanno
+    riempiti con gli script scripts/migra_*.py.
+    """
+    inspector = inspect(engine)
+    
+    with engine.begin() as conn:
+        for tabella in Base.metadata.sorted_tables:
+            if not inspector.has_table(tabella.name):
+                continue
+            
+            colonne_esistenti = {c['name'] for c in inspector.get_columns(tabella.name)}
+            for colonna in tabella.columns:
+                if colonna.name in colonne_esistenti:
+                    continue
+                
+                tipo = colonna.type.compile(dialect=engine.dialect)
+                ddl = f"ALTER TABLE {tabella.name} ADD COLUMN {colonna.name} {tipo}"
+                for fk in colonna.foreign_keys:
+                    ddl += f" REFERENCES {fk.column.table.name}({fk.column.name})"
+                    if fk.ondelete:
+                        ddl += f" ON DELETE {fk.ondelete}"
+                
+                conn.exec_driver_sql(ddl)
+                print(f"   ➕ Colonna aggiunta: {tabella.name}.{colonna.name}")
+            
+            indici_esistenti = {i['name'] for i in inspector.get_indexes(tabella.name)}
+            for indice in tabella.indexes:
+                if indice.name not in indici_esistenti:
+                    indice.create(conn)
+                    print(f"   ➕ Indice creato: {indice.name}")
+
+
 def crea_utente_predefinito():
     """
     Crea l'utente admin predefinito (se non esiste)
@@ -195,5 +600,100 @@ def get_db_session():
         db = get_db_session()
         clienti = db.query(ClienteDB).all()
         db.close()
+    
+    Dentro una richiesta Flask la sessione viene registrata, così il
+    teardown può segnalarla e chiuderla se qualcuno dimentica close().
+    """
+    db = SessionLocal()
+    
+    if Config.DB_LEAK_DETECTION and has_app_context():
+        g.setdefault('_sessioni_db', []).append(db)
+    
+    return db
+
+
+def get_read_session():
+    """
+    Crea una sessione di sola lettura sull'engine di lettura.
+    
+    Da usare per analytics, report ed export: se è configurato
+    DATABASE_READ_URL le query pesanti vanno sulla replica e non
+    rallentano webhook e CRUD, che restano sul primario.
+    Si usa e si chiude come get_db_session().
+    """
+    db = SessionLettura()
+    
+    if Config.DB_LEAK_DETECTION and has_app_context():
+        g.setdefault('_sessioni_db', []).append(db)
+    
+    return db
+
+
+# ============================================================================
+# SESSIONE PER RICHIESTA
+# ============================================================================
+
+# Sessioni trovate ancora aperte al teardown dall'avvio del processo
+_sessioni_non_chiuse = 0
+
+
+def get_request_db():
     """
-    return SessionLocal()
+    Ritorna la sessione database della richiesta corrente.
+    
+    La sessione viene creata al primo uso e chiusa automaticamente
+    al teardown dell'app context, anche se la route esce in anticipo
+    o solleva un'eccezione.
+    
+    Uso (in una route):
+        db = get_request_db()
+        clienti = db.query(ClienteDB).all()
+    """
+    if '_request_db' not in g:
+        g._request_db = SessionLocal()
+    return g._request_db
+
+
+def chiudi_sessioni_richiesta(exception=None):
+    """
+    Teardown: chiude la sessione della richiesta e fa da leak detector
+    per le sessioni aperte con get_db_session() e mai chiuse.
+    """
+    global _sessioni_non_chiuse
+    
+    db = g.pop('_request_db', None)
+    if db is not None:
+        if exception is not None:
+            db.rollback()
+        db.close()
+    
+    for sessione in g.pop('_sessioni_db', []):
+        if sessione.in_transaction():
+            _sessioni_non_chiuse += 1
+            endpoint = request.endpoint if has_request_context() else None
+            print(f"⚠️  Sessione DB non chiusa a fine richiesta (endpoint: {endpoint})")
+            sessione.rollback()
+        sessione.close()
+
+
+def init_sessioni_app(app):
+    """Collega la gestione delle sessioni al ciclo di vita dell'app Flask"""
+    app.teardown_appcontext(chiudi_sessioni_richiesta)
+
+
+def _stato_pool_engine(motore):
+    pool = motore.pool
+    return {
+        "pool": pool.status(),
+        "dimensione": pool.size() if hasattr(pool, "size") else None,
+        "in_uso": pool.checkedout() if hasattr(pool, "checkedout") else None,
+        "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+    }
+
+
+def stato_pool():
+    """Stato del pool connessioni e contatore delle sessioni non chiuse"""
+    stato = _stato_pool_engine(engine)
+    stato["sessioni_non_chiuse"] = _sessioni_non_chiuse
+    stato["replica"] = _stato_pool_engine(read_engine) if read_engine is not engine else None
+    return stato
@@ -3,7 +3,7 @@ Routes per autenticazione e gestione utenti
 """
 
 from flask import Blueprint, request, jsonify, session, redirect, url_for, render_template
-from database import get_db_session, UserDB
+from database import get_request_db, UserDB
 from datetime import datetime, timedelta
 from functools import wraps
 
@@ -34,7 +34,7 @@ def login():
     Ritorna: token sesione
     """
     
-    db = get_db_session()
+    db = get_request_db()
     
     data = request.json
     username = data.get('username', '').strip()
@@ -48,17 +48,14 @@ def login():
     user = db.query(UserDB).filter(UserDB.username == username).first()
     
     if not user:
-        db.close()
         return jsonify({"error": "Credenziali non valide"}), 401
     
     # Verifica che sia attivo
     if not user.attivo:
-        db.close()
         return jsonify({"error": "Utente disabilitato"}), 401
     
     # Verifica password
     if not user.check_password(password):
-        db.close()
         return jsonify({"error": "Credenziali non valide"}), 401
     
     # Aggiorna ultimo login
@@ -71,8 +68,6 @@ def login():
     session['ruolo'] = user.ruolo
     session.permanent = True  # La sessione persiste anche dopo chiusura browser
     
-    db.close()
-    
     return jsonify({
         "success": True,
         "message": f"✅ Benvenuto {user.nome_completo}!",
@@ -104,17 +99,14 @@ def logout():
 def get_profile():
     """Ritorna profilo dell'utente loggato"""
     
-    db = get_db_session()
+    db = get_request_db()
     user_id = session.get('user_id')
     
     user = db.query(UserDB).filter(UserDB.id == user_id).first()
     
     if not user:
-        db.close()
         return jsonify({"error": "Utente non trovato"}), 404
     
-    db.close()
-    
     return jsonify({
         "success": True,
         "user": {
@@ -133,7 +125,7 @@ def get_profile():
 def change_password():
     """Cambia la password dell'utente"""
     
-    db = get_db_session()
+    db = get_request_db()
     user_id = session.get('user_id')
     
     data = request.json
@@ -151,18 +143,15 @@ def change_password():
     user = db.query(UserDB).filter(UserDB.id == user_id).first()
     
     if not user:
-        db.close()
         return jsonify({"error": "Utente non trovato"}), 404
     
     # Verifica vecchia password
     if not user.check_password(old_password):
-        db.close()
         return jsonify({"error": "Password attuale non corretta"}), 401
     
     # Imposta nuova password
     user.set_password(new_password)
     db.commit()
-    db.close()
     
     return jsonify({
         "success": True,
@@ -4,7 +4,14 @@ Gestisce tutte le operazioni da dashboard
 """
 
 from flask import Blueprint, request, jsonify, session
-from database import get_db_session, ClienteDB, FAQDB
+from database import get_request_db, get_read_session, ClienteDB, FAQDB, MessaggioDB, MessaggioOutboundDB
+from utils.tag import sincronizza_tag_cliente, rimuovi_tag_cliente, filtra_per_tag
+from utils.ricerca import applica_ricerca
+from utils.paginazione import pagina_keyset, conta_con_cache
+from utils.statistiche import registra_nuovi_clienti
+from utils.cache import in_cache, invalida_cache
+from utils.telefoni import normalizza_telefono
+from config import Config
 from datetime import datetime
 from functools import wraps
 
@@ -19,6 +26,67 @@ def require_login(f):
         return f(*args, **kwargs)
     return decorated
 
+@dashboard_api_bp.after_request
+def invalida_dopo_scrittura(response):
+    """Ogni modifica riuscita (POST/PUT/DELETE) rende vecchie le statistiche in cache"""
+    if request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400:
+        invalida_cache()
+    return response
+
+# Colonne ammesse per la paginazione a cursore (?ordina=...)
+ORDINAMENTI_CLIENTI = {
+    "id": ClienteDB.id,
+    "data_creazione": ClienteDB.data_creazione,
+    "ultima_interazione": ClienteDB.ultima_interazione,
+}
+ORDINAMENTI_FAQ = {
+    "id": FAQDB.id,
+    "priorita": FAQDB.priorita,
+    "data_creazione": FAQDB.data_creazione,
+}
+
+
+def pagina_risultati(query, modello, ordinamenti, chiave_conteggio, per_rilevanza=False):
+    """
+    Applica la paginazione richiesta dai parametri della query string.
+    
+    - Senza 'cursore': paginazione classica (pagina/limite + totale esatto),
+      usata da templates/dashboard.html
+    - Con 'cursore' (anche vuoto = prima pagina): keyset su (ordina, id),
+      risposta con 'cursore_successivo'; 'totale' solo se totale=1,
+      approssimato e in cache
+    - per_rilevanza: query già ordinata dalla ricerca full-text; il cursore
+      ordinerebbe per (ordina, id) perdendo la rilevanza, quindi non è ammesso
+    
+    Ritorna (righe, campi_paginazione) oppure solleva ValueError.
+    """
+    limite = request.args.get('limite', 20, type=int)
+    cursore = request.args.get('cursore', type=str)
+    
+    if cursore is not None and per_rilevanza:
+        raise ValueError("Con 'ricerca' usare 'pagina' invece di 'cursore'")
+    
+    if cursore is None:
+        pagina = request.args.get('pagina', 1, type=int)
+        totale = query.count()
+        righe = query.offset((pagina - 1) * limite).limit(limite).all()
+        return righe, {"totale": totale, "pagina": pagina, "limite": limite}
+    
+    ordina = request.args.get('ordina', 'id', type=str)
+    if ordina not in ordinamenti:
+        raise ValueError(f"Ordinamento non valido: {ordina}")
+    discendente = request.args.get('direzione', 'desc', type=str) != 'asc'
+    
+    righe, cursore_successivo = pagina_keyset(
+        query, ordinamenti[ordina], modello.id, cursore, limite, discendente
+    )
+    campi = {"limite": limite, "cursore_successivo": cursore_successivo}
+    
+    if request.args.get('totale') == '1':
+        campi["totale"] = conta_con_cache(chiave_conteggio, query)
+    
+    return righe, campi
+
 # ============================================================================
 # GESTIONE CLIENTI
 # ============================================================================
@@ -28,13 +96,12 @@ def require_login(f):
 def get_clienti():
     """Ritorna lista di tutti i clienti con filtri"""
     
-    db = get_db_session()
+    db = get_request_db()
     
-    # Parametri query
-    pagina = request.args.get('pagina', 1, type=int)
-    limite = request.args.get('limite', 20, type=int)
+    # Parametri query (paginazione: vedi pagina_risultati)
     settore = request.args.get('settore', '', type=str)
     ricerca = request.args.get('ricerca', '', type=str)
+    tag = request.args.get('tag', '', type=str)  # "VIP" o "VIP,Attivo" (tutti)
     
     query = db.query(ClienteDB)
     
@@ -42,22 +109,25 @@ def get_clienti():
     if settore:
         query = query.filter(ClienteDB.settore == settore)
     
+    if tag:
+        query = filtra_per_tag(query, tag.replace(',', '|'))
+    
     if ricerca:
-        query = query.filter(
-            (ClienteDB.nome.ilike(f"%{ricerca}%")) |
-            (ClienteDB.phone.ilike(f"%{ricerca}%")) |
-            (ClienteDB.email.ilike(f"%{ricerca}%"))
-        )
+        # Full-text con prefissi, risultati ordinati per rilevanza
+        query = applica_ricerca(query, "clienti", ricerca)
     
     # Paginazione
-    totale = query.count()
-    clienti = query.offset((pagina - 1) * limite).limit(limite).all()
+    try:
+        clienti, paginazione = pagina_risultati(
+            query, ClienteDB, ORDINAMENTI_CLIENTI, ("clienti", settore, tag, ricerca),
+            per_rilevanza=bool(ricerca)
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     return jsonify({
         "success": True,
-        "totale": totale,
-        "pagina": pagina,
-        "limite": limite,
+        **paginazione,
         "clienti": [
             {
                 "id": c.id,
@@ -81,7 +151,7 @@ def get_clienti():
 def crea_cliente():
     """Crea nuovo cliente"""
     
-    db = get_db_session()
+    db = get_request_db()
     
     data = request.json
     
@@ -89,9 +159,9 @@ def crea_cliente():
     if not data.get('phone'):
         return jsonify({"error": "Phone obbligatorio"}), 400
     
-    phone = data.get('phone')
-    if not phone.startswith('+'):
-        phone = '+' + phone
+    phone = normalizza_telefono(data.get('phone'))
+    if not phone:
+        return jsonify({"error": "Numero di telefono non valido"}), 400
     
     # Controlla duplicati
     esistente = db.query(ClienteDB).filter(ClienteDB.phone == phone).first()
@@ -105,7 +175,6 @@ def crea_cliente():
         azienda=data.get('azienda', ''),
         settore=data.get('settore', 'generico'),
         email=data.get('email', ''),
-        etichette=data.get('etichette', ''),
         note=data.get('note', ''),
         data_creazione=datetime.utcnow(),
         ultima_interazione=datetime.utcnow(),
@@ -114,6 +183,8 @@ def crea_cliente():
     )
     
     db.add(cliente)
+    sincronizza_tag_cliente(db, cliente, data.get('etichette', ''))
+    registra_nuovi_clienti(db, [cliente])
     db.commit()
     
     return jsonify({
@@ -127,7 +198,7 @@ def crea_cliente():
 def get_cliente(cliente_id):
     """Ritorna dettagli cliente"""
     
-    db = get_db_session()
+    db = get_request_db()
     cliente = db.query(ClienteDB).filter(ClienteDB.id == cliente_id).first()
     
     if not cliente:
@@ -151,12 +222,47 @@ def get_cliente(cliente_id):
         }
     })
 
+@dashboard_api_bp.route('/clienti/<int:cliente_id>/messaggi', methods=['GET'])
+@require_login
+def get_messaggi_cliente(cliente_id):
+    """Ritorna lo storico messaggi di un cliente (più recenti prima)"""
+    
+    db = get_request_db()
+    
+    pagina = request.args.get('pagina', 1, type=int)
+    limite = request.args.get('limite', 20, type=int)
+    
+    # Usa l'indice (cliente_id, data_messaggio)
+    query = db.query(MessaggioDB).filter(MessaggioDB.cliente_id == cliente_id)
+    
+    totale = query.count()
+    messaggi = query.order_by(
+        MessaggioDB.data_messaggio.desc()
+    ).offset((pagina - 1) * limite).limit(limite).all()
+    
+    return jsonify({
+        "success": True,
+        "totale": totale,
+        "pagina": pagina,
+        "limite": limite,
+        "messaggi": [
+            {
+                "id": m.id,
+                "testo_cliente": m.testo_cliente,
+                "testo_risposta": m.testo_risposta,
+                "tipo_risposta": m.tipo_risposta,
+                "data_messaggio": m.data_messaggio.isoformat() if m.data_messaggio else None,
+            }
+            for m in messaggi
+        ]
+    })
+
 @dashboard_api_bp.route('/clienti/<int:cliente_id>', methods=['PUT'])
 @require_login
 def aggiorna_cliente(cliente_id):
     """Aggiorna cliente"""
     
-    db = get_db_session()
+    db = get_request_db()
     cliente = db.query(ClienteDB).filter(ClienteDB.id == cliente_id).first()
     
     if not cliente:
@@ -174,7 +280,7 @@ def aggiorna_cliente(cliente_id):
     if 'email' in data:
         cliente.email = data['email']
     if 'etichette' in data:
-        cliente.etichette = data['etichette']
+        sincronizza_tag_cliente(db, cliente, data['etichette'])
     if 'note' in data:
         cliente.note = data['note']
     if 'stato' in data:
@@ -192,13 +298,24 @@ def aggiorna_cliente(cliente_id):
 def elimina_cliente(cliente_id):
     """Elimina cliente"""
     
-    db = get_db_session()
+    db = get_request_db()
     cliente = db.query(ClienteDB).filter(ClienteDB.id == cliente_id).first()
     
     if not cliente:
         return jsonify({"error": "Cliente non trovato"}), 404
     
     nome = cliente.nome
+    rimuovi_tag_cliente(db, cliente.id)
+    # Come ondelete='SET NULL', che SQLite non applica: un id riusato da un
+    # nuovo cliente non deve ereditare lo storico di questo
+    db.query(MessaggioDB).filter(
+        MessaggioDB.cliente_id == cliente.id
+    ).update({MessaggioDB.cliente_id: None}, synchronize_session=False)
+    # Come ondelete='CASCADE': altrimenti il nuovo cliente risulterebbe già
+    # servito dalle campagne (niente benvenuto)
+    db.query(MessaggioOutboundDB).filter(
+        MessaggioOutboundDB.cliente_id == cliente.id
+    ).delete(synchronize_session=False)
     db.delete(cliente)
     db.commit()
     
@@ -216,10 +333,8 @@ def elimina_cliente(cliente_id):
 def get_faq():
     """Ritorna lista FAQ con filtri"""
     
-    db = get_db_session()
+    db = get_request_db()
     
-    pagina = request.args.get('pagina', 1, type=int)
-    limite = request.args.get('limite', 20, type=int)
     settore = request.args.get('settore', '', type=str)
     ricerca = request.args.get('ricerca', '', type=str)
     
@@ -229,19 +344,19 @@ def get_faq():
         query = query.filter(FAQDB.settore == settore)
     
     if ricerca:
-        query = query.filter(
-            (FAQDB.domanda_completa.ilike(f"%{ricerca}%")) |
-            (FAQDB.domanda_keywords.ilike(f"%{ricerca}%"))
-        )
+        query = applica_ricerca(query, "faq", ricerca)
     
-    totale = query.count()
-    faq_list = query.offset((pagina - 1) * limite).limit(limite).all()
+    try:
+        faq_list, paginazione = pagina_risultati(
+            query, FAQDB, ORDINAMENTI_FAQ, ("faq", settore, ricerca),
+            per_rilevanza=bool(ricerca)
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     return jsonify({
         "success": True,
-        "totale": totale,
-        "pagina": pagina,
-        "limite": limite,
+        **paginazione,
         "faq": [
             {
                 "id": f.id,
@@ -261,7 +376,7 @@ def get_faq():
 def crea_faq():
     """Crea nuova FAQ"""
     
-    db = get_db_session()
+    db = get_request_db()
     data = request.json
     
     if not data.get('domanda_completa') or not data.get('risposta'):
@@ -290,7 +405,7 @@ def crea_faq():
 def get_faq_detail(faq_id):
     """Ritorna dettagli FAQ"""
     
-    db = get_db_session()
+    db = get_request_db()
     faq = db.query(FAQDB).filter(FAQDB.id == faq_id).first()
     
     if not faq:
@@ -314,7 +429,7 @@ def get_faq_detail(faq_id):
 def aggiorna_faq(faq_id):
     """Aggiorna FAQ"""
     
-    db = get_db_session()
+    db = get_request_db()
     faq = db.query(FAQDB).filter(FAQDB.id == faq_id).first()
     
     if not faq:
@@ -345,13 +460,18 @@ def aggiorna_faq(faq_id):
 def elimina_faq(faq_id):
     """Elimina FAQ"""
     
-    db = get_db_session()
+    db = get_request_db()
     faq = db.query(FAQDB).filter(FAQDB.id == faq_id).first()
     
     if not faq:
         return jsonify({"error": "FAQ non trovata"}), 404
     
     domanda = faq.domanda_completa
+    # Come ondelete='SET NULL', che SQLite non applica: una FAQ nuova con
+    # lo stesso id non deve ereditare hit e score di questa
+    db.query(MessaggioDB).filter(
+        MessaggioDB.faq_id == faq.id
+    ).update({MessaggioDB.faq_id: None}, synchronize_session=False)
     db.delete(faq)
     db.commit()
     
@@ -368,22 +488,30 @@ def elimina_faq(faq_id):
 @require_login
 def get_stats():
     """Ritorna statistiche dashboard"""
-    
-    db = get_db_session()
-    
-    tot_clienti = db.query(ClienteDB).count()
-    tot_faq = db.query(FAQDB).count()
-    clienti_attivi = db.query(ClienteDB).filter(ClienteDB.stato == 'attivo').count()
-    
-    # Media messaggi per cliente
-    media_msg = db.query(ClienteDB).filter(ClienteDB.numero_messaggi > 0).count()
-    
     return jsonify({
         "success": True,
-        "stats": {
+        "stats": in_cache("dashboard_stats", Config.CACHE_TTL_STATUS, calcola_stats)
+    })
+
+
+def calcola_stats():
+    """Conteggi per /stats (sessione propria: può girare nel ricalcolo in background)"""
+    
+    db = get_read_session()
+    
+    try:
+        tot_clienti = db.query(ClienteDB).count()
+        tot_faq = db.query(FAQDB).count()
+        clienti_attivi = db.query(ClienteDB).filter(ClienteDB.stato == 'attivo').count()
+        
+        # Media messaggi per cliente
+        media_msg = db.query(ClienteDB).filter(ClienteDB.numero_messaggi > 0).count()
+        
+        return {
             "clienti_totali": tot_clienti,
             "clienti_attivi": clienti_attivi,
             "faq_totali": tot_faq,
             "clienti_con_messaggi": media_msg,
         }
-    })
+    finally:
+        db.close()
@@ -15,6 +15,11 @@ from database import get_db_session, ClienteDB, FAQDB, MessaggioDB
 # Importa Perplexity
 from utils.perplexity import chiama_perplexity
 
+# Rollup statistiche giornaliere
+from utils.statistiche import registra_messaggio, registra_nuovi_clienti, oggi_locale, inizio_giorno_utc
+from utils.cache import invalida_cache
+from utils.telefoni import normalizza_telefono
+
 # Importa config
 from config import Config
 
@@ -187,6 +192,7 @@ def webhook_handle_messages():
                 
                 # Estrai il valore (dati del messaggio)
                 value = change.get("value", {})
+                ricevuto_il = datetime.utcnow()
                 
                 # Ottieni info del cliente
                 contacts = value.get("contacts", [{}])
@@ -197,11 +203,13 @@ def webhook_handle_messages():
                     continue
                 
                 # Estrai i dati
-                numero_cliente = contacts[0].get("wa_id", "")
+                wa_id = contacts[0].get("wa_id", "")
 
-                # Meta manda numero SENZA +, aggiungiamo noi
-                if numero_cliente and not numero_cliente.startswith("+"):
-                    numero_cliente = "+" + numero_cliente
+                # Meta manda il numero internazionale SENZA +: E.164 come nel resto del DB
+                numero_cliente = normalizza_telefono(wa_id, internazionale=True)
+                if not numero_cliente:
+                    print(f"⚠️  wa_id non riconosciuto come E.164: {wa_id}")
+                    numero_cliente = "+" + wa_id.lstrip("+")
 
                 nome_cliente = contacts[0].get("profile", {}).get("name", "Sconosciuto")
                 messaggio_testo = messages[0].get("text", {}).get("body", "").strip()
@@ -220,6 +228,7 @@ def webhook_handle_messages():
                 cliente = db.query(ClienteDB).filter(
                     ClienteDB.phone == numero_cliente
                 ).first()
+                nuovo_cliente = cliente is None
                 
                 if not cliente:
                     # Nuovo cliente!
@@ -233,6 +242,7 @@ def webhook_handle_messages():
                         numero_messaggi=1
                     )
                     db.add(cliente)
+                    registra_nuovi_clienti(db, [cliente])
                 else:
                     # Cliente esistente - aggiorna dati
                     print(f"\n👋 Cliente esistente")
@@ -241,8 +251,16 @@ def webhook_handle_messages():
                 
                 db.commit()
                 
+                # Primo messaggio di oggi? (indice cliente_id, data_messaggio)
+                primo_del_giorno = db.query(MessaggioDB.id).filter(
+                    MessaggioDB.cliente_id == cliente.id,
+                    MessaggioDB.data_messaggio >= inizio_giorno_utc(oggi_locale())
+                ).first() is None
+                
                 # 2. PROVA A TROVARE FAQ CHE CORRISPONDA
                 faq_trovata, score = trova_faq_match(messaggio_testo, cliente.settore)
+                abbinato_il = datetime.utcnow()
+                llm_completato_il = None
                 
                 print(f"\n🔍 Risultato ricerca FAQ:")
                 
@@ -258,22 +276,39 @@ def webhook_handle_messages():
                     contesto = f"Cliente: {cliente.nome}, Settore: {cliente.settore}, Azienda: {cliente.azienda}"
                     risposta = chiama_perplexity(messaggio_testo, contesto)
                     tipo_risposta = "perplexity"
+                    llm_completato_il = datetime.utcnow()
                 
                 # 3. INVIA RISPOSTA WHATSAPP
                 print(f"\n📤 Invio risposta...")
                 invia_messaggio_whatsapp(numero_cliente, risposta)
+                inviato_il = datetime.utcnow()
                 
                 # 4. SALVA NEL DATABASE PER LOG
                 nuovo_messaggio = MessaggioDB(
+                    cliente_id=cliente.id,
                     cliente_phone=numero_cliente,
                     testo_cliente=messaggio_testo,
                     testo_risposta=risposta,
                     tipo_risposta=tipo_risposta,
-                    data_messaggio=datetime.utcnow()
+                    faq_id=faq_trovata.id if faq_trovata else None,
+                    match_score=score,
+                    data_messaggio=datetime.utcnow(),
+                    ricevuto_il=ricevuto_il,
+                    abbinato_il=abbinato_il,
+                    llm_completato_il=llm_completato_il,
+                    inviato_il=inviato_il
                 )
                 db.add(nuovo_messaggio)
+                registra_messaggio(
+                    db, cliente.settore, tipo_risposta,
+                    nuovo_messaggio.data_messaggio, primo_del_giorno
+                )
                 db.commit()
                 db.close()
+                # Un cliente nuovo cambia elenchi e segmenti; i contatori dei
+                # messaggi invece si aggiornano alla scadenza del TTL
+                if nuovo_cliente:
+                    invalida_cache()
                 
                 print(f"\n✅ MESSAGGIO PROCESSATO CON SUCCESSO")
         
@@ -10,6 +10,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from database import get_db_session, ClienteDB
+from utils.telefoni import normalizza_telefono
 from datetime import datetime
 
 def aggiungi_cliente(phone, nome, azienda="", settore="generico", email=""):
@@ -17,13 +18,19 @@ def aggiungi_cliente(phone, nome, azienda="", settore="generico", email=""):
     Aggiunge un cliente al database
     
     Parametri:
-    - phone: numero WhatsApp (es: +393331234567)
+    - phone: numero WhatsApp (es: +393331234567, 333 1234567)
     - nome: nome cliente
     - azienda: azienda (opzionale)
     - settore: finanza/sport/coworking/generico
     - email: email (opzionale)
     """
     
+    normalizzato = normalizza_telefono(phone)
+    if not normalizzato:
+        print(f"❌ Numero non valido: {phone}")
+        return
+    phone = normalizzato
+    
     db = get_db_session()
     
     # Controlla se esiste già
@@ -9,12 +9,14 @@ sys.path.insert(0, '.')
 from dotenv import load_dotenv
 load_dotenv()
 
-from database import get_db_session, FAQDB
-from datetime import datetime
+from config import Config
+from utils.catalogo_faq import carica_catalogo, voce_faq, sincronizza_catalogo
+
+PROVA = "faq/prova.json"
 
 def aggiungi_faq(domanda_keywords, domanda_completa, risposta, settore="", priorita=5):
     """
-    Aggiunge una FAQ al database
+    Aggiunge una FAQ al database (o la aggiorna se la domanda esiste già)
     
     Parametri:
     - domanda_keywords: parole chiave separate da virgola (es: "orari,apertura,quando")
@@ -24,116 +26,49 @@ def aggiungi_faq(domanda_keywords, domanda_completa, risposta, settore="", prior
     - priorita: 1-10, più alto = trova prima
     """
     
-    db = get_db_session()
-    
-    nuova_faq = FAQDB(
-        domanda_keywords=domanda_keywords,
-        domanda_completa=domanda_completa,
-        risposta=risposta,
-        settore=settore,
-        priorita=priorita,
-        data_creazione=datetime.utcnow()
-    )
+    voce = voce_faq({
+        "domanda_keywords": domanda_keywords,
+        "domanda_completa": domanda_completa,
+        "risposta": risposta,
+        "settore": settore,
+        "priorita": priorita,
+    })
+    risultato = sincronizza_catalogo([voce], elimina=False)
     
-    db.add(nuova_faq)
-    db.commit()
-    
-    print(f"✅ FAQ aggiunta: {domanda_completa}")
-    db.close()
+    if risultato["aggiunte"]:
+        print(f"✅ FAQ aggiunta: {domanda_completa}")
+    elif risultato["modificate"]:
+        print(f"✏️  FAQ aggiornata: {domanda_completa}")
+    else:
+        print(f"⏭️  FAQ già presente: {domanda_completa}")
 
 def aggiungi_faq_di_prova():
-    """Aggiunge FAQ di test"""
+    """
+    Aggiunge le FAQ di test di faq/prova.json
+    
+    Le FAQ vere stanno solo nel catalogo (Config.FAQ_CATALOGO): le domande
+    che ci sono anche lì vengono saltate, altrimenti questo script e la
+    sincronizzazione si riscriverebbero a vicenda. Una sincronizzazione
+    completa del catalogo elimina le FAQ di prova.
+    """
     
     print("\n" + "="*70)
     print("➕ AGGIUNTA FAQ DI PROVA")
     print("="*70 + "\n")
     
-    faq_list = [
-        {
-            "domanda_keywords": "orari,apertura,quando,disponibilità,aperto,orario",
-            "domanda_completa": "A che ora siete aperti?",
-            "risposta": """📍 ORARI TRIESTE:
-🕐 Lunedì-Venerdì: 9:00-18:00
-🕐 Sabato: 9:00-13:00
-🕐 Domenica: Chiuso
-
-Per domande: +39 040 123456""",
-            "settore": "",
-            "priorita": 10
-        },
-        {
-            "domanda_keywords": "prezzi,costo,quanto,tariffa,listino,price,tariffe",
-            "domanda_completa": "Quanto costano i vostri servizi?",
-            "risposta": """💰 TARIFFE:
-
-💼 COWORKING:
-   • Giornaliero: €20
-   • Mensile: €200-400
-   
-🏓 PADEL:
-   • Singola ora: €25
-   • Abbonamento 10 ore: €200
-
-📞 Contattaci per offerta personalizzata!""",
-            "settore": "",
-            "priorita": 9
-        },
-        {
-            "domanda_keywords": "contatto,numero,telefono,mail,email,where,dove,indirizzo,address",
-            "domanda_completa": "Come posso contattarvi?",
-            "risposta": """📞 CONTATTI:
-
-☎️ Telefono: +39 040 123456
-📧 Email: info@trieste-facility.it
-📍 Via Mezzo, 15 - Trieste
-🌐 www.trieste-facility.it
-📱 WhatsApp: questo numero!""",
-            "settore": "",
-            "priorita": 9
-        },
-        {
-            "domanda_keywords": "disponibilità,libero,prenotare,booking,slot,prenoto,campo libero",
-            "domanda_completa": "Come prenoto un campo padel?",
-            "risposta": """🏓 PRENOTAZIONE PADEL:
-
-1️⃣ Scrivi qui su WhatsApp
-2️⃣ Dimmi giorno e ora preferiti
-3️⃣ Noi confermiamo disponibilità
-4️⃣ Paghi in loco (contanti/carta)
-
-⏰ Orari disponibili: 
-   Lun-Dom 9:00-20:00
-
-Prenotare con almeno 2 ore di anticipo!""",
-            "settore": "sport",
-            "priorita": 9
-        },
-        {
-            "domanda_keywords": "spazi,sale,riunioni,meeting,conferenza,workshop,evento",
-            "domanda_completa": "Avete spazi per riunioni?",
-            "risposta": """📋 SPAZI PER RIUNIONI:
-
-✅ Sala Trieste (20 persone)
-✅ Sala Meeting (10 persone)
-✅ Sala Padel (area lounge)
-
-SERVIZI INCLUSI:
-   • WiFi veloce
-   • Proiettore
-   • Tavoli/sedie
-   • Parcheggio gratuito
-
-📞 Contatta per preventivo: +39 040 123456""",
-            "settore": "coworking",
-            "priorita": 8
-        }
-    ]
+    nel_catalogo = {valori[0] for valori in carica_catalogo(Config.FAQ_CATALOGO)}
+    voci = []
+    for valori in carica_catalogo(PROVA):
+        if valori[0] in nel_catalogo:
+            print(f"⏭️  Nel catalogo, saltata: {valori[0]}")
+        else:
+            voci.append(valori)
     
-    for faq in faq_list:
-        aggiungi_faq(**faq)
+    risultato = sincronizza_catalogo(voci, elimina=False)
     
     print("\n" + "="*70)
-    print("✅ FAQ aggiunte con successo!")
+    print(f"✅ FAQ aggiunte: {risultato['aggiunte']}, aggiornate: {risultato['modificate']}, "
+          f"già presenti: {risultato['invariate']}")
     print("="*70 + "\n")
 
 if __name__ == "__main__":
@@ -0,0 +1,128 @@
+"""
+Benchmark di get_analytics_dashboard: numero di query e tempo
+
+Crea un database SQLite temporaneo con N clienti (e un anno di rollup
+giornaliero), poi misura quante query esegue la dashboard e quanto ci
+mette. Il database reale non viene toccato.
+
+Uso:
+    python scripts/benchmark_analytics.py                 # 10k, 100k, 1M
+    python scripts/benchmark_analytics.py 10000 50000
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Database temporaneo: va impostato PRIMA di importare database.py
+_cartella = tempfile.mkdtemp(prefix="benchmark_analytics_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_cartella}/benchmark.db"
+os.environ["DATABASE_READ_URL"] = ""
+
+from sqlalchemy import event
+from database import engine, Base, ClienteDB, FAQDB, StatisticaGiornalieraDB
+from utils.analytics import get_analytics_dashboard
+
+SETTORI = ["finanza", "sport", "coworking", "generico"]
+RIPETIZIONI = 5
+BATCH = 50000
+
+_query_eseguite = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _conta_query(conn, cursor, statement, parameters, context, executemany):
+    global _query_eseguite
+    _query_eseguite += 1
+
+
+def popola(numero_clienti, gia_presenti):
+    """Aggiunge clienti fino a numero_clienti (inserimento in blocco)"""
+    adesso = datetime.utcnow()
+    tabella = ClienteDB.__table__
+
+    with engine.begin() as conn:
+        for inizio in range(gia_presenti, numero_clienti, BATCH):
+            fine = min(inizio + BATCH, numero_clienti)
+            conn.execute(tabella.insert(), [
+                {
+                    "phone": f"+39{3000000000 + i}",
+                    "nome": f"Cliente {i}",
+                    "settore": SETTORI[i % len(SETTORI)],
+                    "stato": "attivo" if i % 5 else "inattivo",
+                    "numero_messaggi": random.randint(0, 50),
+                    "data_creazione": adesso - timedelta(days=random.randint(0, 365)),
+                    "ultima_interazione": adesso - timedelta(days=random.randint(0, 90)),
+                }
+                for i in range(inizio, fine)
+            ])
+
+
+def popola_fissi():
+    """Un anno di rollup per settore e qualche FAQ"""
+    oggi = datetime.utcnow().date()
+
+    with engine.begin() as conn:
+        conn.execute(StatisticaGiornalieraDB.__table__.insert(), [
+            {
+                "giorno": oggi - timedelta(days=d),
+                "settore": settore,
+                "messaggi_totali": 100,
+                "messaggi_faq": 60,
+                "messaggi_perplexity": 40,
+                "nuovi_clienti": 5,
+                "clienti_attivi": 30,
+            }
+            for d in range(365)
+            for settore in SETTORI
+        ])
+        conn.execute(FAQDB.__table__.insert(), [
+            {"domanda_completa": f"Domanda {i}", "domanda_keywords": "", "risposta": "", "settore": "", "priorita": 5}
+            for i in range(50)
+        ])
+
+
+def misura():
+    """Ritorna (query per chiamata, tempo medio in ms)"""
+    global _query_eseguite
+
+    get_analytics_dashboard()  # riscalda cache e pool
+
+    _query_eseguite = 0
+    inizio = time.perf_counter()
+    for _ in range(RIPETIZIONI):
+        get_analytics_dashboard()
+    durata = (time.perf_counter() - inizio) / RIPETIZIONI
+
+    return _query_eseguite // RIPETIZIONI, durata * 1000
+
+
+if __name__ == "__main__":
+    dimensioni = [int(a) for a in sys.argv[1:]] or [10000, 100000, 1000000]
+
+    Base.metadata.create_all(bind=engine)
+    popola_fissi()
+
+    print("\n" + "="*70)
+    print("⏱️  BENCHMARK get_analytics_dashboard")
+    print(f"   Database: {engine.url}")
+    print("="*70)
+    print(f"{'Clienti':>12} {'Query':>8} {'Tempo (ms)':>12}")
+
+    presenti = 0
+    for numero in sorted(dimensioni):
+        popola(numero, presenti)
+        presenti = numero
+        query, ms = misura()
+        print(f"{numero:>12,} {query:>8} {ms:>12.1f}")
+
+    print("="*70 + "\n")
+
+    engine.dispose()
+    shutil.rmtree(_cartella, ignore_errors=True)
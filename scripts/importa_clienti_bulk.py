@@ -6,96 +6,54 @@ Supporta grandi quantità di dati
 import sys
 sys.path.insert(0, '.')
 
-import csv
-from database import get_db_session, ClienteDB
-from datetime import datetime
+import os
+import time
+from utils.importazione import importa_clienti_csv
 
-def importa_clienti_da_csv(file_path, settore_default="generico"):
+
+def stampa_blocco(risultato):
+    """Avanzamento dopo ogni blocco"""
+    print(
+        f"📦 {risultato['righe']:,} righe  "
+        f"✅ {risultato['aggiunti']:,}  ⏭️  {risultato['duplicati']:,}  ❌ {len(risultato['errori']):,}"
+    )
+
+
+def importa_clienti_da_csv(file_path, settore_default="generico", processi=1):
     """
     Importa clienti da CSV
     
     Formato CSV atteso:
     phone,nome,azienda,settore,email,etichette,note
-    """
     
-    db = get_db_session()
-    
-    clienti_aggiunti = 0
-    clienti_duplicati = 0
-    errori = []
+    Le righe vengono lette e scritte a blocchi (una query per i duplicati
+    e un INSERT per blocco), quindi anche file da decine di migliaia di
+    righe richiedono pochi secondi. Con processi > 1 lettura e validazione
+    girano in parallelo, le scritture restano in questo processo.
+    """
     
     print("\n" + "="*70)
     print(f"📥 IMPORTAZIONE BULK DA CSV")
     print(f"   File: {file_path}")
+    if processi > 1:
+        print(f"   Processi: {processi}")
     print("="*70 + "\n")
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            
-            if not reader.fieldnames:
-                print("❌ File CSV vuoto o malformato")
-                return
-            
-            print(f"📋 Colonne trovate: {', '.join(reader.fieldnames)}\n")
-            
-            for row_num, row in enumerate(reader, start=2):  # Start at 2 (riga 1 è header)
-                try:
-                    phone = row.get('phone', '').strip()
-                    
-                    # Valida il numero
-                    if not phone:
-                        errori.append(f"Riga {row_num}: numero vuoto")
-                        continue
-                    
-                    # Normalizza il numero (aggiungi + se manca)
-                    if not phone.startswith("+"):
-                        phone = "+" + phone
-                    
-                    # Controlla se esiste già
-                    cliente_esistente = db.query(ClienteDB).filter(
-                        ClienteDB.phone == phone
-                    ).first()
-                    
-                    if cliente_esistente:
-                        clienti_duplicati += 1
-                        print(f"⏭️  Riga {row_num}: {phone} - {row.get('nome', 'N/A')} (GIÀ PRESENTE)")
-                        continue
-                    
-                    # Crea nuovo cliente
-                    cliente = ClienteDB(
-                        phone=phone,
-                        nome=row.get('nome', 'N/A'),
-                        azienda=row.get('azienda', ''),
-                        settore=row.get('settore', settore_default),
-                        email=row.get('email', ''),
-                        etichette=row.get('etichette', ''),
-                        note=row.get('note', ''),
-                        data_creazione=datetime.utcnow(),
-                        ultima_interazione=datetime.utcnow(),
-                        numero_messaggi=0,
-                        stato="attivo"
-                    )
-                    
-                    db.add(cliente)
-                    clienti_aggiunti += 1
-                    
-                    print(f"✅ Riga {row_num}: {phone} - {row.get('nome', 'N/A')}")
-                
-                except Exception as e:
-                    errori.append(f"Riga {row_num}: {str(e)}")
-                    print(f"❌ Riga {row_num}: ERRORE - {str(e)}")
-            
-            # Commit tutti i clienti
-            db.commit()
+        inizio = time.monotonic()
+        risultato = importa_clienti_csv(
+            file_path, settore_default, progresso=stampa_blocco, processi=processi
+        )
+        errori = risultato['errori']
         
         # Statistiche finali
         print("\n" + "="*70)
         print("✅ IMPORTAZIONE COMPLETATA")
         print("="*70)
-        print(f"   ✅ Clienti aggiunti: {clienti_aggiunti}")
-        print(f"   ⏭️  Clienti duplicati (non aggiunti): {clienti_duplicati}")
+        print(f"   ✅ Clienti aggiunti: {risultato['aggiunti']}")
+        print(f"   ⏭️  Clienti duplicati (non aggiunti): {risultato['duplicati']}")
         print(f"   ❌ Errori: {len(errori)}")
+        print(f"   ⏱️  Durata: {time.monotonic() - inizio:.1f}s")
         
         if errori:
             print(f"\n⚠️  ERRORI DURANTE L'IMPORTAZIONE:")
@@ -110,18 +68,24 @@ def importa_clienti_da_csv(file_path, settore_default="generico"):
         print(f"❌ File '{file_path}' non trovato")
     except Exception as e:
         print(f"❌ Errore generale: {e}")
-    finally:
-        db.close()
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Uso: python scripts/importa_clienti_bulk.py <file.csv> [settore_default]")
+    argomenti = sys.argv[1:]
+    processi = 1
+    if "--processi" in argomenti:
+        i = argomenti.index("--processi")
+        processi = int(argomenti[i + 1]) if i + 1 < len(argomenti) else os.cpu_count()
+        del argomenti[i:i + 2]
+    
+    if not argomenti:
+        print("Uso: python scripts/importa_clienti_bulk.py <file.csv> [settore_default] [--processi N]")
         print("\nEsempio:")
         print("  python scripts/importa_clienti_bulk.py clienti.csv")
         print("  python scripts/importa_clienti_bulk.py clienti.csv finanza")
+        print("  python scripts/importa_clienti_bulk.py clienti.csv --processi 8")
         sys.exit(1)
     
-    file_csv = sys.argv[1]
-    settore = sys.argv[2] if len(sys.argv) > 2 else "generico"
+    file_csv = argomenti[0]
+    settore = argomenti[1] if len(argomenti) > 1 else "generico"
     
-    importa_clienti_da_csv(file_csv, settore)
+    importa_clienti_da_csv(file_csv, settore, processi)
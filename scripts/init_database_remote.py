@@ -1,5 +1,9 @@
 """
-Script per creare tabelle su PostgreSQL remoto
+Script per creare o aggiornare le tabelle su PostgreSQL remoto
+
+Crea le tabelle mancanti, aggiunge colonne e indici introdotti dopo la
+creazione del database e prepara la ricerca full-text (init_db). Si può
+lanciare prima di ogni deploy; l'app fa comunque lo stesso all'avvio.
 """
 
 import sys
@@ -7,7 +11,6 @@ sys.path.insert(0, '.')
 
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
 
 # Carica variabili d'ambiente
 load_dotenv()
@@ -23,16 +26,13 @@ if not database_url:
 print(f"\n📦 Connessione a: {database_url.split('@')[1] if '@' in database_url else 'database'}")
 
 # Importa i modelli DOPO di aver settato DATABASE_URL
-from database import Base, engine, ClienteDB, FAQDB, MessaggioDB
+from database import init_db
 
 try:
-    # Crea tutte le tabelle
-    Base.metadata.create_all(bind=engine)
+    # Tabelle, colonne e indici mancanti + indici full-text + utente admin
+    init_db()
     
-    print("\n✅ Tabelle create su PostgreSQL!")
-    print("   • clienti")
-    print("   • faq")
-    print("   • messaggi")
+    print("\n✅ Schema aggiornato su PostgreSQL!")
     
 except Exception as e:
     print(f"\n❌ Errore: {e}")
@@ -0,0 +1,61 @@
+"""
+Migrazione: da ClienteDB.etichette ("VIP|Attivo") alle tabelle tag e cliente_tag
+
+Crea le tabelle se mancano, divide le etichette esistenti e collega
+i clienti ai tag. Si può rilanciare: i collegamenti vengono ricreati
+da zero partendo dal campo testuale.
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+from database import get_db_session, init_db, ClienteDB
+from utils.tag import sincronizza_tag_cliente
+
+# Clienti per commit
+BATCH = 1000
+
+
+def migra_etichette_tag():
+    """Popola tag e cliente_tag dalle etichette testuali"""
+    
+    print("\n" + "="*70)
+    print("🔧 MIGRAZIONE etichette → tag")
+    print("="*70 + "\n")
+    
+    init_db()
+    
+    db = get_db_session()
+    
+    try:
+        ultimo_id = 0
+        migrati = 0
+        
+        while True:
+            clienti = db.query(ClienteDB).filter(
+                ClienteDB.id > ultimo_id
+            ).order_by(ClienteDB.id).limit(BATCH).all()
+            
+            if not clienti:
+                break
+            
+            for cliente in clienti:
+                sincronizza_tag_cliente(db, cliente, cliente.etichette)
+            
+            db.commit()
+            ultimo_id = clienti[-1].id
+            migrati += len(clienti)
+            print(f"   ⏳ {migrati} clienti migrati")
+        
+        print("\n" + "="*70)
+        print(f"✅ Clienti migrati: {migrati}")
+        print("="*70 + "\n")
+        
+        return migrati
+    
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    migra_etichette_tag()
@@ -0,0 +1,69 @@
+"""
+Migrazione: collega i messaggi ai clienti con la chiave intera cliente_id
+
+1. Aggiunge la colonna messaggi.cliente_id e l'indice (cliente_id, data_messaggio)
+2. Riempie cliente_id dei messaggi esistenti partendo da cliente_phone
+
+Si può rilanciare: aggiorna solo i messaggi con cliente_id ancora vuoto.
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+from sqlalchemy import text
+from database import engine, aggiorna_schema
+
+# Messaggi aggiornati per transazione (evita lock lunghi sulla tabella)
+BATCH = 10000
+
+
+def migra_messaggi_cliente_id():
+    """Backfill di messaggi.cliente_id a blocchi di id"""
+    
+    print("\n" + "="*70)
+    print("🔧 MIGRAZIONE messaggi.cliente_id")
+    print("="*70 + "\n")
+    
+    aggiorna_schema()
+    
+    with engine.connect() as conn:
+        id_min, id_max = conn.execute(
+            text("SELECT MIN(id), MAX(id) FROM messaggi WHERE cliente_id IS NULL")
+        ).one()
+    
+    if id_min is None:
+        print("✅ Nessun messaggio da aggiornare")
+        return 0
+    
+    aggiornati = 0
+    
+    for inizio in range(id_min, id_max + 1, BATCH):
+        with engine.begin() as conn:
+            risultato = conn.execute(text("""
+                UPDATE messaggi
+                SET cliente_id = (
+                    SELECT clienti.id FROM clienti
+                    WHERE clienti.phone = messaggi.cliente_phone
+                )
+                WHERE cliente_id IS NULL
+                  AND id >= :inizio AND id < :fine
+            """), {"inizio": inizio, "fine": inizio + BATCH})
+            aggiornati += risultato.rowcount
+        
+        print(f"   ⏳ id {inizio}-{min(inizio + BATCH - 1, id_max)} completati")
+    
+    with engine.connect() as conn:
+        orfani = conn.execute(
+            text("SELECT COUNT(*) FROM messaggi WHERE cliente_id IS NULL")
+        ).scalar()
+    
+    print("\n" + "="*70)
+    print(f"✅ Messaggi collegati: {aggiornati}")
+    print(f"   ⚠️  Senza cliente corrispondente: {orfani}")
+    print("="*70 + "\n")
+    
+    return aggiornati
+
+
+if __name__ == "__main__":
+    migra_messaggi_cliente_id()
@@ -0,0 +1,205 @@
+"""
+Migrazione: numeri dei clienti in formato E.164 e unione dei doppioni
+
+Prima di utils.telefoni a ogni numero veniva solo aggiunto un "+", quindi
+lo stesso cliente può esistere più volte ("+393331234567", "+3331234567",
+"+00393331234567"). Per ogni gruppo di clienti con lo stesso numero
+normalizzato resta il più vecchio, che riceve:
+- i messaggi dei doppioni (cliente_id e cliente_phone)
+- l'unione dei tag
+- la somma di numero_messaggi, la prima data_creazione e l'ultima interazione
+- nome, azienda, email e note mancanti presi dai doppioni
+
+I numeri non riconosciuti vengono solo elencati, non modificati.
+Anche quelli ambigui ("+3545551234": numero islandese valido oppure il
+cellulare 354 5551234 col vecchio "+") vengono elencati e lasciati come
+sono; con --ambigui-italiani diventano tutti numeri italiani.
+Senza --applica mostra cosa farebbe senza scrivere nulla.
+
+Uso:
+    python scripts/migra_telefoni_e164.py             # prova
+    python scripts/migra_telefoni_e164.py --applica   # esegue
+    python scripts/migra_telefoni_e164.py --applica --ambigui-italiani
+
+Dopo un'unione conviene rilanciare scripts/ricalcola_statistiche.py.
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+from datetime import datetime
+from sqlalchemy import select, or_
+from database import get_db_session, init_db, ClienteDB, ClienteTagDB, MessaggioDB, MessaggioOutboundDB
+from utils.tag import parse_etichette, formatta_etichette, sincronizza_tag_cliente
+from utils.telefoni import ambiguo_vecchio_formato, normalizza_telefono, normalizza_telefoni
+
+# Gruppi di clienti sistemati per transazione
+BATCH = 500
+
+# Campi copiati da un doppione se nel cliente che resta sono vuoti
+CAMPI_DA_COMPLETARE = ("nome", "azienda", "email", "note")
+NOMI_SEGNAPOSTO = ("", "N/A", "Sconosciuto")
+
+
+def _piu_vecchio(cliente):
+    """Chiave di ordinamento: prima data_creazione, poi id"""
+    return (cliente.data_creazione or datetime.max, cliente.id)
+
+
+def _vuoto(campo, valore):
+    if campo == "nome":
+        return (valore or "") in NOMI_SEGNAPOSTO
+    return not valore
+
+
+def _unisci(db, normalizzato, clienti):
+    """Unisce i clienti con lo stesso numero nel più vecchio; ritorna i doppioni eliminati"""
+    clienti = sorted(clienti, key=_piu_vecchio)
+    resta, doppioni = clienti[0], clienti[1:]
+
+    # Messaggi: per id e, per quelli mai collegati, per numero
+    db.query(MessaggioDB).filter(or_(
+        MessaggioDB.cliente_id.in_([c.id for c in clienti]),
+        MessaggioDB.cliente_phone.in_([c.phone for c in clienti]),
+    )).update(
+        {MessaggioDB.cliente_id: resta.id, MessaggioDB.cliente_phone: normalizzato},
+        synchronize_session=False,
+    )
+
+    tags = []
+    for cliente in clienti:
+        tags += [t for t in parse_etichette(cliente.etichette or "") if t not in tags]
+
+    for doppione in doppioni:
+        for campo in CAMPI_DA_COMPLETARE:
+            if _vuoto(campo, getattr(resta, campo)) and not _vuoto(campo, getattr(doppione, campo)):
+                setattr(resta, campo, getattr(doppione, campo))
+        resta.numero_messaggi = (resta.numero_messaggi or 0) + (doppione.numero_messaggi or 0)
+        if doppione.ultima_interazione and (
+            not resta.ultima_interazione or doppione.ultima_interazione > resta.ultima_interazione
+        ):
+            resta.ultima_interazione = doppione.ultima_interazione
+
+    if doppioni:
+        db.query(ClienteTagDB).filter(
+            ClienteTagDB.cliente_id.in_([c.id for c in doppioni])
+        ).delete(synchronize_session=False)
+        # Gli invii registrati dei doppioni non passano al cliente che resta
+        # (vale il suo registro); SQLite non applica ondelete='CASCADE'
+        db.query(MessaggioOutboundDB).filter(
+            MessaggioOutboundDB.cliente_id.in_([c.id for c in doppioni])
+        ).delete(synchronize_session=False)
+        for doppione in doppioni:
+            db.delete(doppione)
+        # I doppioni spariscono prima che il numero passi al cliente che resta
+        db.flush()
+        sincronizza_tag_cliente(db, resta, formatta_etichette(tags))
+
+    resta.phone = normalizzato
+    resta.data_modifica = datetime.utcnow()
+
+    return len(doppioni)
+
+
+def migra_telefoni_e164(applica=False, ambigui_italiani=False):
+    """
+    Normalizza clienti.phone e unisce i clienti con lo stesso numero
+
+    ambigui_italiani: i numeri ambigui diventano italiani (+39) invece di
+    restare come sono
+    """
+
+    print("\n" + "="*70)
+    print(f"🔧 MIGRAZIONE telefoni E.164{'' if applica else ' (prova, nessuna modifica)'}")
+    print("="*70 + "\n")
+
+    init_db()
+
+    db = get_db_session()
+    try:
+        righe = db.execute(select(ClienteDB.id, ClienteDB.phone).order_by(ClienteDB.id)).all()
+    finally:
+        db.close()
+
+    gruppi = {}  # numero normalizzato -> [(id, phone)]
+    non_validi = []
+    ambigui = []  # (id, phone, lettura italiana)
+    for (cliente_id, phone), normalizzato in zip(
+        righe, normalizza_telefoni([phone for _, phone in righe], vecchio_formato=True)
+    ):
+        if ambiguo_vecchio_formato(phone):
+            italiano = normalizza_telefono(phone.replace("+", "", 1))
+            ambigui.append((cliente_id, phone, italiano))
+            if ambigui_italiani:
+                normalizzato = italiano
+        if normalizzato:
+            gruppi.setdefault(normalizzato, []).append((cliente_id, phone))
+        else:
+            non_validi.append((cliente_id, phone))
+
+    # Solo i gruppi con doppioni o con un numero da riscrivere
+    da_sistemare = [
+        (normalizzato, membri) for normalizzato, membri in gruppi.items()
+        if len(membri) > 1 or membri[0][1] != normalizzato
+    ]
+    unioni = sum(1 for _, membri in da_sistemare if len(membri) > 1)
+
+    print(f"   📇 Clienti: {len(righe)}")
+    print(f"   ✏️  Numeri da riscrivere: {len(da_sistemare) - unioni}")
+    print(f"   🔗 Gruppi di doppioni: {unioni}")
+    print(f"   ⚠️  Numeri non validi (lasciati com'erano): {len(non_validi)}")
+    if ambigui_italiani:
+        print(f"   ❓ Numeri ambigui (trattati come italiani): {len(ambigui)}")
+    else:
+        print(f"   ❓ Numeri ambigui (lasciati com'erano, vedi --ambigui-italiani): {len(ambigui)}")
+
+    for normalizzato, membri in da_sistemare[:20]:
+        print(f"      {', '.join(phone for _, phone in membri)} -> {normalizzato}")
+    if len(da_sistemare) > 20:
+        print(f"      ... e altri {len(da_sistemare) - 20}")
+    for cliente_id, phone in non_validi[:20]:
+        print(f"      ❌ id {cliente_id}: {phone}")
+    for cliente_id, phone, italiano in ambigui[:20]:
+        # Se la lettura italiana è già un altro cliente, quasi certamente è lei
+        gia_cliente = " (già presente)" if italiano in gruppi and not ambigui_italiani else ""
+        print(f"      ❓ id {cliente_id}: {phone} estero o {italiano}{gia_cliente}")
+    if len(ambigui) > 20:
+        print(f"      ... e altri {len(ambigui) - 20}")
+
+    if not applica:
+        print("\nRilanciare con --applica per eseguire.\n")
+        return 0
+
+    eliminati = 0
+    for inizio in range(0, len(da_sistemare), BATCH):
+        blocco = da_sistemare[inizio:inizio + BATCH]
+        db = get_db_session()
+        try:
+            ids = [cliente_id for _, membri in blocco for cliente_id, _ in membri]
+            clienti = {c.id: c for c in db.query(ClienteDB).filter(ClienteDB.id.in_(ids))}
+            for normalizzato, membri in blocco:
+                eliminati += _unisci(db, normalizzato, [clienti[cliente_id] for cliente_id, _ in membri])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        print(f"   ⏳ {min(inizio + BATCH, len(da_sistemare))}/{len(da_sistemare)} gruppi")
+
+    print("\n" + "="*70)
+    print(f"✅ Numeri normalizzati: {len(da_sistemare)}")
+    print(f"   🔗 Doppioni uniti ed eliminati: {eliminati}")
+    if eliminati:
+        print("   💡 Rilanciare scripts/ricalcola_statistiche.py per aggiornare i totali")
+    print("="*70 + "\n")
+
+    return eliminati
+
+
+if __name__ == "__main__":
+    migra_telefoni_e164(
+        applica="--applica" in sys.argv[1:],
+        ambigui_italiani="--ambigui-italiani" in sys.argv[1:],
+    )
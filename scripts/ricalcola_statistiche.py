@@ -0,0 +1,28 @@
+"""
+Script per (ri)costruire il rollup statistiche_giornaliere dai dati grezzi
+
+Il primo popolamento è automatico (init_db, con la tabella vuota); poi ci
+pensano webhook e job notturno. Serve dopo correzioni manuali dei dati.
+I giorni oltre Config.MESSAGGI_CONSERVAZIONE_GIORNI già presenti nel
+rollup non vengono toccati (i loro messaggi sono stati eliminati).
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+from datetime import timedelta
+from database import init_db
+from utils.statistiche import ricalcola_statistiche, oggi_locale
+
+
+if __name__ == "__main__":
+    giorni = int(sys.argv[1]) if len(sys.argv) > 1 else 90
+    
+    init_db()
+    
+    oggi = oggi_locale()
+    giorno_da = oggi - timedelta(days=giorni - 1)
+    
+    print(f"\n📊 Ricalcolo statistiche dal {giorno_da} al {oggi}...")
+    righe = ricalcola_statistiche(giorno_da, oggi)
+    print(f"✅ {righe} righe scritte\n")
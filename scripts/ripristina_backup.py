@@ -0,0 +1,70 @@
+"""
+Script per ripristinare un backup completo e i suoi incrementali
+
+Il database indicato da DATABASE_URL viene SOVRASCRITTO con il contenuto
+del backup completo, poi gli incrementali vengono applicati in ordine.
+Legge anche i vecchi backup .json di export_backup_completo.
+
+Uso:
+    python scripts/ripristina_backup.py                       # catena corrente (backups/stato_backup.json)
+    python scripts/ripristina_backup.py completo.ndjson.gz inc1.ndjson.gz inc2.ndjson.gz
+    python scripts/ripristina_backup.py --ricostruisci-indici completo.ndjson.gz
+    python scripts/ripristina_backup.py --si ...              # senza conferma
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+import time
+from database import init_db
+from utils.backup import catena_da_stato, verifica_catena, ripristina_catena
+
+_ultima_stampa = 0
+
+
+def stampa_progresso(avanzamento):
+    """Una riga al secondo al massimo"""
+    global _ultima_stampa
+    adesso = time.monotonic()
+    if adesso - _ultima_stampa < 1:
+        return
+    _ultima_stampa = adesso
+    print(
+        f"   ⏳ {avanzamento['percentuale_file']:5.1f}%  "
+        f"{avanzamento['tabella']}: {avanzamento['righe']:,} righe"
+    )
+
+
+if __name__ == "__main__":
+    argomenti = sys.argv[1:]
+    ricostruisci_indici = "--ricostruisci-indici" in argomenti
+    senza_conferma = "--si" in argomenti
+    percorsi = [a for a in argomenti if not a.startswith("--")]
+
+    try:
+        percorsi = percorsi or catena_da_stato()
+        headers = verifica_catena(percorsi)
+    except (ValueError, FileNotFoundError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    print("\n" + "="*70)
+    print("♻️  RIPRISTINO BACKUP")
+    print("="*70)
+    for percorso, header in zip(percorsi, headers):
+        print(f"   • {header['modalita']:<12} {header['creato_il']}  {percorso}")
+    if ricostruisci_indici:
+        print("   Indici ricostruiti a fine caricamento")
+    print("="*70)
+
+    if not senza_conferma:
+        risposta = input("\n⚠️  Il database attuale verrà sovrascritto. Continuare? (si/no): ")
+        if risposta.strip().lower() not in ("si", "sì", "s"):
+            print("Annullato.")
+            sys.exit(0)
+
+    init_db()
+
+    inizio = time.monotonic()
+    ripristina_catena(percorsi, ricostruisci_indici, stampa_progresso)
+    print(f"⏱️  Durata: {time.monotonic() - inizio:.1f}s\n")
@@ -0,0 +1,78 @@
+"""
+Script per allineare le FAQ del database a un catalogo (.json, .csv, .yaml)
+
+Le FAQ nuove del catalogo vengono aggiunte e quelle cambiate aggiornate.
+Quelle che nel file non ci sono (anche le FAQ create dalla dashboard)
+vengono solo elencate: si eliminano con --elimina, meglio dopo averle
+controllate con --simula. Rilanciarlo con lo stesso file non modifica
+nulla e, se le FAQ non sono cambiate, non le rilegge (adatto ai deploy).
+
+Uso:
+    python scripts/sincronizza_faq.py                        # Config.FAQ_CATALOGO
+    python scripts/sincronizza_faq.py faq/catalogo.json
+    python scripts/sincronizza_faq.py --simula ...           # mostra le differenze
+    python scripts/sincronizza_faq.py --elimina ...          # elimina le FAQ fuori catalogo
+    python scripts/sincronizza_faq.py --forza ...            # confronta anche se invariato
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+import time
+from config import Config
+from database import init_db
+from utils.catalogo_faq import carica_catalogo, sincronizza_catalogo
+
+
+def stampa_risultato(risultato, simula=False, elimina=False):
+    """Riepilogo della sincronizzazione"""
+    print("\n" + "="*70)
+    print("🔎 DIFFERENZE (nessuna modifica)" if simula else "✅ FAQ SINCRONIZZATE")
+    print("="*70)
+    if risultato["saltata"]:
+        print("   ⏭️  Catalogo e FAQ invariati dall'ultima sincronizzazione (--forza per ricontrollare)")
+    for domanda in risultato["domande"]["aggiunte"]:
+        print(f"   ➕ {domanda[:60]}")
+    for domanda in risultato["domande"]["modificate"]:
+        print(f"   ✏️  {domanda[:60]}")
+    for domanda in risultato["domande"]["fuori_catalogo"]:
+        print(f"   {'🗑️ ' if elimina else '📌'} {domanda[:60]}")
+    if risultato["domande"]["fuori_catalogo"] and not elimina:
+        print(f"   ⚠️  {len(risultato['domande']['fuori_catalogo'])} FAQ non sono nel catalogo: "
+              "restano (--elimina per eliminarle)")
+    print(f"   ➕ Aggiunte: {risultato['aggiunte']}")
+    print(f"   ✏️  Modificate: {risultato['modificate']}")
+    print(f"   🗑️  Eliminate: {risultato['eliminate']}")
+    print(f"   🔗 Doppioni rimossi: {risultato['doppioni']}")
+    print(f"   ⏭️  Invariate: {risultato['invariate']}")
+    print("="*70 + "\n")
+
+
+if __name__ == "__main__":
+    argomenti = sys.argv[1:]
+    simula = "--simula" in argomenti
+    elimina = "--elimina" in argomenti
+    forza = "--forza" in argomenti
+    percorsi = [a for a in argomenti if not a.startswith("--")]
+    percorso = percorsi[0] if percorsi else Config.FAQ_CATALOGO
+
+    print("\n" + "="*70)
+    print("🔄 SINCRONIZZAZIONE CATALOGO FAQ")
+    print(f"   File: {percorso}")
+    print("="*70)
+
+    try:
+        voci = carica_catalogo(percorso)
+    except FileNotFoundError:
+        print(f"❌ File '{percorso}' non trovato")
+        sys.exit(1)
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    init_db()
+
+    inizio = time.monotonic()
+    risultato = sincronizza_catalogo(voci, elimina=elimina, simula=simula, forza=forza)
+    stampa_risultato(risultato, simula, elimina)
+    print(f"⏱️  Durata: {time.monotonic() - inizio:.2f}s\n")
@@ -0,0 +1,35 @@
+"""
+Configurazione dei test: database SQLite temporaneo e client Flask autenticato
+
+Le variabili d'ambiente vanno impostate prima di importare config/database.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+_CARTELLA = tempfile.mkdtemp(prefix="bot_test_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_CARTELLA, 'test.db')}"
+os.environ["WHATSAPP_TOKEN"] = ""  # invii simulati
+
+import pytest
+from database import init_db
+
+init_db()
+
+from app import app as flask_app
+from utils.scheduler import stop_scheduler
+
+# I task vengono chiamati direttamente dai test
+stop_scheduler()
+
+
+@pytest.fixture
+def client():
+    """Client di test già autenticato come admin"""
+    flask_app.config["TESTING"] = True
+    with flask_app.test_client() as c:
+        c.post("/auth/login", json={"username": "admin", "password": "trieste_bot_2025"})
+        yield c
@@ -0,0 +1,63 @@
+"""
+Test backup e ripristino: completo e catena completo + incrementale
+riportano il database esattamente allo stato del backup
+"""
+
+from sqlalchemy import select
+
+from database import engine, get_db_session, MessaggioDB
+from utils.backup import catena_da_stato, esegui_backup, ripristina_catena, _tabelle_backup
+
+
+def _istantanea():
+    """Tutte le righe delle tabelle salvate, in ordine di chiave primaria"""
+    with engine.connect() as conn:
+        return {
+            tabella.name: conn.execute(
+                select(tabella).order_by(*tabella.primary_key.columns)
+            ).all()
+            for tabella in _tabelle_backup()
+        }
+
+
+def _crea(client, phone, nome):
+    risposta = client.post("/api/dashboard/clienti", json={"phone": phone, "nome": nome, "etichette": "VIP"})
+    assert risposta.status_code == 201
+    return risposta.get_json()["cliente_id"]
+
+
+def test_ripristino_completo_e_incrementale(client, tmp_path):
+    cartella = str(tmp_path)
+    da_modificare = _crea(client, "3461230001", "Da Modificare")
+    da_eliminare = _crea(client, "3461230002", "Da Eliminare")
+
+    esegui_backup(cartella)
+    completo = _istantanea()
+
+    # Modifiche coperte dall'incrementale
+    nuovo = _crea(client, "3461230003", "Nuovo")
+    assert client.put(f"/api/dashboard/clienti/{da_modificare}",
+                      json={"nome": "Modificato", "etichette": "Attivo"}).status_code == 200
+    assert client.delete(f"/api/dashboard/clienti/{da_eliminare}").status_code == 200
+    db = get_db_session()
+    try:
+        db.add(MessaggioDB(cliente_id=nuovo, cliente_phone="+393461230003",
+                           testo_cliente="ciao", tipo_risposta="faq"))
+        db.commit()
+    finally:
+        db.close()
+
+    esegui_backup(cartella, incrementale=True)
+    incrementale = _istantanea()
+    catena = catena_da_stato(cartella)
+    assert len(catena) == 2
+
+    # Modifiche successive, che il ripristino deve annullare
+    assert client.delete(f"/api/dashboard/clienti/{nuovo}").status_code == 200
+    _crea(client, "3461230004", "Dopo il backup")
+
+    ripristina_catena(catena[:1])
+    assert _istantanea() == completo
+
+    ripristina_catena(catena)
+    assert _istantanea() == incrementale
@@ -0,0 +1,38 @@
+"""
+Test sincronizzazione catalogo FAQ: niente eliminazioni senza elimina=True,
+catalogo invariato saltato finché la tabella faq non cambia
+"""
+
+from utils.catalogo_faq import sincronizza_catalogo, voce_faq
+
+
+def _catalogo(*domande):
+    return [voce_faq({"domanda_completa": d, "risposta": f"Risposta a {d}"}) for d in domande]
+
+
+def test_sincronizzazione_catalogo(client):
+    risposta = client.post("/api/dashboard/faq", json={
+        "domanda_completa": "Domanda creata dalla dashboard?", "risposta": "Sì"
+    })
+    assert risposta.status_code == 201
+
+    voci = _catalogo("Orari del catalogo?", "Prezzi del catalogo?")
+    risultato = sincronizza_catalogo(voci)
+    assert risultato["aggiunte"] == 2
+    assert risultato["eliminate"] == 0
+    # Elencata ma non eliminata
+    assert "Domanda creata dalla dashboard?" in risultato["domande"]["fuori_catalogo"]
+
+    # Stesso catalogo, FAQ invariate: non si confronta nulla
+    assert sincronizza_catalogo(voci)["saltata"]
+
+    # Una FAQ modificata dalla dashboard fa ricontrollare il catalogo
+    faq_id = risposta.get_json()["faq_id"]
+    assert client.put(f"/api/dashboard/faq/{faq_id}", json={"risposta": "No"}).status_code == 200
+    risultato = sincronizza_catalogo(voci)
+    assert not risultato["saltata"]
+    assert risultato["invariate"] == 2
+
+    simulato = sincronizza_catalogo(voci, elimina=True, simula=True)
+    assert simulato["eliminate"] >= 1
+    assert client.get(f"/api/dashboard/faq/{faq_id}").status_code == 200
@@ -0,0 +1,60 @@
+"""
+Test eliminazione clienti: un id riusato non eredita lo storico del vecchio cliente
+"""
+
+from database import get_db_session, ClienteDB, MessaggioDB, MessaggioOutboundDB
+from utils.scheduler import task_benvenuto_nuovo_cliente
+
+
+def _crea(client, phone, nome):
+    risposta = client.post("/api/dashboard/clienti", json={"phone": phone, "nome": nome})
+    assert risposta.status_code == 201
+    return risposta.get_json()["cliente_id"]
+
+
+def _invii_benvenuto(cliente_id):
+    db = get_db_session()
+    try:
+        return db.query(MessaggioOutboundDB).filter(
+            MessaggioOutboundDB.cliente_id == cliente_id,
+            MessaggioOutboundDB.campagna == "benvenuto",
+            MessaggioOutboundDB.stato == "inviato",
+        ).count()
+    finally:
+        db.close()
+
+
+def test_cliente_ricreato_con_stesso_id(client):
+    vecchio_id = _crea(client, "3331000001", "Vecchio")
+
+    db = get_db_session()
+    try:
+        db.add(MessaggioDB(cliente_id=vecchio_id, cliente_phone="+393331000001",
+                           testo_cliente="messaggio del vecchio cliente"))
+        db.commit()
+    finally:
+        db.close()
+
+    task_benvenuto_nuovo_cliente()
+    assert _invii_benvenuto(vecchio_id) == 1
+
+    assert client.delete(f"/api/dashboard/clienti/{vecchio_id}").status_code == 200
+
+    # SQLite riusa l'id più alto
+    nuovo_id = _crea(client, "3331000002", "Nuovo")
+    assert nuovo_id == vecchio_id
+
+    # Nessun messaggio né invio del vecchio cliente
+    messaggi = client.get(f"/api/dashboard/clienti/{nuovo_id}/messaggi").get_json()
+    assert messaggi["totale"] == 0
+    assert _invii_benvenuto(nuovo_id) == 0
+
+    # Il nuovo cliente riceve il suo benvenuto
+    task_benvenuto_nuovo_cliente()
+    assert _invii_benvenuto(nuovo_id) == 1
+
+    db = get_db_session()
+    try:
+        assert db.get(ClienteDB, nuovo_id).nome == "Nuovo"
+    finally:
+        db.close()
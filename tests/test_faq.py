@@ -0,0 +1,48 @@
+"""
+Test eliminazione FAQ: un id riusato non eredita hit e score della FAQ eliminata
+"""
+
+from config import Config
+from database import get_db_session, MessaggioDB
+
+
+def _crea(client, domanda):
+    risposta = client.post("/api/dashboard/faq", json={"domanda_completa": domanda, "risposta": "Risposta"})
+    assert risposta.status_code == 201
+    return risposta.get_json()["faq_id"]
+
+
+def _efficacia(client, faq_id):
+    dati = client.get("/api/analytics/faq").get_json()
+    return next(f for f in dati["faq"] if f["id"] == faq_id)
+
+
+def test_faq_ricreata_con_stesso_id(client, monkeypatch):
+    monkeypatch.setattr(Config, "CACHE_ABILITATA", False)
+    vecchio_id = _crea(client, "Domanda di prova da eliminare?")
+
+    db = get_db_session()
+    try:
+        for _ in range(3):
+            db.add(MessaggioDB(cliente_phone="+393331112222", testo_cliente="domanda",
+                               tipo_risposta="faq", faq_id=vecchio_id, match_score=90))
+        db.commit()
+    finally:
+        db.close()
+
+    assert _efficacia(client, vecchio_id)["hit"] == 3
+    assert client.delete(f"/api/dashboard/faq/{vecchio_id}").status_code == 200
+
+    # SQLite riusa l'id più alto
+    nuovo_id = _crea(client, "Domanda nuova?")
+    assert nuovo_id == vecchio_id
+
+    efficacia = _efficacia(client, nuovo_id)
+    assert efficacia["hit"] == 0
+    assert efficacia["score_medio"] is None
+
+    db = get_db_session()
+    try:
+        assert db.query(MessaggioDB).filter(MessaggioDB.faq_id == nuovo_id).count() == 0
+    finally:
+        db.close()
@@ -0,0 +1,79 @@
+"""
+Test job di import: ripresa dopo un checkpoint e pulizia del CSV a fine job
+"""
+
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from config import Config
+from database import get_db_session, ClienteDB, ImportJobDB
+from utils.importazione import riprendi_import_interrotti, stato_job
+
+TELEFONI = ["3471110001", "3471110002", "3471110003", "3471110004", "3471110005"]
+
+
+def _job_interrotto(percorso, **campi):
+    """Job rimasto in_corso senza progressi (processo crashato)"""
+    job_id = uuid.uuid4().hex
+    fermo_da = datetime.utcnow() - timedelta(seconds=Config.IMPORT_JOB_TIMEOUT + 60)
+    db = get_db_session()
+    try:
+        db.add(ImportJobDB(id=job_id, tipo="clienti", file=str(percorso), nome_file="clienti.csv",
+                           stato="in_corso", ripreso_il=fermo_da, aggiornato_il=fermo_da, **campi))
+        db.commit()
+    finally:
+        db.close()
+    return job_id
+
+
+def _aspetta(job_id):
+    for _ in range(100):
+        stato = stato_job(job_id)
+        if stato["stato"] in ("completato", "fallito"):
+            return stato
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} non terminato")
+
+
+def test_ripresa_dopo_checkpoint(tmp_path):
+    percorso = tmp_path / "clienti.csv"
+    percorso.write_text("phone,nome\n" + "".join(f"{t},Cliente {t}\n" for t in TELEFONI))
+
+    # Primo blocco (2 righe) già salvato insieme al suo checkpoint
+    db = get_db_session()
+    try:
+        db.add_all([ClienteDB(phone=f"+39{t}", nome=f"Cliente {t}") for t in TELEFONI[:2]])
+        db.commit()
+    finally:
+        db.close()
+    job_id = _job_interrotto(percorso, righe=2, aggiunti=2, tentativi=1)
+
+    assert riprendi_import_interrotti() >= 1
+    stato = _aspetta(job_id)
+
+    assert stato["stato"] == "completato"
+    # Le righe già importate non vengono rilette: nessun duplicato
+    assert stato["aggiunti"] == 5
+    assert stato["duplicati"] == 0
+    assert not percorso.exists()
+
+    db = get_db_session()
+    try:
+        assert db.query(ClienteDB).filter(
+            ClienteDB.phone.in_([f"+39{t}" for t in TELEFONI])
+        ).count() == 5
+    finally:
+        db.close()
+
+
+def test_job_abbandonato_elimina_il_file(tmp_path):
+    percorso = tmp_path / "clienti.csv"
+    percorso.write_text("phone,nome\n3471110099,Mai importato\n")
+    job_id = _job_interrotto(percorso, tentativi=Config.IMPORT_JOB_TENTATIVI)
+
+    riprendi_import_interrotti()
+
+    assert stato_job(job_id)["stato"] == "fallito"
+    assert not os.path.exists(percorso)
@@ -0,0 +1,54 @@
+"""
+Test registro outbound: un cliente riceve una campagna una volta per
+periodo, gli invii falliti vengono riprovati fino a Config.OUTBOUND_TENTATIVI
+"""
+
+from config import Config
+from database import get_db_session, ClienteDB
+from utils import outbound
+
+
+def _cliente(client, phone):
+    risposta = client.post("/api/dashboard/clienti", json={"phone": phone, "nome": "Test Outbound"})
+    assert risposta.status_code == 201
+    return risposta.get_json()["cliente_id"]
+
+
+def _da_servire(db, cliente_id, campagna, periodo):
+    query = db.query(ClienteDB).filter(ClienteDB.id == cliente_id)
+    return outbound.escludi_gia_serviti(query, campagna, periodo).count() == 1
+
+
+def test_campagna_inviata_una_volta(client):
+    cliente_id = _cliente(client, "3451230001")
+    db = get_db_session()
+    try:
+        cliente = db.get(ClienteDB, cliente_id)
+        assert _da_servire(db, cliente_id, "reminder", "2025-W03")
+
+        assert outbound.invia_campagna(db, cliente, "reminder", "2025-W03", "Ciao") is True
+        assert outbound.invia_campagna(db, cliente, "reminder", "2025-W03", "Ciao") is None
+        assert not _da_servire(db, cliente_id, "reminder", "2025-W03")
+
+        # Altro periodo: di nuovo da servire
+        assert _da_servire(db, cliente_id, "reminder", "2025-W04")
+        assert outbound.invia_campagna(db, cliente, "reminder", "2025-W04", "Ciao") is True
+    finally:
+        db.close()
+
+
+def test_invio_fallito_riprovato(client, monkeypatch):
+    cliente_id = _cliente(client, "3451230002")
+    monkeypatch.setattr(outbound, "invia_messaggio_whatsapp", lambda numero, testo: False)
+    db = get_db_session()
+    try:
+        cliente = db.get(ClienteDB, cliente_id)
+        for _ in range(Config.OUTBOUND_TENTATIVI):
+            assert _da_servire(db, cliente_id, "upsell", outbound.PERIODO_UNICO)
+            assert outbound.invia_campagna(db, cliente, "upsell", outbound.PERIODO_UNICO, "Offerta") is False
+
+        # Tentativi esauriti: non viene più selezionato né inviato
+        assert not _da_servire(db, cliente_id, "upsell", outbound.PERIODO_UNICO)
+        assert outbound.invia_campagna(db, cliente, "upsell", outbound.PERIODO_UNICO, "Offerta") is None
+    finally:
+        db.close()
@@ -0,0 +1,90 @@
+"""
+Test paginazione keyset: giro completo dei cursori, anche con valori NULL
+"""
+
+from datetime import datetime
+from sqlalchemy import event
+from database import engine, get_db_session, ClienteDB
+
+
+def _crea_clienti(client, prefisso):
+    ids = []
+    for i in range(9):
+        risposta = client.post("/api/dashboard/clienti", json={"phone": f"{prefisso}{i:03d}", "nome": f"P{i}"})
+        ids.append(risposta.get_json()["cliente_id"])
+
+    db = get_db_session()
+    try:
+        db.query(ClienteDB).filter(ClienteDB.id.in_(ids[:3])).update(
+            {ClienteDB.ultima_interazione: None}, synchronize_session=False
+        )
+        # Stesso valore: l'ordine lo decide l'id
+        db.query(ClienteDB).filter(ClienteDB.id.in_(ids[3:5])).update(
+            {ClienteDB.ultima_interazione: datetime(2025, 1, 1)}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _atteso(discendente):
+    """Ordine di riferimento calcolato in Python: valori, poi i NULL per id"""
+    db = get_db_session()
+    try:
+        righe = [(c.ultima_interazione, c.id) for c in db.query(ClienteDB)]
+    finally:
+        db.close()
+    valori = sorted((r for r in righe if r[0] is not None), reverse=discendente)
+    nulli = sorted((r for r in righe if r[0] is None), key=lambda r: r[1], reverse=discendente)
+    return [id_riga for _, id_riga in valori + nulli]
+
+
+def _scorri(client, ordina, direzione, limite):
+    ids, cursore = [], ""
+    for _ in range(100):
+        risposta = client.get("/api/dashboard/clienti", query_string={
+            "ordina": ordina, "direzione": direzione, "limite": limite, "cursore": cursore,
+        })
+        assert risposta.status_code == 200
+        dati = risposta.get_json()
+        ids += [c["id"] for c in dati["clienti"]]
+        cursore = dati["cursore_successivo"]
+        if not cursore:
+            return ids
+    raise AssertionError("Paginazione senza fine")
+
+
+def test_cursori_con_null(client):
+    _crea_clienti(client, "3402000")
+
+    for direzione in ("desc", "asc"):
+        atteso = _atteso(direzione == "desc")
+        for limite in (1, 2, 3, 50):
+            assert _scorri(client, "ultima_interazione", direzione, limite) == atteso
+
+
+def test_keyset_usa_indice(client):
+    _crea_clienti(client, "3402001")
+    query = []
+
+    def registra(conn, cursore, istruzione, parametri, contesto, executemany):
+        if istruzione.lstrip().startswith("SELECT") and "FROM clienti" in istruzione:
+            query.append((istruzione, parametri))
+
+    event.listen(engine, "before_cursor_execute", registra)
+    try:
+        _scorri(client, "ultima_interazione", "desc", 2)
+    finally:
+        event.remove(engine, "before_cursor_execute", registra)
+
+    assert query
+    with engine.connect() as conn:
+        for istruzione, parametri in query:
+            piano = " ".join(str(r) for r in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + istruzione, parametri))
+            assert "TEMP B-TREE" not in piano, piano
+
+
+def test_cursore_con_ricerca_rifiutato(client):
+    risposta = client.get("/api/dashboard/clienti", query_string={"ricerca": "p1", "cursore": ""})
+    assert risposta.status_code == 400
+    assert client.get("/api/dashboard/clienti", query_string={"ricerca": "p1"}).status_code == 200
@@ -0,0 +1,54 @@
+"""
+Test ricerca clienti: le cifre trovano anche l'inizio del numero di telefono
+"""
+
+
+def _cerca(client, testo):
+    risposta = client.get("/api/dashboard/clienti", query_string={"ricerca": testo, "limite": 100})
+    assert risposta.status_code == 200
+    return {c["phone"] for c in risposta.get_json()["clienti"]}
+
+
+def test_ricerca_parziale_telefono(client):
+    for phone, nome in (("3478865210", "Giulia Bianchi"), ("3925550199", "Marco Verdi")):
+        assert client.post("/api/dashboard/clienti", json={"phone": phone, "nome": nome}).status_code == 201
+
+    # Inizio del numero nazionale, senza +39
+    assert _cerca(client, "347886") == {"+393478865210"}
+    assert _cerca(client, "347 886 5210") == {"+393478865210"}
+    # Solo l'inizio del numero (ricerca sull'indice del telefono)
+    assert _cerca(client, "8865210") == set()
+    # Numero intero, anche con +39 o 0039
+    assert _cerca(client, "+393925550199") == {"+393925550199"}
+    assert _cerca(client, "0039 392 5550199") == {"+393925550199"}
+    # Cifre nel telefono e nome nell'indice full-text
+    assert _cerca(client, "giulia 3478") == {"+393478865210"}
+    assert _cerca(client, "marco 3478") == set()
+    # Le parole restano prefissi nell'indice
+    assert _cerca(client, "bian") == {"+393478865210"}
+
+
+def test_ricerca_telefono_usa_indice(client):
+    from sqlalchemy import event
+    from database import engine
+
+    select_eseguite = []
+
+    def registra(conn, cursor, statement, parametri, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "clienti_fts" in statement:
+            select_eseguite.append((statement, parametri))
+
+    event.listen(engine, "before_cursor_execute", registra)
+    try:
+        _cerca(client, "347886")
+    finally:
+        event.remove(engine, "before_cursor_execute", registra)
+
+    assert select_eseguite
+    with engine.connect() as conn:
+        for statement, parametri in select_eseguite:
+            piano = " ".join(str(r[-1]) for r in conn.exec_driver_sql(
+                "EXPLAIN QUERY PLAN " + statement, parametri
+            )) + " "
+            assert "SCAN clienti " not in piano, piano
+            assert "ix_clienti_phone (phone>" in piano, piano
@@ -0,0 +1,61 @@
+"""
+Test lease dello scheduler: un solo leader, failover alla scadenza o al rilascio
+"""
+
+from datetime import datetime, timedelta
+
+from database import get_db_session, SchedulerLeaseDB
+from utils import scheduler
+
+
+def _lease():
+    db = get_db_session()
+    try:
+        lease = db.get(SchedulerLeaseDB, scheduler.NOME_LEASE)
+        return lease.proprietario, lease.acquisito_il
+    finally:
+        db.close()
+
+
+def _come(monkeypatch, proprietario):
+    """Il prossimo _rinnova_lease/_rilascia_lease gira come un altro processo"""
+    monkeypatch.setattr(scheduler, "PROPRIETARIO", proprietario)
+
+
+def test_lease_acquisizione_e_failover(monkeypatch):
+    # stop_scheduler (conftest) ha rilasciato il lease: lo prende il primo che lo chiede
+    _come(monkeypatch, "worker-a")
+    assert scheduler._rinnova_lease()
+    _, acquisito_il = _lease()
+
+    _come(monkeypatch, "worker-b")
+    assert not scheduler._rinnova_lease()
+
+    # Il rinnovo non cambia l'inizio della leadership
+    _come(monkeypatch, "worker-a")
+    assert scheduler._rinnova_lease()
+    assert _lease() == ("worker-a", acquisito_il)
+
+    # worker-a smette di rinnovare: alla scadenza subentra worker-b
+    db = get_db_session()
+    try:
+        db.get(SchedulerLeaseDB, scheduler.NOME_LEASE).scade_il = datetime.utcnow() - timedelta(seconds=1)
+        db.commit()
+    finally:
+        db.close()
+
+    _come(monkeypatch, "worker-b")
+    assert scheduler._rinnova_lease()
+    proprietario, acquisito_il_b = _lease()
+    assert proprietario == "worker-b"
+    assert acquisito_il_b > acquisito_il
+
+    _come(monkeypatch, "worker-a")
+    assert not scheduler._rinnova_lease()
+
+    # Spegnimento pulito: il failover non aspetta la scadenza
+    _come(monkeypatch, "worker-b")
+    scheduler._rilascia_lease()
+    _come(monkeypatch, "worker-a")
+    assert scheduler._rinnova_lease()
+    scheduler._rilascia_lease()
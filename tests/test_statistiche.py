@@ -0,0 +1,89 @@
+"""
+Test rollup statistiche: gli incrementi del webhook coincidono col ricalcolo
+dai dati grezzi, anche partendo dalla tabella vuota
+"""
+
+from datetime import date
+
+from database import get_db_session, StatisticaGiornalieraDB
+from utils.statistiche import (
+    oggi_locale, popola_statistiche_se_vuote, ricalcola_statistiche, somma_statistiche
+)
+
+
+def _messaggio(client, wa_id, testo):
+    risposta = client.post("/webhook", json={"entry": [{"changes": [{
+        "field": "messages",
+        "value": {
+            "contacts": [{"wa_id": wa_id, "profile": {"name": "Test Rollup"}}],
+            "messages": [{"text": {"body": testo}}],
+        },
+    }]}]})
+    assert risposta.status_code == 200
+
+
+def _righe_di_oggi():
+    db = get_db_session()
+    try:
+        return sorted(
+            (r.settore, r.messaggi_totali, r.messaggi_faq, r.messaggi_perplexity,
+             r.nuovi_clienti, r.clienti_attivi)
+            for r in db.query(StatisticaGiornalieraDB).filter(
+                StatisticaGiornalieraDB.giorno == oggi_locale()
+            )
+        )
+    finally:
+        db.close()
+
+
+def test_incrementi_uguali_al_ricalcolo(client, monkeypatch):
+    monkeypatch.delenv("PERPLEXITY_API_KEY", raising=False)
+    # Gli altri test scrivono messaggi direttamente, senza passare dal rollup
+    ricalcola_statistiche(oggi_locale())
+
+    for wa_id in ("393401230001", "393401230002"):
+        for testo in ("prima domanda di prova", "seconda domanda di prova"):
+            _messaggio(client, wa_id, testo)
+
+    incrementali = _righe_di_oggi()
+    assert incrementali
+
+    ricalcola_statistiche(oggi_locale())
+    assert _righe_di_oggi() == incrementali
+
+
+def test_popolamento_da_tabella_vuota(client, monkeypatch):
+    monkeypatch.delenv("PERPLEXITY_API_KEY", raising=False)
+    _messaggio(client, "393401230003", "domanda per il popolamento")
+    incrementali = _righe_di_oggi()
+
+    db = get_db_session()
+    try:
+        db.query(StatisticaGiornalieraDB).delete()
+        db.commit()
+    finally:
+        db.close()
+
+    assert popola_statistiche_se_vuote() > 0
+    assert _righe_di_oggi() == incrementali
+    # Già popolata: non rifà nulla
+    assert popola_statistiche_se_vuote() == 0
+
+
+def test_giorni_oltre_conservazione_non_azzerati():
+    vecchio = date(2001, 3, 15)  # messaggi già eliminati da task_pulizia_dati
+    db = get_db_session()
+    try:
+        db.add(StatisticaGiornalieraDB(giorno=vecchio, settore="generico",
+                                       messaggi_totali=7, clienti_attivi=2))
+        db.commit()
+    finally:
+        db.close()
+
+    ricalcola_statistiche(vecchio)
+
+    db = get_db_session()
+    try:
+        assert somma_statistiche(db, vecchio, vecchio)["messaggi_totali"] == 7
+    finally:
+        db.close()
@@ -2,74 +2,69 @@
 Analytics - Statistiche e report avanzati
 """
 
-from database import get_db_session, ClienteDB, MessaggioDB, FAQDB
-from datetime import datetime, timedelta
+from database import get_read_session, ClienteDB, MessaggioDB, FAQDB, StatisticaGiornalieraDB
+from utils.statistiche import somma_statistiche, oggi_locale, inizio_giorno_utc, FUSO_ORARIO
+from config import Config
+from datetime import date, datetime, timedelta, timezone
+import re
+import unicodedata
 from collections import Counter
-import statistics
+from sqlalchemy import Date, case, cast, func
 
 # ============================================================================
 # ANALYTICS AVANZATE
 # ============================================================================
 
 def get_analytics_dashboard():
-    """Ritorna statistiche complete per dashboard"""
+    """
+    Ritorna statistiche complete per dashboard
     
-    db = get_db_session()
+    Due sole query, indipendenti dal numero di clienti e messaggi:
+    1. clienti raggruppati per settore con conteggi condizionali
+       (SUM(CASE ...)) e somma dei messaggi per la media
+    2. rollup statistiche_giornaliere + conteggio FAQ
+    """
+    
+    db = get_read_session()
     
     try:
-        # CLIENTI
-        tot_clienti = db.query(ClienteDB).count()
-        clienti_attivi = db.query(ClienteDB).filter(
-            ClienteDB.stato == 'attivo'
-        ).count()
-        
-        # Ultimi 7 giorni
-        sette_giorni_fa = datetime.utcnow() - timedelta(days=7)
-        nuovi_clienti_settimana = db.query(ClienteDB).filter(
-            ClienteDB.data_creazione >= sette_giorni_fa
-        ).count()
-        
-        # Ultimi 30 giorni
         trenta_giorni_fa = datetime.utcnow() - timedelta(days=30)
-        clienti_inattivi = db.query(ClienteDB).filter(
-            ClienteDB.ultima_interazione < trenta_giorni_fa
-        ).count()
-        
-        # MESSAGGI
-        tot_messaggi = db.query(MessaggioDB).count()
-        messaggi_oggi = db.query(MessaggioDB).filter(
-            MessaggioDB.data_messaggio >= datetime.combine(
-                datetime.utcnow().date(),
-                datetime.min.time()
-            )
-        ).count()
+        oggi = oggi_locale()
+        inizio_settimana = oggi - timedelta(days=6)
         
-        messaggi_settimana = db.query(MessaggioDB).filter(
-            MessaggioDB.data_messaggio >= sette_giorni_fa
-        ).count()
+        # CLIENTI - una riga per settore
+        settori = db.query(
+            ClienteDB.settore,
+            func.count(ClienteDB.id),
+            func.sum(case((ClienteDB.stato == 'attivo', 1), else_=0)),
+            func.sum(case((ClienteDB.ultima_interazione < trenta_giorni_fa, 1), else_=0)),
+            func.sum(func.coalesce(ClienteDB.numero_messaggi, 0)),
+        ).group_by(ClienteDB.settore).all()
         
-        # Tipo di risposta (FAQ vs Perplexity)
-        faq_count = db.query(MessaggioDB).filter(
-            MessaggioDB.tipo_risposta == 'faq'
-        ).count()
-        perplexity_count = db.query(MessaggioDB).filter(
-            MessaggioDB.tipo_risposta == 'perplexity'
-        ).count()
+        tot_clienti = sum(s[1] for s in settori)
+        clienti_attivi = sum(s[2] or 0 for s in settori)
+        clienti_inattivi = sum(s[3] or 0 for s in settori)
+        somma_msg = sum(s[4] or 0 for s in settori)
+        media_msg = somma_msg / tot_clienti if tot_clienti else 0
         
-        # FAQ
-        tot_faq = db.query(FAQDB).count()
+        distribuzione_settori = Counter()
+        for s in settori:
+            distribuzione_settori[s[0] if s[0] else "generico"] += s[1]
         
-        # Settore clienti (distribuzione)
-        settori = db.query(ClienteDB.settore, func.count(ClienteDB.id)).group_by(
-            ClienteDB.settore
-        ).all()
+        # MESSAGGI, NUOVI CLIENTI E FAQ - dal rollup giornaliero (costo costante)
+        stat = StatisticaGiornalieraDB
+        messaggi = db.query(
+            func.coalesce(func.sum(stat.messaggi_totali), 0),
+            func.coalesce(func.sum(case((stat.giorno >= oggi, stat.messaggi_totali), else_=0)), 0),
+            func.coalesce(func.sum(case((stat.giorno >= inizio_settimana, stat.messaggi_totali), else_=0)), 0),
+            func.coalesce(func.sum(stat.messaggi_faq), 0),
+            func.coalesce(func.sum(stat.messaggi_perplexity), 0),
+            func.coalesce(func.sum(case((stat.giorno >= inizio_settimana, stat.nuovi_clienti), else_=0)), 0),
+            db.query(func.count(FAQDB.id)).scalar_subquery(),
+        ).one()
         
-        # Media messaggi per cliente
-        tutti_clienti = db.query(ClienteDB).all()
-        if tutti_clienti:
-            media_msg = statistics.mean([c.numero_messaggi for c in tutti_clienti])
-        else:
-            media_msg = 0
+        (tot_messaggi, messaggi_oggi, messaggi_settimana,
+         faq_count, perplexity_count, nuovi_clienti_settimana, tot_faq) = (int(v) for v in messaggi)
         
         return {
             "clienti": {
@@ -90,10 +85,7 @@ def get_analytics_dashboard():
             "faq": {
                 "totali": tot_faq,
             },
-            "settori": {
-                s[0] if s[0] else "generico": s[1]
-                for s in settori
-            },
+            "settori": dict(distribuzione_settori),
             "timestamp": datetime.now().isoformat()
         }
     
@@ -104,22 +96,20 @@ def get_analytics_dashboard():
 def get_report_giornaliero():
     """Report giornaliero"""
     
-    db = get_db_session()
+    db = get_read_session()
     
     try:
-        oggi = datetime.utcnow().date()
+        oggi = oggi_locale()
         
-        messaggi_oggi = db.query(MessaggioDB).filter(
-            MessaggioDB.data_messaggio >= datetime.combine(oggi, datetime.min.time())
-        ).all()
+        stat_oggi = somma_statistiche(db, giorno_da=oggi)
         
         nuovi_clienti = db.query(ClienteDB).filter(
-            ClienteDB.data_creazione >= datetime.combine(oggi, datetime.min.time())
+            ClienteDB.data_creazione >= inizio_giorno_utc(oggi)
         ).all()
         
         return {
             "data": oggi.isoformat(),
-            "messaggi_totali": len(messaggi_oggi),
+            "messaggi_totali": stat_oggi["messaggi_totali"],
             "nuovi_clienti": len(nuovi_clienti),
             "clienti": [c.nome for c in nuovi_clienti],
             "timestamp": datetime.now().isoformat()
@@ -132,18 +122,15 @@ def get_report_giornaliero():
 def get_report_mensile():
     """Report mensile"""
     
-    db = get_db_session()
+    db = get_read_session()
     
     try:
         trenta_giorni_fa = datetime.utcnow() - timedelta(days=30)
         
-        messaggi_mese = db.query(MessaggioDB).filter(
-            MessaggioDB.data_messaggio >= trenta_giorni_fa
-        ).count()
-        
-        nuovi_clienti_mese = db.query(ClienteDB).filter(
-            ClienteDB.data_creazione >= trenta_giorni_fa
-        ).count()
+        # Ultimi 30 giorni locali (oggi compreso) dal rollup
+        stat_mese = somma_statistiche(db, giorno_da=oggi_locale() - timedelta(days=29))
+        messaggi_mese = stat_mese["messaggi_totali"]
+        nuovi_clienti_mese = stat_mese["nuovi_clienti"]
         
         clienti_attivi_mese = db.query(ClienteDB).filter(
             ClienteDB.ultima_interazione >= trenta_giorni_fa,
@@ -162,5 +149,413 @@ def get_report_mensile():
         db.close()
 
 
-# Importa func per le query
-from sqlalchemy import func
+# ============================================================================
+# SERIE TEMPORALI
+# ============================================================================
+
+METRICHE_SERIE = (
+    "messaggi_totali", "messaggi_faq", "messaggi_perplexity",
+    "nuovi_clienti", "clienti_attivi"
+)
+
+# Ampiezza massima dell'intervallo per granularità (in giorni)
+MAX_GIORNI_SERIE = {"hour": 31, "day": 366, "week": 731}
+
+
+def get_serie_temporale(metrica, giorno_da, giorno_a, bucket="day", settore=None):
+    """
+    Serie temporale densa di una metrica, pronta per i grafici.
+    
+    giorno_da, giorno_a: date locali (Europe/Rome), estremi inclusi.
+    bucket: "hour", "day" o "week" (settimane da lunedì).
+    
+    day e week leggono il rollup statistiche_giornaliere; hour (e i clienti
+    attivi per settimana, che non si possono sommare dai giorni) vengono
+    dai dati grezzi. I bucket senza dati valgono 0.
+    
+    Solleva ValueError per parametri non validi.
+    """
+    if metrica not in METRICHE_SERIE:
+        raise ValueError(f"Metrica non valida: {metrica} (ammesse: {', '.join(METRICHE_SERIE)})")
+    if bucket not in MAX_GIORNI_SERIE:
+        raise ValueError(f"Bucket non valido: {bucket} (ammessi: hour, day, week)")
+    if giorno_da > giorno_a:
+        raise ValueError("'from' deve precedere 'to'")
+    if (giorno_a - giorno_da).days + 1 > MAX_GIORNI_SERIE[bucket]:
+        raise ValueError(f"Intervallo troppo ampio per bucket={bucket} (max {MAX_GIORNI_SERIE[bucket]} giorni)")
+    
+    db = get_read_session()
+    
+    try:
+        if bucket == "hour":
+            etichette, valori = _serie_oraria(db, metrica, giorno_da, giorno_a, settore)
+        elif bucket == "week" and metrica == "clienti_attivi":
+            etichette, valori = _serie_settimanale_attivi(db, giorno_da, giorno_a, settore)
+        else:
+            etichette, valori = _serie_rollup(db, metrica, giorno_da, giorno_a, bucket, settore)
+        
+        return {
+            "metric": metrica,
+            "bucket": bucket,
+            "from": giorno_da.isoformat(),
+            "to": giorno_a.isoformat(),
+            "settore": settore or None,
+            "timezone": str(FUSO_ORARIO),
+            "labels": etichette,
+            "values": valori,
+            "totale": sum(valori),
+        }
+    
+    finally:
+        db.close()
+
+
+def _lunedi(giorno):
+    return giorno - timedelta(days=giorno.weekday())
+
+
+def _come_data(valore):
+    """Il bucket SQL torna come stringa su SQLite, come date/datetime su PostgreSQL"""
+    if isinstance(valore, str):
+        return date.fromisoformat(valore[:10])
+    if isinstance(valore, datetime):
+        return valore.date()
+    return valore
+
+
+def _serie_rollup(db, metrica, giorno_da, giorno_a, bucket, settore):
+    """Giorni o settimane dal rollup, raggruppati in SQL"""
+    stat = StatisticaGiornalieraDB
+    dialetto = db.get_bind().dialect.name
+    
+    if bucket == "day":
+        chiave = stat.giorno
+        inizi = [giorno_da + timedelta(days=i) for i in range((giorno_a - giorno_da).days + 1)]
+    else:
+        if dialetto == "sqlite":
+            chiave = func.date(stat.giorno, "-6 days", "weekday 1")
+        elif dialetto == "postgresql":
+            chiave = cast(func.date_trunc("week", stat.giorno), Date)
+        else:
+            chiave = stat.giorno  # raggruppato per settimana qui sotto
+        primo = _lunedi(giorno_da)
+        inizi = [primo + timedelta(weeks=i) for i in range((giorno_a - primo).days // 7 + 1)]
+    
+    query = db.query(
+        chiave, func.coalesce(func.sum(getattr(stat, metrica)), 0)
+    ).filter(
+        stat.giorno >= giorno_da,
+        stat.giorno <= giorno_a
+    )
+    if settore:
+        query = query.filter(stat.settore == settore)
+    
+    somme = Counter()
+    for giorno, totale in query.group_by(chiave).all():
+        giorno = _come_data(giorno)
+        somme[_lunedi(giorno) if bucket == "week" else giorno] += int(totale)
+    
+    return [g.isoformat() for g in inizi], [somme[g] for g in inizi]
+
+
+def _filtri_grezzi(query, metrica, settore):
+    """Filtri comuni alle query sui dati grezzi"""
+    if metrica == "messaggi_faq":
+        query = query.filter(MessaggioDB.tipo_risposta == "faq")
+    elif metrica == "messaggi_perplexity":
+        query = query.filter(MessaggioDB.tipo_risposta == "perplexity")
+    
+    if settore:
+        settore_cliente = func.coalesce(func.nullif(ClienteDB.settore, ""), "generico")
+        if metrica != "nuovi_clienti":
+            query = query.outerjoin(ClienteDB, ClienteDB.id == MessaggioDB.cliente_id)
+        query = query.filter(settore_cliente == settore)
+    
+    return query
+
+
+def _serie_oraria(db, metrica, giorno_da, giorno_a, settore):
+    """
+    Ore locali dai dati grezzi.
+    
+    Il DB raggruppa per ora UTC; ogni ora UTC corrisponde a una sola ora
+    locale (gli scarti di Europe/Rome sono ore intere), quindi i giorni del
+    cambio d'ora hanno 23 o 25 bucket.
+    """
+    inizio = inizio_giorno_utc(giorno_da)
+    fine = inizio_giorno_utc(giorno_a + timedelta(days=1))
+    
+    if metrica == "nuovi_clienti":
+        colonna_data, valore = ClienteDB.data_creazione, func.count(ClienteDB.id)
+    elif metrica == "clienti_attivi":
+        colonna_data, valore = MessaggioDB.data_messaggio, func.count(func.distinct(MessaggioDB.cliente_id))
+    else:
+        colonna_data, valore = MessaggioDB.data_messaggio, func.count(MessaggioDB.id)
+    
+    if db.get_bind().dialect.name == "postgresql":
+        chiave = func.date_trunc("hour", colonna_data)
+    else:
+        chiave = func.strftime("%Y-%m-%d %H:00:00", colonna_data)
+    
+    query = _filtri_grezzi(
+        db.query(chiave, valore).filter(colonna_data >= inizio, colonna_data < fine),
+        metrica, settore
+    )
+    
+    conteggi = {}
+    for ora, numero in query.group_by(chiave).all():
+        if isinstance(ora, str):
+            ora = datetime.fromisoformat(ora)
+        conteggi[ora.replace(tzinfo=None)] = int(numero)
+    
+    etichette, valori = [], []
+    ora = inizio
+    while ora < fine:
+        locale = ora.replace(tzinfo=timezone.utc).astimezone(FUSO_ORARIO)
+        etichette.append(locale.isoformat())
+        valori.append(conteggi.get(ora, 0))
+        ora += timedelta(hours=1)
+    
+    return etichette, valori
+
+
+def _serie_settimanale_attivi(db, giorno_da, giorno_a, settore):
+    """Clienti distinti per settimana locale dai messaggi (un CASE per assegnare la settimana)"""
+    primo = _lunedi(giorno_da)
+    inizi = [primo + timedelta(weeks=i) for i in range((giorno_a - primo).days // 7 + 1)]
+    limiti = [inizio_giorno_utc(max(g, giorno_da)) for g in inizi]
+    fine = inizio_giorno_utc(giorno_a + timedelta(days=1))
+    
+    def conta(*gruppo):
+        return _filtri_grezzi(
+            db.query(*gruppo, func.count(func.distinct(MessaggioDB.cliente_id))).filter(
+                MessaggioDB.data_messaggio >= limiti[0],
+                MessaggioDB.data_messaggio < fine
+            ),
+            "clienti_attivi", settore
+        )
+    
+    if len(limiti) == 1:
+        conteggi = {0: conta().scalar()}
+    else:
+        settimana = case(
+            *[(MessaggioDB.data_messaggio < limite, i - 1) for i, limite in enumerate(limiti[1:], 1)],
+            else_=len(limiti) - 1
+        )
+        conteggi = dict(conta(settimana).group_by(settimana).all())
+    return [g.isoformat() for g in inizi], [int(conteggi.get(i, 0)) for i in range(len(inizi))]
+
+
+# ============================================================================
+# LATENZA RISPOSTE
+# ============================================================================
+
+PERCENTILI_LATENZA = (50, 90, 99)
+
+# Fasi della pipeline del webhook: (nome, inizio, fine)
+FASI_LATENZA = (
+    ("totale", MessaggioDB.ricevuto_il, MessaggioDB.inviato_il),
+    ("abbinamento", MessaggioDB.ricevuto_il, MessaggioDB.abbinato_il),
+    ("llm", MessaggioDB.abbinato_il, MessaggioDB.llm_completato_il),
+    ("invio", func.coalesce(MessaggioDB.llm_completato_il, MessaggioDB.abbinato_il), MessaggioDB.inviato_il),
+)
+
+MAX_GIORNI_LATENZA = 31
+
+
+def _durata_ms(dialetto, inizio, fine):
+    """Differenza fine - inizio in millisecondi, calcolata dal database"""
+    if dialetto == "postgresql":
+        return func.extract("epoch", fine - inizio) * 1000
+    return (func.julianday(fine) - func.julianday(inizio)) * 86400000.0
+
+
+def _percentile(valori_ordinati, p):
+    """Percentile con interpolazione lineare (come percentile_cont di PostgreSQL)"""
+    posizione = (len(valori_ordinati) - 1) * p / 100
+    sotto = int(posizione)
+    sopra = min(sotto + 1, len(valori_ordinati) - 1)
+    return valori_ordinati[sotto] + (valori_ordinati[sopra] - valori_ordinati[sotto]) * (posizione - sotto)
+
+
+def _riassunto_latenze(durate):
+    """{fase: {n, p50, p90, p99}} per un gruppo di messaggi"""
+    riassunto = {}
+    for fase, valori in durate.items():
+        valori = sorted(v for v in valori if v is not None)
+        if not valori:
+            continue
+        riassunto[fase] = {"n": len(valori)}
+        for p in PERCENTILI_LATENZA:
+            riassunto[fase][f"p{p}"] = round(_percentile(valori, p), 1)
+    return riassunto
+
+
+def get_latenze(giorno_da, giorno_a):
+    """
+    Percentili di latenza (ms) end-to-end e per fase, nei giorni locali indicati.
+    
+    Le durate sono calcolate in SQL riga per riga; i percentili su una
+    passata ordinata per gruppo (complessivo, per tipo_risposta, per settore).
+    Contano solo i messaggi con i tempi registrati.
+    
+    Solleva ValueError per intervalli non validi.
+    """
+    if giorno_da > giorno_a:
+        raise ValueError("'from' deve precedere 'to'")
+    if (giorno_a - giorno_da).days + 1 > MAX_GIORNI_LATENZA:
+        raise ValueError(f"Intervallo troppo ampio (max {MAX_GIORNI_LATENZA} giorni)")
+    
+    db = get_read_session()
+    
+    try:
+        dialetto = db.get_bind().dialect.name
+        settore = func.coalesce(func.nullif(ClienteDB.settore, ""), "generico")
+        
+        righe = db.query(
+            MessaggioDB.tipo_risposta,
+            settore,
+            *[_durata_ms(dialetto, inizio, fine) for _, inizio, fine in FASI_LATENZA]
+        ).outerjoin(
+            ClienteDB, ClienteDB.id == MessaggioDB.cliente_id
+        ).filter(
+            MessaggioDB.ricevuto_il.isnot(None),
+            MessaggioDB.data_messaggio >= inizio_giorno_utc(giorno_da),
+            MessaggioDB.data_messaggio < inizio_giorno_utc(giorno_a + timedelta(days=1))
+        ).yield_per(5000)
+        
+        fasi = [nome for nome, _, _ in FASI_LATENZA]
+        totale = {fase: [] for fase in fasi}
+        per_tipo, per_settore = {}, {}
+        
+        for tipo, settore_cliente, *durate in righe:
+            gruppi = (
+                totale,
+                per_tipo.setdefault(tipo or "sconosciuto", {fase: [] for fase in fasi}),
+                per_settore.setdefault(settore_cliente, {fase: [] for fase in fasi}),
+            )
+            for fase, durata in zip(fasi, durate):
+                for gruppo in gruppi:
+                    gruppo[fase].append(durata)
+        
+        return {
+            "from": giorno_da.isoformat(),
+            "to": giorno_a.isoformat(),
+            "unita": "ms",
+            "totale": _riassunto_latenze(totale),
+            "per_tipo": {tipo: _riassunto_latenze(d) for tipo, d in per_tipo.items()},
+            "per_settore": {s: _riassunto_latenze(d) for s, d in per_settore.items()},
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    finally:
+        db.close()
+
+
+# ============================================================================
+# EFFICACIA FAQ
+# ============================================================================
+
+MAX_GIORNI_FAQ = 366
+
+
+def normalizza_domanda(testo):
+    """
+    Forma canonica di una domanda per raggrupparle:
+    minuscolo, senza accenti, punteggiatura e spazi multipli.
+    """
+    testo = unicodedata.normalize("NFKD", (testo or "").lower())
+    testo = "".join(c for c in testo if not unicodedata.combining(c))
+    testo = re.sub(r"[^\w\s]", " ", testo)
+    return " ".join(testo.split())
+
+
+def get_efficacia_faq(giorno_da, giorno_a, limite=20):
+    """
+    Quanto lavorano le FAQ nei giorni locali indicati.
+    
+    - faq: tutte le FAQ ordinate per risposte date (hit), con i quasi match
+      (risposte andate a Perplexity con score entro Config.FAQ_NEAR_MISS_MARGINE
+      dalla soglia) e lo score medio dei match
+    - non_abbinate: le domande più frequenti finite a Perplexity,
+      raggruppate per testo normalizzato
+    
+    Solleva ValueError per intervalli non validi.
+    """
+    if giorno_da > giorno_a:
+        raise ValueError("'from' deve precedere 'to'")
+    if (giorno_a - giorno_da).days + 1 > MAX_GIORNI_FAQ:
+        raise ValueError(f"Intervallo troppo ampio (max {MAX_GIORNI_FAQ} giorni)")
+    
+    db = get_read_session()
+    
+    try:
+        inizio = inizio_giorno_utc(giorno_da)
+        fine = inizio_giorno_utc(giorno_a + timedelta(days=1))
+        soglia_quasi = Config.FUZZY_MATCH_THRESHOLD - Config.FAQ_NEAR_MISS_MARGINE
+        
+        # Una query: aggregato per faq_id, poi unito a tutte le FAQ (anche mai usate)
+        per_faq = db.query(
+            MessaggioDB.faq_id.label("faq_id"),
+            func.sum(case((MessaggioDB.tipo_risposta == "faq", 1), else_=0)).label("hit"),
+            func.sum(case(
+                ((MessaggioDB.tipo_risposta == "perplexity") & (MessaggioDB.match_score >= soglia_quasi), 1),
+                else_=0
+            )).label("quasi"),
+            func.avg(case((MessaggioDB.tipo_risposta == "faq", MessaggioDB.match_score))).label("score_medio"),
+        ).filter(
+            MessaggioDB.faq_id.isnot(None),
+            MessaggioDB.data_messaggio >= inizio,
+            MessaggioDB.data_messaggio < fine
+        ).group_by(MessaggioDB.faq_id).subquery()
+        
+        hit = func.coalesce(per_faq.c.hit, 0)
+        classifica = db.query(
+            FAQDB.id, FAQDB.domanda_completa, FAQDB.settore,
+            hit, func.coalesce(per_faq.c.quasi, 0), per_faq.c.score_medio
+        ).outerjoin(
+            per_faq, per_faq.c.faq_id == FAQDB.id
+        ).order_by(hit.desc(), FAQDB.id).all()
+        
+        # Domande senza match: passata in streaming sui soli testi
+        gruppi = Counter()
+        esempi = {}
+        testi = db.query(MessaggioDB.testo_cliente).filter(
+            MessaggioDB.tipo_risposta == "perplexity",
+            MessaggioDB.data_messaggio >= inizio,
+            MessaggioDB.data_messaggio < fine
+        ).yield_per(5000)
+        
+        for (testo,) in testi:
+            chiave = normalizza_domanda(testo)
+            if not chiave:
+                continue
+            gruppi[chiave] += 1
+            esempi.setdefault(chiave, testo)
+        
+        return {
+            "from": giorno_da.isoformat(),
+            "to": giorno_a.isoformat(),
+            "soglia_match": Config.FUZZY_MATCH_THRESHOLD,
+            "soglia_quasi_match": soglia_quasi,
+            "faq": [
+                {
+                    "id": faq_id,
+                    "domanda": domanda,
+                    "settore": settore,
+                    "hit": int(n_hit),
+                    "quasi_match": int(n_quasi),
+                    "score_medio": round(float(score), 1) if score is not None else None,
+                }
+                for faq_id, domanda, settore, n_hit, n_quasi, score in classifica
+            ],
+            "non_abbinate": [
+                {"domanda": esempi[chiave], "normalizzata": chiave, "conteggio": numero}
+                for chiave, numero in gruppi.most_common(limite)
+            ],
+            "non_abbinate_totali": sum(gruppi.values()),
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    finally:
+        db.close()
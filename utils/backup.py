@@ -0,0 +1,921 @@
+"""
+Backup - Dump del database in NDJSON compresso, scritto in streaming
+
+Formato (una riga JSON per record):
+    {"tipo": "header", "formato": "whatsapp-bot-backup", "versione": 1, ...}
+    {"tipo": "sezione", "tabella": "clienti", "colonne": ["id", "phone", ...]}
+    [1, "+393331234567", ...]          <- una riga della tabella (lista nell'ordine di "colonne")
+    ...
+    {"tipo": "fine_sezione", "tabella": "clienti", "righe": 1234}
+    ...
+    {"tipo": "footer", "conteggi": {"clienti": 1234, ...}}
+
+Il footer manca solo se il file è troncato. Compressione gzip (default)
+o zstd se è installato il pacchetto zstandard.
+
+Backup incrementali: l'header contiene la "marca" (id massimo e istante
+per tabella) e il file precedente della catena; vengono salvate solo le
+righe nuove o modificate dopo la marca precedente. Le sezioni hanno una
+"modalita" che dice al ripristino come applicarle:
+    - inserisci: tabella vuota, solo INSERT (backup completo)
+    - aggiorna: upsert sulla chiave primaria
+    - sostituisci: dopo un record "chiavi" (valori da cancellare), solo INSERT
+    - id_presenti: intervalli [da, a] degli id ancora esistenti (per le cancellazioni)
+Lo stato della catena è in Config.BACKUP_DIR/stato_backup.json.
+"""
+
+import gzip
+import io
+import json
+import os
+import threading
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from sqlalchemy import Date, DateTime, delete, func, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from config import Config
+from database import Base, engine, read_engine
+from utils.statistiche import giorno_locale
+
+FORMATO_BACKUP = "whatsapp-bot-backup"
+VERSIONE_BACKUP = 1
+FILE_STATO = "stato_backup.json"
+
+# Righe lette (e scritte nel ripristino) per volta
+RIGHE_PER_BLOCCO = 1000
+
+# Le modifiche vengono cercate da qualche minuto prima della marca: una
+# transazione iniziata prima del backup può fare commit dopo. I duplicati
+# non sono un problema, il ripristino fa upsert.
+MARGINE_MODIFICHE = timedelta(minutes=5)
+
+# Tabelle di lavoro del processo (lease dello scheduler, job di import):
+# non sono dati e non vanno né salvate né ripristinate
+TABELLE_OPERATIVE = ("scheduler_lease", "import_jobs")
+
+
+# ============================================================================
+# FILE COMPRESSI
+# ============================================================================
+
+def apri_compresso(percorso, modo="rt", grezzo=None):
+    """
+    Apre un file .gz / .zst (o non compresso) in modo testo utf-8.
+
+    grezzo: file binario già aperto da usare (la compressione si deduce
+    comunque da percorso). Solleva RuntimeError se serve zstd e il
+    pacchetto non è installato.
+    """
+    scrittura = "w" in modo
+
+    if percorso.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("Per i backup .zst installa il pacchetto zstandard")
+
+        grezzo = grezzo or open(percorso, "wb" if scrittura else "rb")
+        if scrittura:
+            flusso = zstandard.ZstdCompressor().stream_writer(grezzo, closefd=True)
+        else:
+            flusso = zstandard.ZstdDecompressor().stream_reader(grezzo, closefd=True)
+        return io.TextIOWrapper(flusso, encoding="utf-8")
+
+    if percorso.endswith(".gz"):
+        if grezzo:
+            return io.TextIOWrapper(gzip.GzipFile(fileobj=grezzo, mode=modo.replace("t", "")), encoding="utf-8")
+        return gzip.open(percorso, modo, encoding="utf-8")
+
+    if grezzo:
+        return io.TextIOWrapper(grezzo, encoding="utf-8")
+    return open(percorso, modo, encoding="utf-8")
+
+
+def _estensione():
+    return ".ndjson.zst" if Config.BACKUP_COMPRESSIONE == "zstd" else ".ndjson.gz"
+
+
+def _valore_json(valore):
+    if isinstance(valore, (datetime, date)):
+        return valore.isoformat()
+    return valore
+
+
+def _riga_json(oggetto):
+    return json.dumps(oggetto, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def _tabelle_backup():
+    """Tabelle salvate, nell'ordine delle foreign key (prima le referenziate)"""
+    return [t for t in Base.metadata.sorted_tables if t.name not in TABELLE_OPERATIVE]
+
+
+# ============================================================================
+# STATO DELLA CATENA
+# ============================================================================
+
+def leggi_stato(cartella=None):
+    """Stato dell'ultima catena di backup (None se non c'è un backup completo)"""
+    percorso = os.path.join(cartella or Config.BACKUP_DIR, FILE_STATO)
+    if not os.path.exists(percorso):
+        return None
+    with open(percorso, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _salva_stato(cartella, stato):
+    percorso = os.path.join(cartella, FILE_STATO)
+    with open(percorso + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(stato, f, indent=2)
+    os.replace(percorso + ".tmp", percorso)
+
+
+def _calcola_marca(conn, adesso):
+    """Id massimo per tabella e istante del backup"""
+    marca = {}
+    for tabella in _tabelle_backup():
+        voce = {"timestamp": adesso.isoformat()}
+        if "id" in tabella.c:
+            voce["max_id"] = conn.execute(select(func.max(tabella.c.id))).scalar() or 0
+        marca[tabella.name] = voce
+    return marca
+
+
+# ============================================================================
+# SCRITTURA
+# ============================================================================
+
+def scrivi_sezione(file, conn, tabella, filtro=None, modalita="inserisci", chiave=None):
+    """Scrive una sezione della tabella, leggendo le righe a blocchi. Ritorna il numero di righe"""
+    colonne = [c.name for c in tabella.columns]
+    sezione = {"tipo": "sezione", "tabella": tabella.name, "colonne": colonne, "modalita": modalita}
+    if chiave:
+        sezione["chiave"] = chiave
+    file.write(_riga_json(sezione))
+
+    query = select(tabella)
+    if filtro is not None:
+        query = query.where(filtro)
+    if tabella.primary_key.columns:
+        query = query.order_by(*tabella.primary_key.columns)
+
+    righe = 0
+    risultato = conn.execution_options(yield_per=RIGHE_PER_BLOCCO).execute(query)
+    for riga in risultato:
+        file.write(_riga_json([_valore_json(v) for v in riga]))
+        righe += 1
+
+    file.write(_riga_json({"tipo": "fine_sezione", "tabella": tabella.name, "righe": righe}))
+    return righe
+
+
+def scrivi_id_presenti(file, conn, tabella):
+    """Intervalli [da, a] degli id esistenti: il ripristino cancella quelli mancanti"""
+    file.write(_riga_json({"tipo": "sezione", "tabella": tabella.name, "modalita": "id_presenti"}))
+
+    intervalli = 0
+    inizio = fine = None
+    risultato = conn.execution_options(yield_per=RIGHE_PER_BLOCCO * 10).execute(
+        select(tabella.c.id).order_by(tabella.c.id)
+    )
+    for (id_riga,) in risultato:
+        if fine is not None and id_riga == fine + 1:
+            fine = id_riga
+            continue
+        if inizio is not None:
+            file.write(_riga_json([inizio, fine]))
+            intervalli += 1
+        inizio = fine = id_riga
+
+    if inizio is not None:
+        file.write(_riga_json([inizio, fine]))
+        intervalli += 1
+
+    file.write(_riga_json({"tipo": "fine_sezione", "tabella": tabella.name, "righe": intervalli}))
+
+
+def scrivi_chiavi(file, conn, tabella, chiave, valori):
+    """
+    Valori della chiave da sostituire (precede una sezione "sostituisci"):
+    il ripristino cancella le righe con questi valori, anche quelle che
+    nel frattempo sono sparite dall'origine.
+    """
+    file.write(_riga_json({"tipo": "chiavi", "tabella": tabella.name, "chiave": chiave}))
+    for (valore,) in conn.execution_options(yield_per=RIGHE_PER_BLOCCO).execute(valori):
+        file.write(_riga_json([_valore_json(valore)]))
+    file.write(_riga_json({"tipo": "fine_sezione", "tabella": tabella.name}))
+
+
+def _scrivi_incrementale(file, conn, marca_precedente):
+    """
+    Sezioni del backup incrementale, tabella per tabella:
+    - clienti, faq: nuovi o modificati (id / data_modifica) + id_presenti
+    - tag: solo nuovi (non vengono modificati)
+    - messaggi: nuovi + id_presenti (la pulizia dello scheduler cancella i
+      vecchi). I cliente_id/faq_id riscritti da migrazioni e sincronizzazione
+      FAQ non hanno una data: dopo questi script serve un backup completo
+    - messaggi_outbound: nuovi o inviati dopo la marca (id / inviato_il);
+      le righe dei clienti cancellati spariscono con id_presenti di clienti
+    - cliente_tag: tutte le etichette dei clienti modificati
+    - statistiche_giornaliere: i giorni dalla marca precedente in poi
+      (il rollup di oggi cambia a ogni messaggio)
+    - users, catalogo_faq: tutta la tabella (poche righe)
+    Le TABELLE_OPERATIVE non vengono salvate.
+    """
+    tabelle = Base.metadata.tables
+    conteggi = {}
+
+    def dati_marca(nome):
+        # Tabella nuova rispetto alla marca: tutte le righe
+        voce = marca_precedente.get(nome) or {"timestamp": marca_precedente["clienti"]["timestamp"]}
+        return voce.get("max_id", 0), datetime.fromisoformat(voce["timestamp"]) - MARGINE_MODIFICHE
+
+    filtri_modificati = {}
+    for nome in ("clienti", "faq"):
+        tabella = tabelle[nome]
+        max_id, da = dati_marca(nome)
+        filtri_modificati[nome] = (tabella.c.id > max_id) | (tabella.c.data_modifica > da)
+
+    outbound = tabelle["messaggi_outbound"]
+    max_id, da = dati_marca("messaggi_outbound")
+    filtri_modificati["messaggi_outbound"] = (outbound.c.id > max_id) | (outbound.c.inviato_il > da)
+
+    for tabella in _tabelle_backup():
+        nome = tabella.name
+
+        if nome in ("clienti", "faq"):
+            conteggi[nome] = scrivi_sezione(file, conn, tabella, filtri_modificati[nome], "aggiorna")
+            scrivi_id_presenti(file, conn, tabella)
+        elif nome == "messaggi_outbound":
+            conteggi[nome] = scrivi_sezione(file, conn, tabella, filtri_modificati[nome], "aggiorna")
+        elif nome in ("tag", "messaggi"):
+            max_id, _ = dati_marca(nome)
+            conteggi[nome] = scrivi_sezione(file, conn, tabella, tabella.c.id > max_id, "aggiorna")
+            if nome == "messaggi":
+                scrivi_id_presenti(file, conn, tabella)
+        elif nome == "cliente_tag":
+            clienti = tabelle["clienti"]
+            modificati = select(clienti.c.id).where(filtri_modificati["clienti"])
+            # Tutti i clienti modificati, anche quelli che ora non hanno etichette
+            scrivi_chiavi(file, conn, tabella, "cliente_id", modificati)
+            conteggi[nome] = scrivi_sezione(
+                file, conn, tabella, tabella.c.cliente_id.in_(modificati), "sostituisci", "cliente_id"
+            )
+        elif nome == "statistiche_giornaliere":
+            _, da = dati_marca(nome)
+            recenti = tabella.c.giorno >= giorno_locale(da) - timedelta(days=1)
+            scrivi_chiavi(file, conn, tabella, "giorno", select(tabella.c.giorno).where(recenti).distinct())
+            conteggi[nome] = scrivi_sezione(file, conn, tabella, recenti, "sostituisci", "giorno")
+        else:
+            # users
+            conteggi[nome] = scrivi_sezione(file, conn, tabella, None, "aggiorna")
+
+    return conteggi
+
+
+def esegui_backup(cartella=None, incrementale=False):
+    """
+    Backup in cartella (default Config.BACKUP_DIR).
+
+    incrementale=True salva solo le modifiche dall'ultimo backup della
+    catena; se non esiste ancora un backup completo ne fa uno completo.
+
+    Il file viene scritto come .parziale_* e rinominato solo a fine scrittura:
+    un backup interrotto non viene mai scambiato per uno valido.
+
+    Ritorna (percorso, filename, conteggi per tabella).
+    """
+    cartella = cartella or Config.BACKUP_DIR
+    os.makedirs(cartella, exist_ok=True)
+
+    stato = leggi_stato(cartella) if incrementale else None
+    if stato and not os.path.exists(os.path.join(cartella, stato["ultimo"])):
+        print(f"⚠️  Ultimo backup {stato['ultimo']} non trovato: eseguo un backup completo")
+        stato = None
+    incrementale = stato is not None
+
+    adesso = datetime.utcnow()
+    modalita = "incrementale" if incrementale else "completo"
+    sequenza = stato["sequenza"] + 1 if incrementale else 0
+    filename = f"backup_{modalita}_{adesso.strftime('%Y%m%d_%H%M%S')}_{sequenza:04d}{_estensione()}"
+    percorso = os.path.join(cartella, filename)
+    temporaneo = os.path.join(cartella, f".parziale_{filename}")  # stessa estensione = stessa compressione
+
+    try:
+        with read_engine.connect() as conn, apri_compresso(temporaneo, "wt") as file:
+            marca = _calcola_marca(conn, adesso)
+            header = {
+                "tipo": "header",
+                "formato": FORMATO_BACKUP,
+                "versione": VERSIONE_BACKUP,
+                "modalita": modalita,
+                "creato_il": adesso.isoformat(),
+                "tabelle": [t.name for t in _tabelle_backup()],
+                "marca": marca,
+            }
+            if incrementale:
+                header.update({
+                    "base": stato["base"],
+                    "precedente": stato["ultimo"],
+                    "sequenza": sequenza,
+                })
+            file.write(_riga_json(header))
+
+            if incrementale:
+                conteggi = _scrivi_incrementale(file, conn, stato["marca"])
+            else:
+                # sorted_tables: prima le tabelle referenziate dalle foreign key
+                conteggi = {
+                    tabella.name: scrivi_sezione(file, conn, tabella)
+                    for tabella in _tabelle_backup()
+                }
+
+            file.write(_riga_json({"tipo": "footer", "conteggi": conteggi}))
+
+        os.replace(temporaneo, percorso)
+
+    except Exception:
+        if os.path.exists(temporaneo):
+            os.remove(temporaneo)
+        raise
+
+    _salva_stato(cartella, {
+        "base": stato["base"] if incrementale else filename,
+        "ultimo": filename,
+        "sequenza": sequenza,
+        "catena": (stato["catena"] if incrementale else []) + [filename],
+        "marca": marca,
+    })
+
+    print(f"\n✅ BACKUP {modalita.upper()}: {percorso}")
+    for tabella, righe in conteggi.items():
+        print(f"   • {tabella}: {righe}")
+
+    return percorso, filename, conteggi
+
+
+# ============================================================================
+# LETTURA
+# ============================================================================
+
+class _LettoreJSON:
+    """
+    Parser JSON incrementale per i vecchi backup .json (un unico oggetto
+    {"data_backup": ..., "clienti": [...], "faq": [...], "messaggi": [...]}).
+
+    Legge il file a blocchi e decodifica un elemento alla volta con
+    raw_decode: in memoria c'è solo il blocco corrente.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.buffer = ""
+        self.pos = 0
+        self.esaurito = False
+        self.decoder = json.JSONDecoder()
+
+    def _riempi(self):
+        blocco = self.file.read(64 * 1024)
+        if not blocco:
+            self.esaurito = True
+            return False
+        self.buffer = self.buffer[self.pos:] + blocco
+        self.pos = 0
+        return True
+
+    def prossimo(self):
+        """Primo carattere non spazio (senza consumarlo)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._riempi():
+                raise ValueError("JSON troncato")
+
+    def consuma(self, atteso):
+        if self.prossimo() != atteso:
+            raise ValueError(f"JSON non valido: atteso '{atteso}'")
+        self.pos += 1
+
+    def valore(self):
+        self.prossimo()
+        while True:
+            try:
+                valore, fine = self.decoder.raw_decode(self.buffer, self.pos)
+                # Un numero a fine blocco potrebbe continuare nel blocco dopo
+                if fine == len(self.buffer) and not self.esaurito and self._riempi():
+                    continue
+                self.pos = fine
+                return valore
+            except json.JSONDecodeError:
+                if not self._riempi():
+                    raise ValueError("JSON troncato")
+
+
+# Tabelle del vecchio formato JSON (export_backup_completo prima dell'NDJSON)
+TABELLE_JSON = ("clienti", "faq", "messaggi")
+
+
+def _record_json(file):
+    """Converte un vecchio backup JSON negli stessi record dell'NDJSON"""
+    lettore = _LettoreJSON(file)
+    header = {
+        "tipo": "header", "formato": FORMATO_BACKUP, "versione": VERSIONE_BACKUP,
+        "modalita": "completo", "creato_il": None, "tabelle": list(TABELLE_JSON),
+    }
+    header_inviato = False
+    conteggi = {}
+
+    lettore.consuma("{")
+    while lettore.prossimo() != "}":
+        chiave = lettore.valore()
+        lettore.consuma(":")
+
+        if chiave in TABELLE_JSON and lettore.prossimo() == "[":
+            if not header_inviato:
+                yield header
+                header_inviato = True
+
+            lettore.consuma("[")
+            colonne = None
+            righe = 0
+            while lettore.prossimo() != "]":
+                elemento = lettore.valore()
+                if colonne is None:
+                    colonne = list(elemento)
+                    yield {"tipo": "sezione", "tabella": chiave, "colonne": colonne, "modalita": "inserisci"}
+                yield [elemento.get(c) for c in colonne]
+                righe += 1
+                if lettore.prossimo() == ",":
+                    lettore.consuma(",")
+            lettore.consuma("]")
+
+            if colonne is None:
+                yield {"tipo": "sezione", "tabella": chiave, "colonne": [], "modalita": "inserisci"}
+            yield {"tipo": "fine_sezione", "tabella": chiave, "righe": righe}
+            conteggi[chiave] = righe
+        else:
+            valore = lettore.valore()
+            if chiave == "data_backup":
+                header["creato_il"] = valore
+
+        if lettore.prossimo() == ",":
+            lettore.consuma(",")
+
+    if not header_inviato:
+        yield header
+    yield {"tipo": "footer", "conteggi": conteggi}
+
+
+def _apri_record(percorso):
+    """
+    Ritorna (generatore di record, file grezzo): la posizione nel file
+    grezzo (compresso) serve per la percentuale di avanzamento.
+    """
+    grezzo = open(percorso, "rb")
+    testo = apri_compresso(percorso, "rt", grezzo=grezzo)
+
+    nome = os.path.basename(percorso)
+
+    def record():
+        try:
+            with testo:
+                if ".json" in nome and ".ndjson" not in nome:
+                    yield from _record_json(testo)
+                    return
+                for linea in testo:
+                    if linea.strip():
+                        yield json.loads(linea)
+        finally:
+            grezzo.close()
+
+    return record(), grezzo
+
+
+def leggi_backup(percorso):
+    """Generatore dei record del file: dict per i record di controllo, list per le righe"""
+    record, _ = _apri_record(percorso)
+    return record
+
+
+def leggi_header(percorso):
+    """Primo record del file (solleva ValueError se non è un nostro backup)"""
+    record = leggi_backup(percorso)
+    try:
+        header = next(record, None)
+    finally:
+        record.close()
+    if not isinstance(header, dict) or header.get("formato") != FORMATO_BACKUP:
+        raise ValueError(f"{percorso}: non è un backup {FORMATO_BACKUP}")
+    if header.get("versione", 0) > VERSIONE_BACKUP:
+        raise ValueError(f"{percorso}: versione {header['versione']} non supportata")
+    return header
+
+
+def verifica_catena(percorsi):
+    """
+    Controlla che i file siano un backup completo seguito dai suoi
+    incrementali, nell'ordine giusto. Solleva ValueError altrimenti.
+    """
+    if not percorsi:
+        raise ValueError("Nessun file di backup indicato")
+
+    headers = [leggi_header(p) for p in percorsi]
+    if headers[0]["modalita"] != "completo":
+        raise ValueError(f"{percorsi[0]}: la catena deve iniziare con un backup completo")
+
+    base = os.path.basename(percorsi[0])
+    for precedente, percorso, header in zip(percorsi, percorsi[1:], headers[1:]):
+        if header["modalita"] != "incrementale":
+            raise ValueError(f"{percorso}: atteso un backup incrementale")
+        if header["base"] != base or header["precedente"] != os.path.basename(precedente):
+            raise ValueError(
+                f"{percorso}: segue {header['precedente']} (base {header['base']}), "
+                f"non {os.path.basename(precedente)}"
+            )
+
+    return headers
+
+
+def catena_da_stato(cartella=None):
+    """Percorsi della catena corrente (completo + incrementali) dallo stato salvato"""
+    cartella = cartella or Config.BACKUP_DIR
+    stato = leggi_stato(cartella)
+    if not stato:
+        raise ValueError(f"Nessuno stato di backup in {cartella}")
+    return [os.path.join(cartella, f) for f in stato["catena"]]
+
+
+# ============================================================================
+# RIPRISTINO
+# ============================================================================
+
+def _convertitori(tabella, colonne):
+    """Per ogni colonna del file: (nome, funzione che riporta il valore JSON al tipo della colonna)"""
+    convertitori = []
+    for nome in colonne:
+        colonna = tabella.c.get(nome)
+        if colonna is None:
+            convertitori.append(None)  # colonna non più presente nello schema
+        elif isinstance(colonna.type, DateTime):
+            convertitori.append((nome, lambda v: datetime.fromisoformat(v) if v else None))
+        elif isinstance(colonna.type, Date):
+            convertitori.append((nome, lambda v: date.fromisoformat(v) if v else None))
+        else:
+            convertitori.append((nome, lambda v: v))
+    return convertitori
+
+
+def _valore_copy(valore):
+    """Campo CSV per COPY: vuoto senza virgolette = NULL, tutto il resto tra virgolette"""
+    if valore is None:
+        return ""
+    if isinstance(valore, bool):
+        valore = "true" if valore else "false"
+    elif isinstance(valore, (datetime, date)):
+        valore = valore.isoformat()
+    return '"' + str(valore).replace('"', '""') + '"'
+
+
+def _copy_postgres(conn, tabella, righe):
+    """INSERT massivo con COPY ... FROM STDIN (psycopg2)"""
+    colonne = list(righe[0])
+    dati = io.StringIO("".join(
+        ",".join(_valore_copy(r.get(c)) for c in colonne) + "\n" for r in righe
+    ))
+    with conn.connection.cursor() as cursore:
+        cursore.copy_expert(
+            f"COPY {tabella.name} ({', '.join(colonne)}) FROM STDIN WITH (FORMAT csv)", dati
+        )
+
+
+def _scrivi_blocco(conn, tabella, modalita, righe):
+    """Applica un blocco di righe (lista di dict): COPY su PostgreSQL, altrimenti executemany"""
+    if not righe:
+        return
+
+    dialetto = conn.dialect.name
+
+    if modalita != "aggiorna":
+        if dialetto == "postgresql" and conn.dialect.driver == "psycopg2":
+            _copy_postgres(conn, tabella, righe)
+        else:
+            conn.execute(tabella.insert(), righe)
+        return
+
+    chiave = [c.name for c in tabella.primary_key.columns]
+
+    if dialetto in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialetto == "sqlite" else pg_insert
+        stmt = insert(tabella)
+        aggiornabili = [c.name for c in tabella.columns if c.name not in chiave]
+        if aggiornabili:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=chiave, set_={c: stmt.excluded[c] for c in aggiornabili}
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=chiave)
+        conn.execute(stmt, righe)
+        return
+
+    conn.execute(delete(tabella).where(
+        tuple_(*[tabella.c[c] for c in chiave]).in_([tuple(r[c] for c in chiave) for r in righe])
+    ))
+    conn.execute(tabella.insert(), righe)
+
+
+def _cancella_id_mancanti(conn, tabella, intervalli):
+    """Cancella le righe con id fuori dagli intervalli presenti nel backup"""
+    inizi = [da for da, _ in intervalli]
+    da_cancellare = []
+    cancellate = 0
+
+    risultato = conn.execution_options(yield_per=RIGHE_PER_BLOCCO * 10).execute(
+        select(tabella.c.id).order_by(tabella.c.id)
+    )
+    for (id_riga,) in risultato:
+        posizione = bisect_right(inizi, id_riga) - 1
+        if posizione < 0 or id_riga > intervalli[posizione][1]:
+            da_cancellare.append(id_riga)
+
+    # Le azioni ON DELETE vanno applicate a mano: SQLite non applica le foreign key
+    dipendenti = [
+        (figlia, fk.parent, fk.ondelete)
+        for figlia in Base.metadata.sorted_tables
+        for fk in figlia.foreign_keys
+        if fk.column is tabella.c.id and fk.ondelete in ("CASCADE", "SET NULL")
+    ]
+
+    for i in range(0, len(da_cancellare), RIGHE_PER_BLOCCO):
+        blocco = da_cancellare[i:i + RIGHE_PER_BLOCCO]
+        for figlia, colonna, azione in dipendenti:
+            if azione == "CASCADE":
+                conn.execute(delete(figlia).where(colonna.in_(blocco)))
+            else:
+                conn.execute(update(figlia).where(colonna.in_(blocco)).values({colonna.name: None}))
+        cancellate += conn.execute(delete(tabella).where(tabella.c.id.in_(blocco))).rowcount
+
+    return cancellate
+
+
+def _allinea_sequenze(conn):
+    """PostgreSQL: dopo INSERT con id espliciti le sequenze vanno riportate al massimo"""
+    if conn.dialect.name != "postgresql":
+        return
+    for tabella in Base.metadata.sorted_tables:
+        if "id" in tabella.c and tabella.c.id.autoincrement:
+            conn.exec_driver_sql(
+                f"SELECT setval(pg_get_serial_sequence('{tabella.name}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {tabella.name}), 0) + 1, false)"
+            )
+
+
+def _tabelle_da_svuotare(nomi):
+    """
+    Le tabelle indicate più quelle che le referenziano (cliente_tag per
+    clienti, ...), senza le TABELLE_OPERATIVE
+    """
+    nomi = set(nomi) - set(TABELLE_OPERATIVE)
+    cambiato = True
+    while cambiato:
+        cambiato = False
+        for tabella in Base.metadata.sorted_tables:
+            if tabella.name not in nomi and any(fk.column.table.name in nomi for fk in tabella.foreign_keys):
+                nomi.add(tabella.name)
+                cambiato = True
+    # Figlie prima dei genitori
+    return [t for t in reversed(Base.metadata.sorted_tables) if t.name in nomi]
+
+
+def _sospendi_indici(conn, tabelle):
+    """Toglie gli indici secondari (non unici) e quelli full-text. Ritorna gli indici tolti"""
+    from utils.ricerca import sospendi_ricerca_fulltext
+
+    tolti = [indice for tabella in tabelle for indice in tabella.indexes if not indice.unique]
+    for indice in tolti:
+        indice.drop(conn, checkfirst=True)
+    sospendi_ricerca_fulltext(conn)
+    return tolti
+
+
+def _ricostruisci_indici(conn, indici):
+    from utils.ricerca import ricostruisci_ricerca_fulltext
+
+    for indice in indici:
+        indice.create(conn, checkfirst=True)
+    ricostruisci_ricerca_fulltext(conn)
+    print(f"   🔧 Ricostruiti {len(indici)} indici e l'indice full-text")
+
+
+def applica_backup(conn, percorso, ricostruisci_indici=False, progresso=None):
+    """
+    Applica un file (completo o incrementale) nella transazione conn.
+
+    ricostruisci_indici: per un backup completo toglie gli indici secondari
+    prima del caricamento e li ricrea alla fine (molto più veloce su
+    tabelle grandi). progresso(tabella, righe_file, frazione_file) viene
+    chiamata dopo ogni blocco scritto. Le sezioni delle TABELLE_OPERATIVE
+    (backup precedenti) vengono ignorate.
+
+    Ritorna i conteggi per tabella.
+    """
+    tabelle = Base.metadata.tables
+    record, grezzo = _apri_record(percorso)
+    dimensione = os.path.getsize(percorso) or 1
+    conteggi = {}
+    righe_file = 0
+    tabella = convertitori = modalita = None
+    blocco = []
+    chiavi = intervalli = colonna_chiavi = None
+    indici_tolti = None
+
+    def scrivi():
+        nonlocal blocco, righe_file
+        _scrivi_blocco(conn, tabella, modalita, blocco)
+        conteggi[tabella.name] += len(blocco)
+        righe_file += len(blocco)
+        blocco = []
+        if progresso:
+            progresso(tabella.name, righe_file, min(grezzo.tell() / dimensione, 1.0))
+
+    try:
+        for elemento in record:
+            if isinstance(elemento, list):
+                if chiavi is not None:
+                    chiavi.append(elemento[0])
+                elif intervalli is not None:
+                    intervalli.append(elemento)
+                elif tabella is not None:
+                    blocco.append({c[0]: c[1](v) for c, v in zip(convertitori, elemento) if c})
+                    if len(blocco) >= RIGHE_PER_BLOCCO:
+                        scrivi()
+                continue
+
+            tipo = elemento.get("tipo")
+
+            if tipo == "header" and elemento["modalita"] == "completo":
+                # Il completo parte da tabelle vuote (figlie prima dei genitori)
+                da_svuotare = _tabelle_da_svuotare(
+                    [n for n in elemento.get("tabelle", tabelle) if n in tabelle]
+                )
+                if ricostruisci_indici:
+                    indici_tolti = _sospendi_indici(conn, da_svuotare)
+                for t in da_svuotare:
+                    conn.execute(delete(t))
+
+            elif tipo == "chiavi":
+                t = tabelle.get(elemento["tabella"])
+                colonna_chiavi = t.c[elemento["chiave"]] if t is not None else None
+                chiavi = []
+
+            elif tipo == "sezione":
+                tabella = tabelle.get(elemento["tabella"])
+                if elemento["tabella"] in TABELLE_OPERATIVE:
+                    # Backup precedenti: lease e job di import restano quelli attuali
+                    tabella = None
+                elif tabella is None:
+                    print(f"   ⚠️  Tabella {elemento['tabella']} non più presente: sezione ignorata")
+                modalita = elemento.get("modalita", "inserisci")
+                if modalita == "id_presenti":
+                    intervalli = []
+                else:
+                    convertitori = _convertitori(tabella, elemento["colonne"]) if tabella is not None else None
+                conteggi.setdefault(elemento["tabella"], 0)
+
+            elif tipo == "fine_sezione":
+                nome = elemento["tabella"]
+                t = tabelle.get(nome)
+
+                if chiavi is not None:
+                    # Righe da sostituire: via quelle con le stesse chiavi
+                    if colonna_chiavi is not None:
+                        converti = _convertitori(t, [colonna_chiavi.name])[0][1]
+                        for i in range(0, len(chiavi), RIGHE_PER_BLOCCO):
+                            blocco_chiavi = [converti(v) for v in chiavi[i:i + RIGHE_PER_BLOCCO]]
+                            conn.execute(delete(t).where(colonna_chiavi.in_(blocco_chiavi)))
+                    chiavi = colonna_chiavi = None
+                    continue
+
+                if intervalli is not None:
+                    if t is not None:
+                        cancellate = _cancella_id_mancanti(conn, t, intervalli)
+                        if cancellate:
+                            print(f"   🗑️  {nome}: {cancellate} righe cancellate")
+                    intervalli = tabella = None
+                    continue
+
+                if tabella is not None:
+                    scrivi()
+                blocco = []
+                tabella = None
+
+            elif tipo == "footer":
+                if indici_tolti is not None:
+                    _ricostruisci_indici(conn, indici_tolti)
+                _allinea_sequenze(conn)
+                return conteggi
+
+    finally:
+        record.close()
+
+    raise ValueError(f"{percorso}: file troncato (footer mancante)")
+
+
+def ripristina_catena(percorsi, ricostruisci_indici=False, progresso=None):
+    """
+    Ripristina un backup completo e i suoi incrementali, nell'ordine.
+
+    Ogni file è applicato in una transazione: se un file è danneggiato
+    il database resta allo stato del file precedente.
+
+    progresso(dict) riceve file corrente, tabella, righe e percentuale.
+    """
+    verifica_catena(percorsi)
+
+    for numero, percorso in enumerate(percorsi, 1):
+        nome_file = os.path.basename(percorso)
+        print(f"\n📥 Ripristino {nome_file} ({numero}/{len(percorsi)})...")
+
+        def avanzamento(tabella, righe, frazione):
+            if progresso:
+                progresso({
+                    "file": nome_file,
+                    "file_numero": numero,
+                    "file_totali": len(percorsi),
+                    "tabella": tabella,
+                    "righe": righe,
+                    "percentuale_file": round(frazione * 100, 1),
+                })
+
+        with engine.begin() as conn:
+            conteggi = applica_backup(conn, percorso, ricostruisci_indici, avanzamento)
+        for tabella, righe in conteggi.items():
+            print(f"   • {tabella}: {righe}")
+
+    if leggi_header(percorsi[0]).get("tabelle") == list(TABELLE_JSON):
+        print("\n⚠️  Backup nel vecchio formato JSON: etichette, cliente_id dei messaggi e")
+        print("   statistiche non erano salvati. Rilancia scripts/migra_etichette_tag.py,")
+        print("   scripts/migra_messaggi_cliente_id.py e scripts/ricalcola_statistiche.py")
+
+    # Le cache in memoria riflettono il database di prima
+    from utils.cache import invalida_cache
+    invalida_cache()
+
+    print(f"\n✅ Ripristino completato ({len(percorsi)} file)")
+
+
+# ============================================================================
+# RIPRISTINO IN BACKGROUND (endpoint admin)
+# ============================================================================
+
+_ripristino = {"in_corso": False}
+_lock_ripristino = threading.Lock()
+
+
+def stato_ripristino():
+    """Avanzamento dell'ultimo ripristino avviato da avvia_ripristino"""
+    with _lock_ripristino:
+        return dict(_ripristino)
+
+
+def avvia_ripristino(percorsi, ricostruisci_indici=False):
+    """
+    Avvia il ripristino in un thread. Solleva ValueError se la catena non
+    è valida e RuntimeError se un ripristino è già in corso.
+    """
+    headers = verifica_catena(percorsi)
+
+    with _lock_ripristino:
+        if _ripristino["in_corso"]:
+            raise RuntimeError("Ripristino già in corso")
+        _ripristino.clear()
+        _ripristino.update({
+            "in_corso": True,
+            "file": [os.path.basename(p) for p in percorsi],
+            "avviato_il": datetime.utcnow().isoformat(),
+            "avanzamento": None,
+            "errore": None,
+        })
+
+    def aggiorna(avanzamento):
+        with _lock_ripristino:
+            _ripristino["avanzamento"] = avanzamento
+
+    def esegui():
+        errore = None
+        try:
+            ripristina_catena(percorsi, ricostruisci_indici, aggiorna)
+        except Exception as e:
+            errore = str(e)
+            print(f"❌ Errore ripristino: {e}")
+        with _lock_ripristino:
+            _ripristino.update({
+                "in_corso": False,
+                "completato_il": datetime.utcnow().isoformat(),
+                "errore": errore,
+            })
+
+    threading.Thread(target=esegui, daemon=True).start()
+    return headers
@@ -0,0 +1,138 @@
+"""
+Cache - Cache in memoria con TTL per le risposte di analytics e statistiche
+
+- TTL per endpoint
+- versione di invalidazione: CRUD, import e nuovi clienti dal webhook la
+  incrementano; i contatori dei singoli messaggi si aggiornano col TTL
+- stale-while-revalidate: un valore scaduto (o invalidato) viene restituito
+  subito e ricalcolato in background, così nessun lettore aspetta
+- contatori hit/stale/miss per il rapporto di hit
+- al massimo _MAX_VOCI_IN_CACHE voci (le chiavi includono i filtri delle
+  richieste): oltre, esce la meno usata di recente
+- più richieste che mancano la stessa chiave insieme: calcola la prima,
+  le altre aspettano il suo risultato
+
+La cache è per processo: con più worker ognuno ha la sua, e il TTL
+limita quanto può restare indietro rispetto alle scritture degli altri.
+"""
+
+import threading
+import time
+from collections import Counter, OrderedDict
+from config import Config
+
+_cache = OrderedDict()  # chiave -> (valore, creato_il, versione), dalla meno usata
+_MAX_VOCI_IN_CACHE = 500
+_in_ricalcolo = {}  # chiave -> Event segnalato a fine calcolo
+_lock = threading.Lock()
+_contatori = Counter()
+_versione = 0
+
+
+def invalida_cache():
+    """Segna come vecchie tutte le voci (chiamata dopo le scritture che cambiano gli aggregati)"""
+    global _versione
+    with _lock:
+        _versione += 1
+
+
+def _salva(chiave, valore, versione):
+    """Salva la voce togliendo le meno usate oltre il limite (con _lock preso)"""
+    _cache[chiave] = (valore, time.monotonic(), versione)
+    _cache.move_to_end(chiave)
+    while len(_cache) > _MAX_VOCI_IN_CACHE:
+        _cache.popitem(last=False)
+
+
+def _ricalcola(chiave, funzione, args):
+    """Calcola il valore e lo salva in cache (anche da thread in background)"""
+    versione = _versione
+    try:
+        valore = funzione(*args)
+        with _lock:
+            _salva(chiave, valore, versione)
+        return valore
+    finally:
+        with _lock:
+            evento = _in_ricalcolo.pop(chiave, None)
+        if evento is not None:
+            evento.set()
+
+
+def _ricalcola_in_background(chiave, funzione, args):
+    def esegui():
+        try:
+            _ricalcola(chiave, funzione, args)
+        except Exception as e:
+            print(f"❌ Errore ricalcolo cache '{chiave[0]}': {e}")
+
+    threading.Thread(target=esegui, daemon=True).start()
+
+
+def in_cache(nome, ttl, funzione, *args):
+    """
+    Ritorna funzione(*args), riusando il valore calcolato negli ultimi ttl secondi.
+
+    - fresco (entro ttl e nessuna scrittura nel frattempo): hit
+    - vecchio ma entro Config.CACHE_STALE_MAX: restituito subito, ricalcolo in background
+    - assente o troppo vecchio: calcolato ora (miss), o atteso se un
+      altro thread lo sta già calcolando
+    """
+    if not Config.CACHE_ABILITATA:
+        return funzione(*args)
+
+    chiave = (nome,) + args
+    adesso = time.monotonic()
+
+    with _lock:
+        voce = _cache.get(chiave)
+
+        if voce is not None:
+            valore, creato_il, versione = voce
+            eta = adesso - creato_il
+
+            if eta < ttl and versione == _versione:
+                _contatori["hit"] += 1
+                _cache.move_to_end(chiave)
+                return valore
+
+            if eta < Config.CACHE_STALE_MAX:
+                _contatori["stale"] += 1
+                _cache.move_to_end(chiave)
+                if chiave not in _in_ricalcolo:
+                    _in_ricalcolo[chiave] = threading.Event()
+                    _ricalcola_in_background(chiave, funzione, args)
+                return valore
+
+        _contatori["miss"] += 1
+        in_corso = _in_ricalcolo.get(chiave)
+        if in_corso is None:
+            _in_ricalcolo[chiave] = threading.Event()
+
+    if in_corso is None:
+        return _ricalcola(chiave, funzione, args)
+
+    # Stessa chiave già in calcolo: si usa il suo risultato
+    in_corso.wait()
+    with _lock:
+        voce = _cache.get(chiave)
+    if voce is not None:
+        return voce[0]
+    # Il calcolo dell'altro thread è fallito
+    return funzione(*args)
+
+
+def statistiche_cache():
+    """Contatori e rapporto di hit (le risposte stale contano come servite dalla cache)"""
+    with _lock:
+        totale = sum(_contatori.values())
+        servite = _contatori["hit"] + _contatori["stale"]
+        return {
+            "abilitata": Config.CACHE_ABILITATA,
+            "voci": len(_cache),
+            "versione": _versione,
+            "hit": _contatori["hit"],
+            "stale": _contatori["stale"],
+            "miss": _contatori["miss"],
+            "hit_ratio": round(servite / totale, 4) if totale else 0,
+        }
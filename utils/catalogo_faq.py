@@ -0,0 +1,302 @@
+"""
+Catalogo FAQ - Sincronizzazione della tabella faq da un file dichiarativo
+
+Il catalogo (JSON, CSV o YAML) è l'elenco completo delle FAQ volute.
+La sincronizzazione confronta un'impronta (sha256) del contenuto di ogni
+FAQ con quella delle righe nel database, per domanda_completa:
+- FAQ nuove -> INSERT
+- contenuto cambiato -> UPDATE
+- uguali -> nessuna scrittura
+- non più nel catalogo (anche quelle create dalla dashboard) -> DELETE
+  solo con elimina=True, altrimenti restano e vengono solo elencate
+- doppioni della stessa domanda (vecchi script rilanciati) -> resta la
+  prima riga, i messaggi collegati passano a lei
+
+Tutto in una transazione, con l'indice full-text delle FAQ sospeso e
+ricostruito una volta sola alla fine. Dopo ogni sincronizzazione la
+tabella catalogo_faq ricorda l'impronta del catalogo e lo stato della
+tabella faq: rilanciare lo stesso catalogo, se nel frattempo le FAQ non
+sono cambiate, non rilegge né scrive nulla.
+"""
+
+import csv
+import hashlib
+import json
+from datetime import datetime
+from sqlalchemy import bindparam, delete, func, select, update
+from database import engine, CatalogoFAQDB, FAQDB, MessaggioDB
+from utils.cache import invalida_cache
+from utils.importazione import COLONNE_FAQ, _prepara_faq
+from utils.ricerca import sospendi_ricerca_fulltext, ricostruisci_ricerca_fulltext
+
+
+# ============================================================================
+# LETTURA CATALOGO
+# ============================================================================
+
+def _leggi_voci(percorso):
+    """Voci grezze (dict) del file, secondo l'estensione"""
+    if percorso.endswith(".csv"):
+        with open(percorso, encoding="utf-8-sig", newline="") as f:
+            return list(csv.DictReader(f))
+
+    with open(percorso, encoding="utf-8") as f:
+        if percorso.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError("Per i cataloghi .yaml installa il pacchetto PyYAML")
+            dati = yaml.safe_load(f)
+        elif percorso.endswith(".json"):
+            dati = json.load(f)
+        else:
+            raise ValueError(f"Formato catalogo non supportato: {percorso} (.json, .csv, .yaml)")
+
+    # Lista di FAQ oppure {"faq": [...]}
+    if isinstance(dati, dict):
+        dati = dati.get("faq")
+    if not isinstance(dati, list):
+        raise ValueError(f"{percorso}: atteso un elenco di FAQ (o {{\"faq\": [...]}})")
+    return dati
+
+
+def voce_faq(dati):
+    """
+    Dict di una FAQ -> tuple in ordine COLONNE_FAQ (ValueError se non valida).
+
+    Stesse regole dell'import CSV; domanda_keywords può essere anche una lista.
+    """
+    if isinstance(dati.get("domanda_keywords"), list):
+        dati = dict(dati, domanda_keywords=",".join(dati["domanda_keywords"]))
+    return _prepara_faq(dati)
+
+
+def carica_catalogo(percorso):
+    """
+    Legge e valida un catalogo: ritorna le FAQ come tuple in ordine COLONNE_FAQ.
+
+    Solleva ValueError con l'elenco degli errori (voce non valida, stessa
+    domanda ripetuta).
+    """
+    voci = []
+    errori = []
+    viste = {}
+
+    for numero, voce in enumerate(_leggi_voci(percorso), start=1):
+        if not isinstance(voce, dict):
+            errori.append(f"FAQ {numero}: non è un oggetto")
+            continue
+        try:
+            valori = voce_faq(voce)
+        except Exception as e:
+            errori.append(f"FAQ {numero}: {e}")
+            continue
+
+        domanda = valori[0]
+        if domanda in viste:
+            errori.append(f"FAQ {numero}: domanda già presente alla FAQ {viste[domanda]} ({domanda[:40]})")
+            continue
+        viste[domanda] = numero
+        voci.append(valori)
+
+    if errori:
+        raise ValueError("Catalogo non valido:\n" + "\n".join(errori))
+    return voci
+
+
+def impronta(valori):
+    """sha256 del contenuto di una FAQ (tuple in ordine COLONNE_FAQ)"""
+    return hashlib.sha256(
+        json.dumps(list(valori), ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+def impronta_catalogo(voci, elimina):
+    """sha256 di tutto il catalogo e della modalità (con o senza eliminazioni)"""
+    return hashlib.sha256(
+        json.dumps([elimina, [list(v) for v in voci]], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+# ============================================================================
+# SINCRONIZZAZIONE
+# ============================================================================
+
+def _valori_db(riga):
+    """Riga della tabella faq -> tuple confrontabile con quelle del catalogo"""
+    domanda, keywords, risposta, settore, priorita = riga
+    return (domanda, keywords or "", risposta, settore or "", priorita if priorita is not None else 5)
+
+
+def _stato_faq(conn):
+    """Righe, id massimo e ultima modifica della tabella faq (cambia a ogni scrittura)"""
+    tabella = FAQDB.__table__
+    righe, max_id, ultima_modifica = conn.execute(
+        select(func.count(tabella.c.id), func.max(tabella.c.id), func.max(tabella.c.data_modifica))
+    ).one()
+    return f"{righe}:{max_id}:{ultima_modifica}"
+
+
+def calcola_differenze(voci, conn, elimina=False):
+    """
+    Confronta il catalogo con la tabella faq (nessuna scrittura).
+
+    Ritorna {"nuove": [valori], "modificate": [(id, valori)], "invariate": n,
+             "fuori_catalogo": [(id, domanda)], "da_eliminare": [id],
+             "doppioni": {id doppione: id che resta}}
+    """
+    tabella = FAQDB.__table__
+    righe = conn.execute(
+        select(tabella.c.id, *[tabella.c[c] for c in COLONNE_FAQ]).order_by(tabella.c.id)
+    ).all()
+
+    esistenti = {}  # domanda -> (id, impronta) della prima riga
+    doppioni = {}
+    for riga in righe:
+        valori = _valori_db(riga[1:])
+        if valori[0] in esistenti:
+            doppioni[riga.id] = esistenti[valori[0]][0]
+        else:
+            esistenti[valori[0]] = (riga.id, impronta(valori))
+
+    differenze = {
+        "nuove": [], "modificate": [], "invariate": 0,
+        "fuori_catalogo": [], "da_eliminare": [], "doppioni": {}
+    }
+    nel_catalogo = set()
+
+    for valori in voci:
+        nel_catalogo.add(valori[0])
+        if valori[0] not in esistenti:
+            differenze["nuove"].append(valori)
+        elif esistenti[valori[0]][1] != impronta(valori):
+            differenze["modificate"].append((esistenti[valori[0]][0], valori))
+        else:
+            differenze["invariate"] += 1
+
+    differenze["fuori_catalogo"] = sorted(
+        (faq_id, domanda) for domanda, (faq_id, _) in esistenti.items() if domanda not in nel_catalogo
+    )
+    fuori_catalogo = {faq_id for faq_id, _ in differenze["fuori_catalogo"]}
+    if elimina:
+        differenze["da_eliminare"] = sorted(fuori_catalogo)
+    # Senza elimina i doppioni delle FAQ fuori catalogo restano dove sono
+    differenze["doppioni"] = {
+        doppione: resta for doppione, resta in doppioni.items()
+        if elimina or resta not in fuori_catalogo
+    }
+    return differenze
+
+
+def _applica(conn, differenze):
+    """Scrive le differenze con poche istruzioni bulk (dentro la transazione di conn)"""
+    tabella = FAQDB.__table__
+    adesso = datetime.utcnow()
+
+    if differenze["doppioni"]:
+        conn.execute(
+            update(MessaggioDB.__table__)
+            .where(MessaggioDB.__table__.c.faq_id == bindparam("b_doppione"))
+            .values(faq_id=bindparam("b_resta")),
+            [{"b_doppione": d, "b_resta": r} for d, r in differenze["doppioni"].items()],
+        )
+
+    da_togliere = differenze["da_eliminare"] + list(differenze["doppioni"])
+    if da_togliere:
+        # Come ondelete='SET NULL', che SQLite non applica senza foreign_keys
+        conn.execute(
+            update(MessaggioDB.__table__)
+            .where(MessaggioDB.__table__.c.faq_id.in_(differenze["da_eliminare"]))
+            .values(faq_id=None)
+        )
+        conn.execute(delete(tabella).where(tabella.c.id.in_(da_togliere)))
+
+    if differenze["modificate"]:
+        conn.execute(
+            update(tabella).where(tabella.c.id == bindparam("b_id")),
+            [
+                dict(zip(COLONNE_FAQ, valori), b_id=faq_id, data_modifica=adesso)
+                for faq_id, valori in differenze["modificate"]
+            ],
+        )
+
+    if differenze["nuove"]:
+        conn.execute(tabella.insert(), [
+            dict(zip(COLONNE_FAQ, valori), data_creazione=adesso, data_modifica=adesso)
+            for valori in differenze["nuove"]
+        ])
+
+
+def _risultato(differenze, elimina, saltata=False):
+    """Conteggi e domande per chi ha chiesto la sincronizzazione"""
+    return {
+        "saltata": saltata,
+        "aggiunte": len(differenze["nuove"]),
+        "modificate": len(differenze["modificate"]),
+        "invariate": differenze["invariate"],
+        "eliminate": len(differenze["da_eliminare"]),
+        "doppioni": len(differenze["doppioni"]),
+        "domande": {
+            "aggiunte": [valori[0] for valori in differenze["nuove"]],
+            "modificate": [valori[0] for _, valori in differenze["modificate"]],
+            # Con elimina=True sono quelle eliminate, senza quelle rimaste
+            "fuori_catalogo": [domanda for _, domanda in differenze["fuori_catalogo"]],
+        },
+    }
+
+
+def sincronizza_catalogo(voci, elimina=False, simula=False, forza=False):
+    """
+    Allinea la tabella faq alle voci (tuple da carica_catalogo).
+
+    - elimina=True: elimina anche le FAQ che non sono nel catalogo (comprese
+      quelle create dalla dashboard); di default restano
+    - simula=True: calcola le differenze senza scrivere
+    - forza=True: confronta le FAQ anche se catalogo e tabella sono
+      invariati dall'ultima sincronizzazione
+
+    Ritorna i conteggi {"aggiunte", "modificate", "invariate", "eliminate",
+    "doppioni"}, "saltata" (True se non c'era niente da confrontare) e in
+    "domande" le domande aggiunte, modificate e fuori catalogo.
+    """
+    impronta_voci = impronta_catalogo(voci, elimina)
+    tabella_catalogo = CatalogoFAQDB.__table__
+
+    with engine.begin() as conn:
+        if not simula and not forza:
+            ultima = conn.execute(
+                select(tabella_catalogo.c.impronta, tabella_catalogo.c.stato_faq)
+                .where(tabella_catalogo.c.id == 1)
+            ).first()
+            if ultima and tuple(ultima) == (impronta_voci, _stato_faq(conn)):
+                vuote = {"nuove": [], "modificate": [], "invariate": len(voci),
+                         "fuori_catalogo": [], "da_eliminare": [], "doppioni": {}}
+                return _risultato(vuote, elimina, saltata=True)
+
+        differenze = calcola_differenze(voci, conn, elimina)
+        cambiamenti = (
+            differenze["nuove"] or differenze["modificate"]
+            or differenze["da_eliminare"] or differenze["doppioni"]
+        )
+
+        if cambiamenti and not simula:
+            sospendi_ricerca_fulltext(conn, ["faq"])
+            _applica(conn, differenze)
+            ricostruisci_ricerca_fulltext(conn, ["faq"])
+
+        if not simula:
+            conn.execute(delete(tabella_catalogo))
+            conn.execute(tabella_catalogo.insert().values(
+                id=1, impronta=impronta_voci, stato_faq=_stato_faq(conn),
+                sincronizzato_il=datetime.utcnow()
+            ))
+
+    if cambiamenti and not simula:
+        invalida_cache()
+
+    return _risultato(differenze, elimina)
+
+
+def sincronizza_file(percorso, elimina=False, simula=False, forza=False):
+    """carica_catalogo + sincronizza_catalogo"""
+    return sincronizza_catalogo(carica_catalogo(percorso), elimina, simula, forza)
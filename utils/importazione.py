@@ -0,0 +1,749 @@
+"""
+Importazione - Import clienti e FAQ da CSV a blocchi (set-based)
+
+Il file viene letto in streaming e processato a blocchi di righe:
+- validazione per riga; numeri normalizzati in E.164 una colonna per
+  blocco alla volta (utils.telefoni)
+- duplicati dentro il blocco scartati in memoria
+- duplicati già nel database trovati con UNA query IN per blocco
+- righe nuove inserite con un solo INSERT ... ON CONFLICT (phone) DO NOTHING
+- tag e statistiche aggiornati con poche query per blocco
+
+Ogni blocco ha il suo commit: un file grande non tiene il database
+bloccato per tutta la durata dell'import. I job in background (tabella
+import_jobs) salvano il punto di ripresa nella stessa transazione del
+blocco e dopo un crash ripartono da lì.
+"""
+
+import codecs
+import csv
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from itertools import islice
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, SQLAlchemyError
+from config import Config
+from database import get_db_session, ClienteDB, ClienteTagDB, FAQDB, ImportJobDB
+from utils.cache import invalida_cache
+from utils.tag import parse_etichette, formatta_etichette, get_o_crea_tag
+from utils.statistiche import giorno_locale, incrementa_statistiche
+from utils.telefoni import normalizza_telefoni
+
+RIGHE_PER_BLOCCO = 1000
+# Import parallelo: byte di file letti e validati da un processo per volta
+BYTE_PER_INTERVALLO = 4 * 1024 * 1024
+LUNGHEZZA_MAX_DOMANDA = FAQDB.__table__.c.domanda_completa.type.length
+
+# Ordine dei valori preparati: tuple invece di dict, più leggere da
+# passare tra processi nell'import parallelo
+COLONNE_CLIENTE = ("phone", "nome", "azienda", "settore", "email", "note", "etichette", "numero_messaggi", "stato")
+COLONNE_FAQ = ("domanda_completa", "domanda_keywords", "risposta", "settore", "priorita")
+
+
+def _prepara_clienti(righe, settore_default):
+    """Blocco [(numero riga, riga CSV)] -> [(numero riga, preparato, errore)]"""
+    telefoni = normalizza_telefoni([(row.get('phone') or '').strip() for _, row in righe])
+    return _prepara_righe(partial(_prepara_cliente, settore_default=settore_default), righe, telefoni)
+
+
+def _prepara_cliente(row, normalizzato, settore_default):
+    """Riga CSV -> (valori in ordine COLONNE_CLIENTE, lista tag). ValueError se non valida."""
+    phone = (row.get('phone') or '').strip()
+    if not phone:
+        raise ValueError("phone vuoto")
+    if not normalizzato:
+        raise ValueError(f"phone non valido ({phone})")
+
+    tags = parse_etichette(row.get('etichette') or '')
+
+    return (
+        normalizzato,
+        row.get('nome') or 'N/A',
+        row.get('azienda') or '',
+        row.get('settore') or settore_default,
+        row.get('email') or '',
+        row.get('note') or '',
+        formatta_etichette(tags),
+        int(row.get('numero_messaggi') or 0),
+        row.get('stato') or 'attivo',
+    ), tags
+
+
+def _inserisci_clienti(db, righe):
+    """
+    Inserisce le righe e ritorna {phone: id} di quelle davvero inserite.
+
+    Con ON CONFLICT DO NOTHING ... RETURNING un numero creato nel frattempo
+    (es. dal webhook) viene saltato senza errori e non risulta aggiunto.
+    """
+    tabella = ClienteDB.__table__
+    dialetto = db.get_bind().dialect.name
+
+    if dialetto in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialetto == "sqlite" else pg_insert
+        stmt = insert(tabella).on_conflict_do_nothing(index_elements=["phone"])
+        risultato = db.execute(stmt.returning(tabella.c.phone, tabella.c.id), righe)
+        return dict(risultato.all())
+
+    db.execute(tabella.insert(), righe)
+    return dict(db.execute(
+        select(tabella.c.phone, tabella.c.id)
+        .where(tabella.c.phone.in_([r["phone"] for r in righe]))
+    ).all())
+
+
+def _inserisci_una_per_volta(db, nuovi, errori):
+    """Ripiego se l'insert del blocco fallisce: ritorna (inseriti, righe fallite)"""
+    inseriti = {}
+    falliti = 0
+    for row_num, valori, _ in nuovi.values():
+        try:
+            with db.begin_nested():
+                inseriti.update(_inserisci_clienti(db, [valori]))
+        except SQLAlchemyError as e:
+            errori.append(f"Riga {row_num}: {getattr(e, 'orig', e)}")
+            falliti += 1
+    return inseriti, falliti
+
+
+def _scrivi_clienti(db, preparati, risultato):
+    """Deduplica e inserisce un blocco di (numero riga, (valori, tags)) già validati"""
+    adesso = datetime.utcnow()
+    nuovi = {}  # phone -> (numero riga, valori, tags)
+
+    for row_num, (valori, tags) in preparati:
+        valori = dict(zip(COLONNE_CLIENTE, valori))
+        if valori["phone"] in nuovi:
+            risultato["duplicati"] += 1
+            continue
+        valori.update(data_creazione=adesso, ultima_interazione=adesso, data_modifica=adesso)
+        nuovi[valori["phone"]] = (row_num, valori, tags)
+
+    esistenti = db.scalars(
+        select(ClienteDB.phone).where(ClienteDB.phone.in_(list(nuovi)))
+    ).all()
+    for phone in esistenti:
+        del nuovi[phone]
+    risultato["duplicati"] += len(esistenti)
+
+    if not nuovi:
+        return
+
+    falliti = 0
+    try:
+        inseriti = _inserisci_clienti(db, [valori for _, valori, _ in nuovi.values()])
+    except SQLAlchemyError:
+        db.rollback()
+        inseriti, falliti = _inserisci_una_per_volta(db, nuovi, risultato["errori"])
+
+    # Saltati da ON CONFLICT: creati da qualcun altro dopo la query IN
+    risultato["duplicati"] += len(nuovi) - len(inseriti) - falliti
+
+    nomi_tag = sorted({nome for phone in inseriti for nome in nuovi[phone][2]})
+    tag_ids = get_o_crea_tag(db, nomi_tag)
+    associazioni = [
+        {"cliente_id": cliente_id, "tag_id": tag_ids[nome]}
+        for phone, cliente_id in inseriti.items()
+        for nome in nuovi[phone][2]
+    ]
+    if associazioni:
+        db.execute(ClienteTagDB.__table__.insert(), associazioni)
+
+    giorno = giorno_locale(adesso)
+    for settore, numero in Counter(nuovi[phone][1]["settore"] for phone in inseriti).items():
+        incrementa_statistiche(db, giorno, settore, nuovi_clienti=numero)
+
+    risultato["aggiunti"] += len(inseriti)
+
+
+def _prepara_faq(row):
+    """Riga CSV -> valori in ordine COLONNE_FAQ. ValueError se non valida."""
+    domanda = (row.get('domanda_completa') or '').strip()
+    risposta = (row.get('risposta') or '').strip()
+
+    if not domanda or not risposta:
+        raise ValueError("domanda o risposta vuota")
+    if len(domanda) > LUNGHEZZA_MAX_DOMANDA:
+        raise ValueError(f"domanda più lunga di {LUNGHEZZA_MAX_DOMANDA} caratteri")
+
+    return (
+        domanda,
+        row.get('domanda_keywords') or '',
+        risposta,
+        row.get('settore') or '',
+        int(row.get('priorita') or 5),
+    )
+
+
+def _scrivi_faq(db, preparati, risultato):
+    """Come _scrivi_clienti per le FAQ (duplicato = stessa domanda_completa)"""
+    adesso = datetime.utcnow()
+    nuove = {}  # domanda -> valori
+
+    for _, valori in preparati:
+        valori = dict(zip(COLONNE_FAQ, valori), data_creazione=adesso, data_modifica=adesso)
+        if valori["domanda_completa"] in nuove:
+            risultato["duplicati"] += 1
+            continue
+        nuove[valori["domanda_completa"]] = valori
+
+    esistenti = db.scalars(
+        select(FAQDB.domanda_completa).where(FAQDB.domanda_completa.in_(list(nuove)))
+    ).all()
+    for domanda in esistenti:
+        del nuove[domanda]
+    risultato["duplicati"] += len(esistenti)
+
+    if nuove:
+        db.execute(FAQDB.__table__.insert(), list(nuove.values()))
+        risultato["aggiunti"] += len(nuove)
+
+
+# ============================================================================
+# LETTURA E VALIDAZIONE
+# ============================================================================
+
+def _prepara_righe(prepara_riga, righe, *colonne):
+    """
+    [(numero riga, riga CSV)] -> [(numero riga, preparato, errore)]
+
+    colonne: valori già calcolati per tutto il blocco (es. i telefoni
+    normalizzati), passati a prepara_riga dopo la riga.
+    """
+    preparati = []
+    for (row_num, row), *valori in zip(righe, *colonne):
+        try:
+            preparati.append((row_num, prepara_riga(row, *valori), None))
+        except Exception as e:
+            preparati.append((row_num, None, str(e)))
+    return preparati
+
+
+def _blocchi(righe, righe_per_blocco):
+    """Raggruppa un iterabile in liste di righe_per_blocco elementi"""
+    blocco = []
+    for riga in righe:
+        blocco.append(riga)
+        if len(blocco) == righe_per_blocco:
+            yield blocco
+            blocco = []
+    if blocco:
+        yield blocco
+
+
+def _preparati_sequenziali(file, colonna, prepara, righe_per_blocco, salta_righe):
+    """Lettura e validazione nel processo corrente; ritorna (intestazione, blocchi)"""
+    reader = csv.DictReader(file)
+    if not reader.fieldnames or colonna not in reader.fieldnames:
+        raise ValueError(f"CSV senza colonna '{colonna}'")
+
+    righe = islice(enumerate(reader, start=2), salta_righe, None)  # riga 1 = intestazione
+    return (prepara(blocco) for blocco in _blocchi(righe, righe_per_blocco))
+
+
+def _fine_record(file, dati):
+    """
+    Legge fino alla fine del record CSV in corso e ritorna i byte letti.
+
+    Un a capo dentro un campo tra virgolette non chiude il record: il
+    record finisce al primo a capo dopo un numero pari di virgolette
+    (le virgolette raddoppiate "" contano due e non cambiano la parità).
+    """
+    virgolette = dati.count(b'"')
+    while True:
+        riga = file.readline()
+        dati += riga
+        virgolette += riga.count(b'"')
+        if not riga or virgolette % 2 == 0:
+            return dati
+
+
+def _intestazione(percorso):
+    """Colonne del CSV e byte da cui iniziano i dati"""
+    with open(percorso, "rb") as f:
+        if f.read(3) != codecs.BOM_UTF8:
+            f.seek(0)
+        intestazione = next(csv.reader([_fine_record(f, b"").decode("utf-8")]), [])
+        return intestazione, f.tell()
+
+
+def _intervalli(percorso, inizio, byte_per_intervallo):
+    """Intervalli (inizio, fine) di circa byte_per_intervallo byte, a confine di record"""
+    with open(percorso, "rb") as f:
+        f.seek(inizio)
+        while True:
+            dati = f.read(byte_per_intervallo)
+            if not dati:
+                return
+            if not dati.endswith(b"\n") or dati.count(b'"') % 2:
+                _fine_record(f, dati)
+            fine = f.tell()
+            yield inizio, fine
+            inizio = fine
+
+
+def _prepara_intervallo(percorso, inizio, fine, intestazione, prepara):
+    """
+    Eseguita nei processi figli: legge e valida un intervallo del file.
+
+    I numeri di riga sono relativi all'intervallo (da 0): li sistema il
+    processo principale, che conosce quanti record c'erano prima.
+    """
+    with open(percorso, "rb") as f:
+        f.seek(inizio)
+        testo = f.read(fine - inizio).decode("utf-8")
+
+    reader = csv.DictReader(io.StringIO(testo, newline=""), fieldnames=intestazione)
+    return prepara(list(enumerate(reader)))
+
+
+def _preparati_paralleli(percorso, colonna, prepara, righe_per_blocco, salta_righe, processi, risultato):
+    """
+    Lettura e validazione in processi separati, un intervallo di file per volta.
+
+    Gli intervalli vengono ricomposti nell'ordine del file, quindi i
+    numeri di riga e gli errori sono identici alla lettura sequenziale.
+    Al massimo 2 intervalli per processo restano in memoria.
+    """
+    intestazione, inizio = _intestazione(percorso)
+    if colonna not in intestazione:
+        raise ValueError(f"CSV senza colonna '{colonna}'")
+
+    # spawn: il job può partire da un thread di un worker web, dove fork non è sicuro
+    with ProcessPoolExecutor(processi, mp_context=multiprocessing.get_context("spawn")) as pool:
+        in_corso = deque()
+        da_inviare = _intervalli(percorso, inizio, BYTE_PER_INTERVALLO)
+        record_letti = 0
+
+        def invia():
+            intervallo = next(da_inviare, None)
+            if intervallo:
+                futuro = pool.submit(_prepara_intervallo, percorso, *intervallo, intestazione, prepara)
+                in_corso.append((intervallo[1], futuro))
+
+        for _ in range(processi * 2):
+            invia()
+
+        while in_corso:
+            fine, futuro = in_corso.popleft()
+            preparati = futuro.result()
+            invia()
+
+            precedenti = record_letti
+            record_letti += len(preparati)
+            preparati = [
+                (precedenti + 2 + indice, preparato, errore)  # riga 1 = intestazione
+                for indice, preparato, errore in preparati[max(salta_righe - precedenti, 0):]
+            ]
+
+            for blocco in _blocchi(preparati, righe_per_blocco):
+                yield blocco
+            risultato["byte_letti"] = fine
+
+
+# ============================================================================
+# IMPORT
+# ============================================================================
+
+def _apri_testo(file):
+    """
+    Uno stream binario (es. request.files['file'].stream) viene decodificato
+    al volo in UTF-8 (BOM di Excel compreso); uno stream di testo resta com'è.
+    """
+    if isinstance(file.read(0), bytes):
+        return io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    return file
+
+
+def _importa_csv(file, colonna, prepara, scrivi, righe_per_blocco, progresso, checkpoint, salta_righe, processi):
+    """
+    Ciclo comune: un blocco, un commit.
+
+    prepara(blocco) valida un intero blocco [(numero riga, riga CSV)], così
+    le normalizzazioni per colonna (telefoni) girano una volta per blocco.
+
+    Da un percorso il risultato riporta anche byte_letti (avanzamento nel file);
+    con processi > 1 la validazione gira in parallelo (solo da percorso).
+    """
+    risultato = {"righe": 0, "aggiunti": 0, "duplicati": 0, "errori": []}
+
+    try:
+        if isinstance(file, str) and processi > 1:
+            blocchi = _preparati_paralleli(file, colonna, prepara, righe_per_blocco, salta_righe, processi, risultato)
+            return _scrivi_blocchi(blocchi, scrivi, risultato, progresso, checkpoint, lambda: None)
+
+        if isinstance(file, str):
+            with open(file, "rb") as grezzo:
+                testo = io.TextIOWrapper(grezzo, encoding="utf-8-sig", newline="")
+                blocchi = _preparati_sequenziali(testo, colonna, prepara, righe_per_blocco, salta_righe)
+
+                def posizione():
+                    risultato["byte_letti"] = grezzo.tell()
+
+                return _scrivi_blocchi(blocchi, scrivi, risultato, progresso, checkpoint, posizione)
+
+        blocchi = _preparati_sequenziali(_apri_testo(file), colonna, prepara, righe_per_blocco, salta_righe)
+        return _scrivi_blocchi(blocchi, scrivi, risultato, progresso, checkpoint, lambda: None)
+
+    except UnicodeDecodeError as e:
+        raise ValueError(
+            f"File non in UTF-8 (salvarlo come \"CSV UTF-8\"), {risultato['righe']} righe già importate"
+        ) from e
+
+
+def _scrivi_blocchi(blocchi, scrivi, risultato, progresso, checkpoint, posizione):
+    """Unico processo che scrive: errori di validazione in ordine, poi inserimento del blocco"""
+    db = get_db_session()
+
+    try:
+        for blocco in blocchi:
+            validi = []
+            for row_num, preparato, errore in blocco:
+                if errore is None:
+                    validi.append((row_num, preparato))
+                else:
+                    risultato["errori"].append(f"Riga {row_num}: {errore}")
+
+            if validi:
+                scrivi(db, validi, risultato)
+            risultato["righe"] += len(blocco)
+            posizione()
+            if checkpoint:
+                checkpoint(db, risultato)
+            db.commit()
+            if progresso:
+                progresso(risultato)
+
+        return risultato
+
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def importa_clienti_csv(file, settore_default="generico", righe_per_blocco=RIGHE_PER_BLOCCO,
+                        progresso=None, checkpoint=None, salta_righe=0, processi=1):
+    """
+    Importa clienti da CSV: percorso, stream di testo o stream binario
+    (decodificato al volo, es. l'upload di Flask, senza passare dal disco).
+
+    Colonne: phone (obbligatoria), nome, azienda, settore, email, etichette,
+    note, numero_messaggi, stato. I numeri già presenti vengono contati come
+    duplicati e non modificati.
+
+    - progresso(risultato): chiamata dopo il commit di ogni blocco
+    - checkpoint(db, risultato): chiamata prima del commit, nella stessa
+      transazione del blocco (per salvare il punto di ripresa)
+    - salta_righe: righe di dati già importate da saltare
+    - processi: con un percorso e processi > 1, lettura e validazione
+      in parallelo; le scritture restano in questo processo
+
+    Ritorna {"righe", "aggiunti", "duplicati", "errori": ["Riga N: ...", ...]}
+    (righe = righe lette, escluse quelle saltate; da un percorso anche "byte_letti").
+    """
+    prepara = partial(_prepara_clienti, settore_default=settore_default)
+    return _importa_csv(
+        file, 'phone', prepara, _scrivi_clienti, righe_per_blocco, progresso, checkpoint, salta_righe, processi
+    )
+
+
+def importa_faq_csv(file, righe_per_blocco=RIGHE_PER_BLOCCO, progresso=None, checkpoint=None,
+                    salta_righe=0, processi=1):
+    """
+    Importa FAQ da CSV (percorso, stream di testo o binario).
+
+    Colonne: domanda_completa e risposta (obbligatorie), domanda_keywords,
+    settore, priorita. Parametri e risultato come importa_clienti_csv.
+    """
+    return _importa_csv(
+        file, 'domanda_completa', partial(_prepara_righe, _prepara_faq), _scrivi_faq, righe_per_blocco, progresso, checkpoint,
+        salta_righe, processi
+    )
+
+
+# ============================================================================
+# JOB IN BACKGROUND
+# ============================================================================
+
+IMPORTATORI = {
+    "clienti": importa_clienti_csv,
+    "faq": importa_faq_csv,
+}
+
+# Errori salvati nel job (il conteggio resta completo in numero_errori)
+MAX_ERRORI_SALVATI = 1000
+
+
+def crea_job_import(tipo, sorgente, nome_file=""):
+    """
+    Salva il CSV in Config.IMPORT_DIR, registra il job e lo avvia in un thread.
+
+    sorgente: file binario aperto (es. request.files['file'].stream).
+    Ritorna l'id del job.
+    """
+    if tipo not in IMPORTATORI:
+        raise ValueError(f"Tipo di import sconosciuto: {tipo}")
+
+    # Il file su disco serve per riprendere il job dopo un crash
+    os.makedirs(Config.IMPORT_DIR, exist_ok=True)
+    job_id = uuid.uuid4().hex
+    percorso = os.path.join(Config.IMPORT_DIR, f"{job_id}.csv")
+
+    try:
+        with open(percorso, "wb") as destinazione:
+            shutil.copyfileobj(sorgente, destinazione, 1024 * 1024)
+    except OSError:
+        if os.path.exists(percorso):
+            os.remove(percorso)
+        raise
+
+    db = get_db_session()
+    try:
+        db.add(ImportJobDB(
+            id=job_id,
+            tipo=tipo,
+            file=percorso,
+            nome_file=nome_file,
+            dimensione_file=os.path.getsize(percorso),
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+    print(f"📥 Job import {tipo} {job_id} creato ({nome_file})")
+    if _prendi_job(job_id, ImportJobDB.stato == "in_attesa"):
+        _avvia_thread(job_id)
+    return job_id
+
+
+def _prendi_job(job_id, condizione):
+    """
+    Segna il job come in corso solo se soddisfa ancora la condizione.
+
+    È un solo UPDATE: con più worker (o più processi che cercano job
+    interrotti) uno solo lo prende.
+    """
+    adesso = datetime.utcnow()
+    db = get_db_session()
+    try:
+        preso = db.execute(
+            update(ImportJobDB)
+            .where(ImportJobDB.id == job_id, condizione)
+            .values(
+                stato="in_corso",
+                tentativi=ImportJobDB.tentativi + 1,
+                ripreso_il=adesso,
+                righe_ripresa=ImportJobDB.righe,
+                aggiornato_il=adesso,
+            )
+        ).rowcount == 1
+        db.commit()
+        return preso
+    finally:
+        db.close()
+
+
+def _avvia_thread(job_id):
+    threading.Thread(target=_esegui_job, args=(job_id,), daemon=True).start()
+
+
+class _JobRipresoAltrove(Exception):
+    """Un altro processo ha ripreso il job: questa esecuzione si ferma"""
+
+
+def _rimuovi_file(percorso):
+    """Il CSV del job non serve più (completato o fallito: non verrà ripreso)"""
+    try:
+        os.remove(percorso)
+    except FileNotFoundError:
+        pass
+
+
+def _chiudi_job(job_id, esecuzione, stato, messaggio_errore=None):
+    db = get_db_session()
+    try:
+        db.execute(
+            update(ImportJobDB)
+            .where(ImportJobDB.id == job_id, ImportJobDB.ripreso_il == esecuzione)
+            .values(stato=stato, messaggio_errore=messaggio_errore, completato_il=datetime.utcnow())
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _esegui_job(job_id):
+    """Esegue (o riprende) un job già preso con _prendi_job"""
+    db = get_db_session()
+    try:
+        job = db.get(ImportJobDB, job_id)
+        tipo, percorso, esecuzione = job.tipo, job.file, job.ripreso_il
+        base = {
+            "righe": job.righe,
+            "aggiunti": job.aggiunti,
+            "duplicati": job.duplicati,
+            "numero_errori": job.numero_errori,
+        }
+        errori_salvati = json.loads(job.errori or "[]")
+    finally:
+        db.close()
+
+    if base["righe"]:
+        print(f"🔄 Ripresa job import {job_id} dalla riga {base['righe'] + 2}")
+
+    def checkpoint(db_blocco, risultato):
+        # Stessa transazione del blocco: contatori e righe importate
+        # vengono salvati insieme o per niente
+        spazio = max(MAX_ERRORI_SALVATI - len(errori_salvati), 0)
+        aggiornato = db_blocco.execute(
+            update(ImportJobDB)
+            .where(ImportJobDB.id == job_id, ImportJobDB.ripreso_il == esecuzione)
+            .values(
+                righe=base["righe"] + risultato["righe"],
+                aggiunti=base["aggiunti"] + risultato["aggiunti"],
+                duplicati=base["duplicati"] + risultato["duplicati"],
+                numero_errori=base["numero_errori"] + len(risultato["errori"]),
+                errori=json.dumps(errori_salvati + risultato["errori"][:spazio], ensure_ascii=False),
+                byte_letti=risultato.get("byte_letti", 0),
+                aggiornato_il=datetime.utcnow(),
+            )
+        )
+        if aggiornato.rowcount == 0:
+            raise _JobRipresoAltrove()
+
+    try:
+        risultato = IMPORTATORI[tipo](
+            percorso, checkpoint=checkpoint, salta_righe=base["righe"], processi=Config.IMPORT_PROCESSI
+        )
+    except _JobRipresoAltrove:
+        print(f"⚠️  Job import {job_id} ripreso da un altro processo, esecuzione fermata")
+        return
+    except Exception as e:
+        if isinstance(e, DBAPIError) and not isinstance(e, (IntegrityError, DataError)):
+            # Database non raggiungibile o bloccato: errore temporaneo. Il job
+            # resta in_corso dall'ultimo checkpoint e riprendi_import_interrotti
+            # lo riprende dopo Config.IMPORT_JOB_TIMEOUT (al massimo
+            # Config.IMPORT_JOB_TENTATIVI volte)
+            print(f"⚠️  Job import {job_id} interrotto da un errore del database, verrà ripreso: {e}")
+            return
+        # File o dati non validi: riprovare darebbe lo stesso errore
+        print(f"❌ Job import {job_id} fallito: {e}")
+        _chiudi_job(job_id, esecuzione, "fallito", str(e))
+        _rimuovi_file(percorso)
+        return
+
+    _chiudi_job(job_id, esecuzione, "completato")
+    invalida_cache()
+    _rimuovi_file(percorso)
+    print(
+        f"✅ Job import {job_id} completato: {base['aggiunti'] + risultato['aggiunti']} aggiunti, "
+        f"{base['duplicati'] + risultato['duplicati']} duplicati"
+    )
+
+
+def riprendi_import_interrotti():
+    """
+    Riprende i job rimasti in attesa o in corso senza progressi da
+    Config.IMPORT_JOB_TIMEOUT secondi (processo riavviato o crashato).
+
+    Dopo Config.IMPORT_JOB_TENTATIVI tentativi il job viene segnato fallito
+    (e il suo CSV eliminato). Ritorna il numero di job ripresi.
+    """
+    soglia = datetime.utcnow() - timedelta(seconds=Config.IMPORT_JOB_TIMEOUT)
+    fermo = ImportJobDB.stato.in_(("in_attesa", "in_corso")) & (ImportJobDB.aggiornato_il < soglia)
+
+    db = get_db_session()
+    try:
+        fermi = db.execute(
+            select(ImportJobDB.id, ImportJobDB.tentativi, ImportJobDB.file).where(fermo)
+        ).all()
+    finally:
+        db.close()
+
+    ripresi = 0
+    for job_id, tentativi, percorso in fermi:
+        if tentativi >= Config.IMPORT_JOB_TENTATIVI:
+            db = get_db_session()
+            try:
+                abbandonato = db.execute(
+                    update(ImportJobDB)
+                    .where(ImportJobDB.id == job_id, fermo)
+                    .values(
+                        stato="fallito",
+                        messaggio_errore=f"Interrotto {tentativi} volte, abbandonato",
+                        completato_il=datetime.utcnow(),
+                    )
+                ).rowcount == 1
+                db.commit()
+            finally:
+                db.close()
+            if abbandonato:
+                _rimuovi_file(percorso)
+            continue
+
+        if _prendi_job(job_id, fermo):
+            _avvia_thread(job_id)
+            ripresi += 1
+
+    return ripresi
+
+
+def stato_job(job_id):
+    """Avanzamento del job per /api/import/jobs/<id> (None se non esiste)"""
+    db = get_db_session()
+    try:
+        job = db.get(ImportJobDB, job_id)
+        if job is None:
+            return None
+
+        # Velocità dell'esecuzione corrente (dopo una ripresa riparte da zero)
+        velocita = None
+        if job.ripreso_il and job.aggiornato_il > job.ripreso_il:
+            secondi = (job.aggiornato_il - job.ripreso_il).total_seconds()
+            velocita = (job.righe - (job.righe_ripresa or 0)) / secondi
+
+        completato = job.stato == "completato"
+        percentuale = 100.0 if completato else (
+            min(job.byte_letti / job.dimensione_file * 100, 99.9) if job.dimensione_file else 0.0
+        )
+
+        # Righe totali stimate dalla dimensione media delle righe già lette
+        eta = 0 if completato else None
+        if not completato and velocita and job.byte_letti:
+            righe_stimate = job.righe * job.dimensione_file / job.byte_letti
+            eta = round(max(righe_stimate - job.righe, 0) / velocita)
+
+        return {
+            "id": job.id,
+            "tipo": job.tipo,
+            "nome_file": job.nome_file,
+            "stato": job.stato,
+            "righe": job.righe,
+            "aggiunti": job.aggiunti,
+            "duplicati": job.duplicati,
+            "numero_errori": job.numero_errori,
+            "errori": json.loads(job.errori or "[]")[:100],
+            "messaggio_errore": job.messaggio_errore,
+            "percentuale": round(percentuale, 1),
+            "righe_al_secondo": round(velocita, 1) if velocita else None,
+            "eta_secondi": eta,
+            "tentativi": job.tentativi,
+            "creato_il": job.creato_il.isoformat() if job.creato_il else None,
+            "aggiornato_il": job.aggiornato_il.isoformat() if job.aggiornato_il else None,
+            "completato_il": job.completato_il.isoformat() if job.completato_il else None,
+        }
+    finally:
+        db.close()
@@ -6,7 +6,7 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from config import Config
-from database import get_db_session, ClienteDB
+from database import get_read_session, ClienteDB
 from datetime import datetime, timedelta
 import requests
 
@@ -185,7 +185,7 @@ def sync_clienti_a_google_sheets():
         return False
 
     # --- Legge dal DB ---
-    db = get_db_session()
+    db = get_read_session()
     try:
         clienti = db.query(ClienteDB).order_by(ClienteDB.data_creazione.asc()).all()
     finally:
@@ -238,7 +238,7 @@ def sync_clienti_a_google_sheets():
 def invia_report_settimanale():
     """Invia report settimanale all'admin"""
 
-    db = get_db_session()
+    db = get_read_session()
 
     try:
         tot_clienti = db.query(ClienteDB).count()
@@ -0,0 +1,127 @@
+"""
+Outbound - Registro degli invii automatici (tabella messaggi_outbound)
+
+Ogni campagna dello scheduler (benvenuto, reminder, upsell) scrive una
+riga per (cliente, campagna, periodo) PRIMA di chiamare WhatsApp:
+- le query di selezione escludono i clienti che hanno già la riga
+  (NOT EXISTS sull'indice unico), quindi ogni esecuzione tocca solo
+  chi non è ancora stato servito nel periodo
+- la riga viene prenotata con un INSERT ... ON CONFLICT: due esecuzioni
+  sovrapposte non possono mandare lo stesso messaggio due volte
+- un invio fallito resta "fallito" e viene riprovato alle esecuzioni
+  successive fino a Config.OUTBOUND_TENTATIVI; uno rimasto "in_invio"
+  (processo interrotto a metà) non viene ripetuto
+"""
+
+from datetime import datetime
+from sqlalchemy import and_, exists, or_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from config import Config
+from database import ClienteDB, MessaggioOutboundDB
+from routes.webhook import invia_messaggio_whatsapp
+
+# Campagne che si inviano una volta sola per cliente
+PERIODO_UNICO = "unico"
+
+
+def periodo_settimana(giorno):
+    """date -> "2025-W03" (settimana ISO)"""
+    anno, settimana, _ = giorno.isocalendar()
+    return f"{anno}-W{settimana:02d}"
+
+
+def periodo_mese(giorno):
+    """date -> "2025-01\""""
+    return f"{giorno.year}-{giorno.month:02d}"
+
+
+# ============================================================================
+# SELEZIONE
+# ============================================================================
+
+def escludi_gia_serviti(query, campagna, periodo):
+    """
+    Toglie da una query clienti chi ha già ricevuto (o sta ricevendo) la
+    campagna nel periodo. Restano i falliti con tentativi rimasti.
+    """
+    o = MessaggioOutboundDB
+    return query.filter(~exists().where(
+        o.cliente_id == ClienteDB.id,
+        o.campagna == campagna,
+        o.periodo == periodo,
+        or_(o.stato != "fallito", o.tentativi >= Config.OUTBOUND_TENTATIVI),
+    ))
+
+
+# ============================================================================
+# INVIO
+# ============================================================================
+
+def _prenota(db, cliente_id, campagna, periodo):
+    """
+    Crea la riga "in_invio" (o riprende una "fallita"); True se l'invio
+    tocca a questa esecuzione. Il commit resta al chiamante.
+    """
+    tabella = MessaggioOutboundDB.__table__
+    adesso = datetime.utcnow()
+    valori = dict(cliente_id=cliente_id, campagna=campagna, periodo=periodo,
+                  stato="in_invio", tentativi=1, creato_il=adesso)
+    dialetto = db.get_bind().dialect.name
+
+    if dialetto in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialetto == "sqlite" else pg_insert
+        stmt = insert(tabella).values(**valori).on_conflict_do_update(
+            index_elements=["cliente_id", "campagna", "periodo"],
+            set_={"stato": "in_invio", "tentativi": tabella.c.tentativi + 1},
+            where=and_(tabella.c.stato == "fallito", tabella.c.tentativi < Config.OUTBOUND_TENTATIVI),
+        )
+        return db.execute(stmt.returning(tabella.c.id)).first() is not None
+
+    risultato = db.execute(
+        update(tabella)
+        .where(
+            tabella.c.cliente_id == cliente_id, tabella.c.campagna == campagna,
+            tabella.c.periodo == periodo, tabella.c.stato == "fallito",
+            tabella.c.tentativi < Config.OUTBOUND_TENTATIVI,
+        )
+        .values(stato="in_invio", tentativi=tabella.c.tentativi + 1)
+    )
+    if risultato.rowcount:
+        return True
+    try:
+        with db.begin_nested():
+            db.execute(tabella.insert().values(**valori))
+        return True
+    except IntegrityError:
+        return False
+
+
+def invia_campagna(db, cliente, campagna, periodo, testo):
+    """
+    Manda il messaggio di una campagna se il cliente non l'ha già ricevuto
+    nel periodo, registrando l'esito in messaggi_outbound.
+
+    Ritorna True (inviato), False (invio fallito) o None (già servito).
+    Fa commit: la prenotazione deve essere salvata prima dell'invio.
+    """
+    if not _prenota(db, cliente.id, campagna, periodo):
+        db.commit()
+        return None
+    db.commit()
+
+    inviato = invia_messaggio_whatsapp(cliente.phone, testo)
+
+    db.execute(
+        update(MessaggioOutboundDB)
+        .where(
+            MessaggioOutboundDB.cliente_id == cliente.id,
+            MessaggioOutboundDB.campagna == campagna,
+            MessaggioOutboundDB.periodo == periodo,
+        )
+        .values(stato="inviato" if inviato else "fallito",
+                inviato_il=datetime.utcnow() if inviato else None)
+    )
+    db.commit()
+    return inviato
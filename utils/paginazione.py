@@ -0,0 +1,124 @@
+"""
+Paginazione - Cursori keyset e conteggi in cache per le liste della dashboard
+"""
+
+import base64
+import json
+import time
+from datetime import datetime
+from sqlalchemy import DateTime, and_, or_
+from config import Config
+
+# Conteggi recenti: chiave -> (timestamp, totale)
+_cache_conteggi = {}
+_MAX_CONTEGGI_IN_CACHE = 1000
+
+
+# ============================================================================
+# CURSORI
+# ============================================================================
+
+def codifica_cursore(valore, id_riga):
+    """(valore colonna, id) -> token opaco per il client"""
+    if isinstance(valore, datetime):
+        valore = valore.isoformat()
+    dati = json.dumps([valore, id_riga], separators=(",", ":"))
+    return base64.urlsafe_b64encode(dati.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decodifica_cursore(token, colonna):
+    """
+    Token -> (valore, id). Solleva ValueError se il token non è valido.
+
+    Il valore viene riportato al tipo della colonna (es. datetime).
+    """
+    try:
+        padding = "=" * (-len(token) % 4)
+        valore, id_riga = json.loads(base64.urlsafe_b64decode(token + padding))
+        if isinstance(colonna.type, DateTime) and valore is not None:
+            valore = datetime.fromisoformat(valore)
+        return valore, int(id_riga)
+    except Exception:
+        raise ValueError("Cursore non valido")
+
+
+def pagina_keyset(query, colonna, colonna_id, cursore, limite, discendente=True):
+    """
+    Una pagina di risultati ordinati per (colonna, id) a partire dal cursore.
+
+    Il costo non dipende da quanto si è lontani dall'inizio: il database
+    salta direttamente alla chiave del cursore invece di scartare
+    OFFSET righe. cursore vuoto = prima pagina.
+
+    Le righe con colonna NULL (solo colonne nullable) vengono in fondo,
+    in entrambe le direzioni, ordinate per id. Sono lette con una seconda
+    query solo per id: la prima resta sull'indice (colonna, id), senza
+    ordinamenti calcolati su tutto il filtro.
+
+    Ritorna (righe, cursore_successivo), con cursore_successivo None
+    sull'ultima pagina.
+    """
+    valore = id_riga = None
+    if cursore:
+        valore, id_riga = decodifica_cursore(cursore, colonna)
+
+    if discendente:
+        ordinamento = (colonna.desc(), colonna_id.desc())
+        dopo_id = colonna_id < id_riga if cursore else None
+    else:
+        ordinamento = (colonna.asc(), colonna_id.asc())
+        dopo_id = colonna_id > id_riga if cursore else None
+
+    # Una riga in più per sapere se esiste la pagina successiva
+    righe = []
+    if not cursore or valore is not None:
+        valori = query
+        if cursore:
+            dopo = colonna < valore if discendente else colonna > valore
+            valori = valori.filter(or_(dopo, and_(colonna == valore, dopo_id)))
+        if colonna.nullable:
+            valori = valori.filter(colonna.isnot(None))
+        righe = valori.order_by(None).order_by(*ordinamento).limit(limite + 1).all()
+
+    if colonna.nullable and len(righe) <= limite:
+        # Coda dei NULL, dopo l'ultima riga con un valore
+        nulli = query.filter(colonna.is_(None))
+        if cursore and valore is None:
+            nulli = nulli.filter(dopo_id)
+        righe += nulli.order_by(None).order_by(ordinamento[1]).limit(limite + 1 - len(righe)).all()
+
+    cursore_successivo = None
+    if len(righe) > limite:
+        righe = righe[:limite]
+        ultima = righe[-1]
+        cursore_successivo = codifica_cursore(
+            getattr(ultima, colonna.key), getattr(ultima, colonna_id.key)
+        )
+
+    return righe, cursore_successivo
+
+
+# ============================================================================
+# CONTEGGI
+# ============================================================================
+
+def conta_con_cache(chiave, query):
+    """
+    COUNT della query, riusato per Config.CONTEGGI_CACHE_TTL secondi.
+
+    Il totale è approssimato (può essere indietro di qualche secondo)
+    ma scorrere le pagine non ripete il COUNT sull'intero filtro.
+    """
+    adesso = time.monotonic()
+    in_cache = _cache_conteggi.get(chiave)
+
+    if in_cache and adesso - in_cache[0] < Config.CONTEGGI_CACHE_TTL:
+        return in_cache[1]
+
+    totale = query.order_by(None).count()
+
+    # Ogni ricerca diversa è una chiave: evita che la cache cresca senza limiti
+    if len(_cache_conteggi) >= _MAX_CONTEGGI_IN_CACHE:
+        _cache_conteggi.clear()
+    _cache_conteggi[chiave] = (adesso, totale)
+    return totale
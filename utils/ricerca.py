@@ -0,0 +1,281 @@
+"""
+Ricerca full-text - Indici FTS per la ricerca clienti e FAQ della dashboard
+
+SQLite: tabelle virtuali FTS5 (external content) tenute allineate da trigger
+PostgreSQL: colonna tsvector generata + indice GIN
+Altri database (o SQLite senza FTS5): ricerca ILIKE come prima
+"""
+
+import re
+from sqlalchemy import and_, bindparam, column, func, literal_column, or_, select, text, true, union, Float, Integer
+from config import Config
+from database import engine, ClienteDB, FAQDB
+
+# Configurazione per tabella: colonne indicizzate e dizionario PostgreSQL
+# ('simple' per nomi/telefoni, 'italian' per il testo delle FAQ)
+INDICI_FULLTEXT = {
+    "clienti": {
+        "modello": ClienteDB,
+        "colonne": ["nome", "phone", "email", "azienda"],
+        "pg_config": "simple",
+        # Le parole solo cifre si cercano anche come inizio del numero E.164
+        # ("333" trova "+393331234567": per l'indice è un'unica parola)
+        "telefono": "phone",
+    },
+    "faq": {
+        "modello": FAQDB,
+        "colonne": ["domanda_completa", "domanda_keywords"],
+        "pg_config": "italian",
+    },
+}
+
+# Tabelle per cui l'indice è attivo (riempito da init_ricerca_fulltext)
+_indici_attivi = set()
+
+
+# ============================================================================
+# CREAZIONE INDICI
+# ============================================================================
+
+def _crea_fts5(conn, tabella, colonne):
+    """Crea tabella FTS5, trigger di sincronizzazione e ricostruisce se nuova"""
+    fts = f"{tabella}_fts"
+    elenco = ", ".join(colonne)
+    nuovi = ", ".join(f"new.{c}" for c in colonne)
+    vecchi = ", ".join(f"old.{c}" for c in colonne)
+
+    esiste = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)
+    ).first()
+
+    conn.exec_driver_sql(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            {elenco},
+            content='{tabella}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    """)
+
+    conn.exec_driver_sql(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {tabella} BEGIN
+            INSERT INTO {fts}(rowid, {elenco}) VALUES (new.id, {nuovi});
+        END
+    """)
+    conn.exec_driver_sql(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {tabella} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {elenco}) VALUES ('delete', old.id, {vecchi});
+        END
+    """)
+    # Solo sulle colonne indicizzate: gli UPDATE del webhook
+    # (numero_messaggi, ultima_interazione) non toccano l'indice
+    conn.exec_driver_sql(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {elenco} ON {tabella} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {elenco}) VALUES ('delete', old.id, {vecchi});
+            INSERT INTO {fts}(rowid, {elenco}) VALUES (new.id, {nuovi});
+        END
+    """)
+
+    if not esiste:
+        conn.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+        print(f"   ➕ Indice full-text creato: {fts}")
+
+
+def _crea_tsvector(conn, tabella, colonne, pg_config):
+    """Aggiunge la colonna tsvector generata e l'indice GIN"""
+    documento = " || ' ' || ".join(f"coalesce({c}, '')" for c in colonne)
+
+    conn.exec_driver_sql(f"""
+        ALTER TABLE {tabella} ADD COLUMN IF NOT EXISTS ricerca_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('{pg_config}', {documento})) STORED
+    """)
+    conn.exec_driver_sql(f"""
+        CREATE INDEX IF NOT EXISTS ix_{tabella}_ricerca_tsv
+        ON {tabella} USING GIN (ricerca_tsv)
+    """)
+
+
+def init_ricerca_fulltext():
+    """
+    Crea (se mancano) gli indici full-text per clienti e FAQ.
+
+    Idempotente, chiamata da init_db(). Se il database non supporta
+    la ricerca full-text la dashboard continua a usare ILIKE.
+    """
+    dialetto = engine.dialect.name
+
+    for tabella, conf in INDICI_FULLTEXT.items():
+        try:
+            with engine.begin() as conn:
+                if dialetto == "sqlite":
+                    _crea_fts5(conn, tabella, conf["colonne"])
+                elif dialetto == "postgresql":
+                    _crea_tsvector(conn, tabella, conf["colonne"], conf["pg_config"])
+                else:
+                    continue
+            _indici_attivi.add(tabella)
+        except Exception as e:
+            print(f"⚠️  Ricerca full-text non disponibile per {tabella}: {e}")
+
+
+def sospendi_ricerca_fulltext(conn, tabelle=None):
+    """
+    Toglie trigger FTS5 / indici GIN prima di un caricamento massivo
+    (ripristino backup, sync del catalogo FAQ): ricostruire alla fine
+    costa meno che aggiornare l'indice riga per riga.
+
+    tabelle: solo alcune tra quelle di INDICI_FULLTEXT (default tutte)
+    """
+    dialetto = conn.dialect.name
+
+    for tabella in tabelle or INDICI_FULLTEXT:
+        if dialetto == "sqlite":
+            for suffisso in ("ai", "ad", "au"):
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {tabella}_fts_{suffisso}")
+        elif dialetto == "postgresql":
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS ix_{tabella}_ricerca_tsv")
+
+
+def ricostruisci_ricerca_fulltext(conn, tabelle=None):
+    """Ricrea trigger / indici tolti da sospendi_ricerca_fulltext e ricostruisce l'indice"""
+    dialetto = conn.dialect.name
+
+    for tabella in tabelle or INDICI_FULLTEXT:
+        conf = INDICI_FULLTEXT[tabella]
+        if dialetto == "sqlite":
+            fts = f"{tabella}_fts"
+            esiste = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)
+            ).first()
+            if esiste:
+                _crea_fts5(conn, tabella, conf["colonne"])
+                conn.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+        elif dialetto == "postgresql":
+            _crea_tsvector(conn, tabella, conf["colonne"], conf["pg_config"])
+
+
+def _indice_attivo(tabella):
+    """True se l'indice full-text esiste (verificato una volta per processo)"""
+    if tabella in _indici_attivi:
+        return True
+
+    dialetto = engine.dialect.name
+    with engine.connect() as conn:
+        if dialetto == "sqlite":
+            trovato = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (f"{tabella}_fts",)
+            ).first()
+        elif dialetto == "postgresql":
+            trovato = conn.execute(text(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = :t AND column_name = 'ricerca_tsv'"
+            ), {"t": tabella}).first()
+        else:
+            trovato = None
+
+    if trovato:
+        _indici_attivi.add(tabella)
+    return bool(trovato)
+
+
+# ============================================================================
+# RICERCA
+# ============================================================================
+
+def _termini(ricerca):
+    """Parole cercabili (lettere/cifre), senza sintassi FTS dell'utente"""
+    return re.findall(r"\w+", ricerca.lower())
+
+
+def _inizio_telefono(colonna, cifre):
+    """
+    Condizione "il numero E.164 inizia con queste cifre" (prese in ordine,
+    "347 886" = "347886"), come intervallo sull'indice della colonna.
+
+    Le cifre valgono come numero nazionale (+39...) o, se già con il
+    prefisso internazionale (anche 00...), come numero completo.
+    """
+    numero = "".join(cifre)
+    if numero.startswith("00"):
+        inizi = [f"+{numero[2:]}"]
+    else:
+        inizi = [f"+{Config.TELEFONO_PREFISSO}{numero}", f"+{numero}"]
+
+    # >= "+39347" e < "+39348": usa l'indice anche dove LIKE non può
+    return or_(*[
+        and_(colonna >= inizio, colonna < inizio[:-1] + chr(ord(inizio[-1]) + 1))
+        for inizio in inizi
+    ])
+
+
+def applica_ricerca(query, tabella, ricerca):
+    """
+    Filtra una query ORM (su clienti o faq) per il testo cercato.
+
+    Ogni parola è cercata come prefisso ("mar ros" trova "Mario Rossi")
+    e tutte devono comparire. Con l'indice full-text i risultati sono
+    ordinati per rilevanza; senza, si usa ILIKE come fallback.
+
+    Sui clienti le parole solo cifre valgono anche come inizio del numero
+    (vedi _inizio_telefono): trovati anche quelli con il telefono che inizia
+    così e le altre parole nell'indice (dopo i risultati full-text).
+    """
+    conf = INDICI_FULLTEXT[tabella]
+    modello = conf["modello"]
+    termini = _termini(ricerca)
+
+    if not termini:
+        return query
+
+    if not _indice_attivo(tabella):
+        colonne = [getattr(modello, c) for c in conf["colonne"]]
+        return query.filter(or_(*[c.ilike(f"%{ricerca}%") for c in colonne]))
+
+    cifre = [t for t in termini if t.isdigit()] if conf.get("telefono") else []
+    parole = [t for t in termini if t not in cifre]
+    if cifre:
+        nel_telefono = _inizio_telefono(getattr(modello, conf["telefono"]), cifre)
+
+    if engine.dialect.name == "sqlite":
+        fts = f"{tabella}_fts"
+
+        def corrispondenze(termini):
+            return text(
+                f"SELECT rowid AS id, bm25({fts}) AS rank FROM {fts} WHERE {fts} MATCH :match"
+            ).bindparams(
+                # unique: le due sottoquery hanno ognuna il suo :match
+                bindparam("match", " ".join(f'"{t}"*' for t in termini), unique=True)
+            ).columns(
+                column("id", Integer), column("rank", Float)
+            ).subquery()
+
+        risultati = corrispondenze(termini)
+        if not cifre:
+            # bm25: più basso = più rilevante
+            return query.join(risultati, risultati.c.id == modello.id).order_by(
+                risultati.c.rank, modello.id
+            )
+
+        # Unione di id (indice FTS + intervallo sul telefono): con un OR
+        # nel WHERE SQLite scorrerebbe tutta la tabella
+        resto = modello.id.in_(select(corrispondenze(parole).c.id)) if parole else true()
+        candidati = union(
+            select(corrispondenze(termini).c.id),
+            select(modello.id).where(nel_telefono, resto),
+        )
+        return query.outerjoin(risultati, risultati.c.id == modello.id).filter(
+            modello.id.in_(candidati)
+        ).order_by(risultati.c.rank.is_(None), risultati.c.rank, modello.id)
+
+    def tsquery(termini):
+        return func.to_tsquery(conf["pg_config"], " & ".join(f"{t}:*" for t in termini))
+
+    documento = literal_column(f"{tabella}.ricerca_tsv")
+    condizione = documento.op("@@")(tsquery(termini))
+    if cifre:
+        resto = documento.op("@@")(tsquery(parole)) if parole else true()
+        condizione = or_(condizione, and_(nel_telefono, resto))
+    return query.filter(condizione).order_by(
+        func.ts_rank(documento, tsquery(termini)).desc(), modello.id
+    )
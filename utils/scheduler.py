@@ -1,12 +1,35 @@
 """
 Scheduler - Sistema di automazioni e task programmati
 Usa APScheduler per eseguire job periodicamente
+
+Con più worker (gunicorn -w N) ogni processo importa app.py, ma i task
+girano in uno solo: il leader, cioè chi tiene il lease nella tabella
+scheduler_lease. Gli altri restano in attesa e, se il leader smette di
+rinnovare il lease (processo morto o bloccato), uno di loro lo prende
+alla scadenza. I job stanno nel database (tabella apscheduler_jobs),
+così il nuovo leader riparte dai prossimi orari già calcolati e recupera
+le esecuzioni perse entro Config.SCHEDULER_MISFIRE_GRACE (una sola per
+task, anche se ne ha perse diverse).
 """
 
+import os
+import socket
+import threading
+import uuid
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
-from database import get_db_session, ClienteDB, MessaggioDB, UserDB
-from routes.webhook import invia_messaggio_whatsapp
+from sqlalchemy import case, or_, update
+from sqlalchemy.exc import IntegrityError
+from database import engine, get_db_session, get_read_session, ClienteDB, MessaggioDB, UserDB, SchedulerLeaseDB
+from utils.tag import filtra_per_tag
+from utils.statistiche import ricalcola_statistiche, popola_statistiche_se_vuote, oggi_locale
+from utils.backup import esegui_backup
+from utils.importazione import riprendi_import_interrotti
+from utils.outbound import (
+    PERIODO_UNICO, periodo_settimana, periodo_mese, escludi_gia_serviti, invia_campagna
+)
+from config import Config
 from datetime import datetime, timedelta
 import logging
 
@@ -14,7 +37,14 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-scheduler = BackgroundScheduler()
+scheduler = BackgroundScheduler(
+    jobstores={"default": SQLAlchemyJobStore(engine=engine, tablename="apscheduler_jobs")},
+    job_defaults={
+        "coalesce": True,  # più esecuzioni perse = una sola
+        "max_instances": 1,
+        "misfire_grace_time": Config.SCHEDULER_MISFIRE_GRACE,
+    },
+)
 
 # ============================================================================
 # TASK 1: BENVENUTO AL PRIMO MESSAGGIO
@@ -23,7 +53,7 @@ scheduler = BackgroundScheduler()
 def task_benvenuto_nuovo_cliente():
     """
     Invia messaggio di benvenuto ai nuovi clienti
-    (che non hanno ancora interagito)
+    (che non hanno ancora interagito), una volta sola per cliente
     
     Eseguito: Ogni 1 ora
     """
@@ -35,10 +65,11 @@ def task_benvenuto_nuovo_cliente():
         # Clienti creati nelle ultime 24 ore senza messaggi
         ieri = datetime.utcnow() - timedelta(days=1)
         
-        nuovi_clienti = db.query(ClienteDB).filter(
+        # Esclusi quelli già salutati nelle esecuzioni precedenti
+        nuovi_clienti = escludi_gia_serviti(db.query(ClienteDB), "benvenuto", PERIODO_UNICO).filter(
             ClienteDB.data_creazione >= ieri,
             ClienteDB.numero_messaggi == 0
-        ).all()
+        ).order_by(ClienteDB.id).all()
         
         if not nuovi_clienti:
             print("   ℹ️  Nessun nuovo cliente da salutare")
@@ -60,9 +91,10 @@ Siamo qui per aiutarti con:
 📞 Contattaci per qualsiasi domanda!"""
             
             try:
-                invia_messaggio_whatsapp(cliente.phone, messaggio)
-                print(f"   📨 Benvenuto inviato a {cliente.nome} ({cliente.phone})")
+                if invia_campagna(db, cliente, "benvenuto", PERIODO_UNICO, messaggio):
+                    print(f"   📨 Benvenuto inviato a {cliente.nome} ({cliente.phone})")
             except Exception as e:
+                db.rollback()
                 print(f"   ❌ Errore invio a {cliente.phone}: {e}")
     
     except Exception as e:
@@ -75,11 +107,26 @@ Siamo qui per aiutarti con:
 # TASK 2: REMINDER SETTIMANALE
 # ============================================================================
 
-def task_reminder_settimanale():
+def seleziona_segmento(query, settore="", tag=""):
+    """
+    Restringe una query clienti a un segmento (settore e/o tag).
+    
+    tag accetta "VIP" o "VIP|Attivo" (il cliente deve averli tutti).
+    """
+    if settore:
+        query = query.filter(ClienteDB.settore == settore)
+    if tag:
+        query = filtra_per_tag(query, tag)
+    return query
+
+
+def task_reminder_settimanale(settore="", tag=""):
     """
-    Invia reminder settimanale ai clienti attivi
+    Invia reminder settimanale ai clienti attivi (una volta a settimana
+    per cliente: il limite di 10 passa ai successivi, non agli stessi)
     
     Eseguito: Ogni lunedì mattina alle 9:00
+    Segmento: Config.REMINDER_SETTORE / Config.REMINDER_TAG (vuoti = tutti)
     """
     print("\n🤖 [TASK] Inviando reminder settimanali...")
     
@@ -88,15 +135,17 @@ def task_reminder_settimanale():
     try:
         # Clienti attivi (ultimi 30 giorni)
         trenta_giorni_fa = datetime.utcnow() - timedelta(days=30)
+        periodo = periodo_settimana(oggi_locale())
         
-        clienti_attivi = db.query(ClienteDB).filter(
+        query = seleziona_segmento(db.query(ClienteDB), settore, tag)
+        clienti_attivi = escludi_gia_serviti(query, "reminder", periodo).filter(
             ClienteDB.stato == 'attivo',
             ClienteDB.ultima_interazione >= trenta_giorni_fa
-        ).all()
+        ).order_by(ClienteDB.id).limit(10).all()  # Max 10 per volta
         
-        print(f"   ℹ️  Clienti attivi: {len(clienti_attivi)}")
+        print(f"   ℹ️  Clienti attivi da avvisare ({periodo}): {len(clienti_attivi)}")
         
-        for cliente in clienti_attivi[:10]:  # Max 10 per volta
+        for cliente in clienti_attivi:
             messaggio = f"""📢 Ciao {cliente.nome}! 
 
 Ricordati di noi questa settimana:
@@ -109,9 +158,10 @@ Ricordati di noi questa settimana:
 📞 Rispondi per prenotare!"""
             
             try:
-                invia_messaggio_whatsapp(cliente.phone, messaggio)
-                print(f"   📨 Reminder inviato a {cliente.nome}")
+                if invia_campagna(db, cliente, "reminder", periodo, messaggio):
+                    print(f"   📨 Reminder inviato a {cliente.nome}")
             except Exception as e:
+                db.rollback()
                 print(f"   ❌ Errore: {e}")
     
     except Exception as e:
@@ -124,11 +174,13 @@ Ricordati di noi questa settimana:
 # TASK 3: UPSELL INTELLIGENTE
 # ============================================================================
 
-def task_upsell_intelligente():
+def task_upsell_intelligente(settore="", tag=""):
     """
     Suggerisce servizi basati sulla storia e settore del cliente
+    (al massimo una volta al mese per cliente)
     
     Eseguito: Ogni 3 giorni
+    Segmento: Config.UPSELL_SETTORE / Config.UPSELL_TAG (vuoti = tutti)
     """
     print("\n🤖 [TASK] Analizzando clienti per upsell...")
     
@@ -137,16 +189,19 @@ def task_upsell_intelligente():
     try:
         # Clienti che non hanno messaggi da 7 giorni
         una_settimana_fa = datetime.utcnow() - timedelta(days=7)
+        periodo = periodo_mese(oggi_locale())
         
-        clienti_inattivi = db.query(ClienteDB).filter(
+        query = seleziona_segmento(db.query(ClienteDB), settore, tag)
+        clienti_inattivi = escludi_gia_serviti(query, "upsell", periodo).filter(
             ClienteDB.stato == 'attivo',
             ClienteDB.ultima_interazione < una_settimana_fa,
-            ClienteDB.numero_messaggi > 0  # Hanno interagito almeno una volta
-        ).all()
+            ClienteDB.numero_messaggi > 0,  # Hanno interagito almeno una volta
+            ClienteDB.settore.in_(('sport', 'coworking', 'finanza'))  # Settori con un'offerta
+        ).order_by(ClienteDB.id).limit(5).all()
         
-        print(f"   ℹ️  Clienti inattivi da ricontattare: {len(clienti_inattivi)}")
+        print(f"   ℹ️  Clienti inattivi da ricontattare ({periodo}): {len(clienti_inattivi)}")
         
-        for cliente in clienti_inattivi[:5]:
+        for cliente in clienti_inattivi:
             # Suggerimento basato su settore
             if cliente.settore == 'sport':
                 messaggio = """⚽ Manca il padel? 
@@ -182,9 +237,10 @@ Consulenza gratuita? 📋"""
                 continue
             
             try:
-                invia_messaggio_whatsapp(cliente.phone, messaggio)
-                print(f"   📨 Upsell inviato a {cliente.nome} (settore: {cliente.settore})")
+                if invia_campagna(db, cliente, "upsell", periodo, messaggio):
+                    print(f"   📨 Upsell inviato a {cliente.nome} (settore: {cliente.settore})")
             except Exception as e:
+                db.rollback()
                 print(f"   ❌ Errore: {e}")
     
     except Exception as e:
@@ -205,7 +261,7 @@ def task_notifiche_admin():
     """
     print("\n🤖 [TASK] Controllando attività importanti...")
     
-    db = get_db_session()
+    db = get_read_session()
     
     try:
         # Ultimi messaggi (ultimi 30 min)
@@ -247,7 +303,8 @@ def task_notifiche_admin():
 def task_pulizia_dati():
     """
     Pulizia periodica del database
-    - Elimina messaggi più vecchi di 90 giorni
+    - Elimina messaggi più vecchi di Config.MESSAGGI_CONSERVAZIONE_GIORNI
+      (90): il rollup statistiche di quei giorni resta
     - Archivia clienti inattivi
     
     Eseguito: Ogni domenica alle 2:00 AM
@@ -257,11 +314,11 @@ def task_pulizia_dati():
     db = get_db_session()
     
     try:
-        # Elimina messaggi vecchi di 90 giorni
-        novanta_giorni_fa = datetime.utcnow() - timedelta(days=90)
+        # Elimina messaggi vecchi (90 giorni di default)
+        limite = datetime.utcnow() - timedelta(days=Config.MESSAGGI_CONSERVAZIONE_GIORNI)
         
         messaggi_rimossi = db.query(MessaggioDB).filter(
-            MessaggioDB.data_messaggio < novanta_giorni_fa
+            MessaggioDB.data_messaggio < limite
         ).delete()
         
         db.commit()
@@ -274,10 +331,95 @@ def task_pulizia_dati():
         db.close()
 
 
+# ============================================================================
+# TASK 6: RICONCILIAZIONE STATISTICHE
+# ============================================================================
+
+def task_riconcilia_statistiche():
+    """
+    Ricalcola il rollup statistiche_giornaliere di ieri e oggi dai dati
+    grezzi (corregge gli incrementi persi o fatti in blocco); se il
+    rollup è vuoto (es. dopo un ripristino) ricostruisce tutto lo storico
+    
+    Eseguito: Ogni notte alle 3:15
+    """
+    print("\n🤖 [TASK] Riconciliazione statistiche giornaliere...")
+    
+    try:
+        if popola_statistiche_se_vuote():
+            return
+        oggi = oggi_locale()
+        righe = ricalcola_statistiche(oggi - timedelta(days=1), oggi)
+        print(f"   ✅ {righe} righe statistiche ricalcolate")
+    
+    except Exception as e:
+        print(f"   ❌ Errore task statistiche: {e}")
+
+
+# ============================================================================
+# TASK 7: BACKUP INCREMENTALE
+# ============================================================================
+
+def task_backup_incrementale():
+    """
+    Salva le righe nuove o modificate dall'ultimo backup della catena
+    (il primo giro, senza un backup completo, ne fa uno completo)
+    
+    Eseguito: Ogni ora (al minuto 30)
+    """
+    print("\n🤖 [TASK] Backup incrementale...")
+    
+    try:
+        percorso, _, conteggi = esegui_backup(incrementale=True)
+        print(f"   ✅ {sum(conteggi.values())} righe salvate in {percorso}")
+    
+    except Exception as e:
+        print(f"   ❌ Errore task backup: {e}")
+
+
+# ============================================================================
+# TASK 8: RIPRESA IMPORT INTERROTTI
+# ============================================================================
+
+def task_riprendi_import():
+    """
+    Riprende gli import CSV rimasti a metà (processo riavviato o crashato)
+    dall'ultimo blocco salvato
+    
+    Eseguito: Ogni 2 minuti
+    """
+    try:
+        ripresi = riprendi_import_interrotti()
+        if ripresi:
+            print(f"\n🤖 [TASK] Import interrotti ripresi: {ripresi}")
+    
+    except Exception as e:
+        print(f"   ❌ Errore task ripresa import: {e}")
+
+
 # ============================================================================
 # REGISTRAZIONE TASK
 # ============================================================================
 
+def _aggiungi_task(func, trigger, id, name, kwargs=None):
+    """
+    Registra un task nel job store, se manca o se è cambiato.
+
+    Un task già salvato e identico non viene riscritto: resta il suo
+    prossimo orario, così le esecuzioni perse mentre nessuno era leader
+    vengono recuperate (misfire) invece di essere saltate.
+    """
+    kwargs = kwargs or {}
+    esistente = scheduler.get_job(id)
+    if (
+        esistente and esistente.func is func and esistente.kwargs == kwargs
+        and repr(esistente.trigger) == repr(trigger) and esistente.name == name
+    ):
+        return
+
+    scheduler.add_job(func=func, trigger=trigger, kwargs=kwargs, id=id, name=name, replace_existing=True)
+
+
 def registra_task():
     """Registra tutti i task nel scheduler"""
     
@@ -286,68 +428,246 @@ def registra_task():
     print("="*70)
     
     # Task 1: Benvenuto (ogni ora)
-    scheduler.add_job(
+    _aggiungi_task(
         func=task_benvenuto_nuovo_cliente,
         trigger=CronTrigger(minute=0),  # Ogni ora
         id='benvenuto_nuovi_clienti',
-        name='Benvenuto nuovi clienti',
-        replace_existing=True
+        name='Benvenuto nuovi clienti'
     )
     print("✅ Task 1: Benvenuto (ogni ora)")
     
     # Task 2: Reminder (lunedì 9:00)
-    scheduler.add_job(
+    _aggiungi_task(
         func=task_reminder_settimanale,
         trigger=CronTrigger(day_of_week=0, hour=9, minute=0),  # Lunedì 9:00
+        kwargs={'settore': Config.REMINDER_SETTORE, 'tag': Config.REMINDER_TAG},
         id='reminder_settimanale',
-        name='Reminder settimanale',
-        replace_existing=True
+        name='Reminder settimanale'
     )
     print("✅ Task 2: Reminder settimanale (lunedì 9:00)")
     
     # Task 3: Upsell (ogni 3 giorni)
-    scheduler.add_job(
+    _aggiungi_task(
         func=task_upsell_intelligente,
         trigger=CronTrigger(hour=14, minute=0, day='*/3'),  # Ogni 3 giorni
+        kwargs={'settore': Config.UPSELL_SETTORE, 'tag': Config.UPSELL_TAG},
         id='upsell_intelligente',
-        name='Upsell intelligente',
-        replace_existing=True
+        name='Upsell intelligente'
     )
     print("✅ Task 3: Upsell intelligente (ogni 3 giorni)")
     
     # Task 4: Notifiche admin (ogni 6 ore)
-    scheduler.add_job(
+    _aggiungi_task(
         func=task_notifiche_admin,
         trigger=CronTrigger(hour='*/6', minute=0),  # Ogni 6 ore
         id='notifiche_admin',
-        name='Notifiche admin',
-        replace_existing=True
+        name='Notifiche admin'
     )
     print("✅ Task 4: Notifiche admin (ogni 6 ore)")
     
     # Task 5: Pulizia dati (domenica 2:00)
-    scheduler.add_job(
+    _aggiungi_task(
         func=task_pulizia_dati,
         trigger=CronTrigger(day_of_week=6, hour=2, minute=0),  # Domenica 2:00
         id='pulizia_dati',
-        name='Pulizia dati',
-        replace_existing=True
+        name='Pulizia dati'
     )
     print("✅ Task 5: Pulizia dati (domenica 2:00 AM)")
     
+    # Task 6: Riconciliazione statistiche (ogni notte 3:15)
+    _aggiungi_task(
+        func=task_riconcilia_statistiche,
+        trigger=CronTrigger(hour=3, minute=15, timezone=Config.TIMEZONE),
+        id='riconcilia_statistiche',
+        name='Riconciliazione statistiche'
+    )
+    print("✅ Task 6: Riconciliazione statistiche (ogni notte 3:15)")
+    
+    # Task 7: Backup incrementale (ogni ora)
+    if Config.BACKUP_INCREMENTALE_ABILITATO:
+        _aggiungi_task(
+            func=task_backup_incrementale,
+            trigger=CronTrigger(minute=30),  # Ogni ora, sfasato dal benvenuto
+            id='backup_incrementale',
+            name='Backup incrementale'
+        )
+        print("✅ Task 7: Backup incrementale (ogni ora)")
+    elif scheduler.get_job('backup_incrementale'):
+        scheduler.remove_job('backup_incrementale')
+    
+    # Task 8: Ripresa import interrotti (ogni 2 minuti)
+    _aggiungi_task(
+        func=task_riprendi_import,
+        trigger=CronTrigger(minute='*/2'),
+        id='riprendi_import',
+        name='Ripresa import interrotti'
+    )
+    print("✅ Task 8: Ripresa import interrotti (ogni 2 minuti)")
+    
     print("="*70 + "\n")
 
 
-def start_scheduler():
-    """Avvia lo scheduler"""
-    if not scheduler.running:
-        registra_task()
-        scheduler.start()
+# ============================================================================
+# LEADERSHIP (un solo processo esegue i task)
+# ============================================================================
+
+NOME_LEASE = "scheduler"
+# Identifica questo processo nel lease (più worker sullo stesso host = pid diversi)
+PROPRIETARIO = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_leader = False
+_fermo = threading.Event()
+_thread_lease = None
+
+
+def _rinnova_lease():
+    """
+    Prende o rinnova il lease; True se questo processo è il leader.
+
+    Un solo UPDATE condizionato: riesce se il lease è già nostro o è
+    scaduto, quindi due processi non possono prenderlo insieme. Gli orari
+    sono quelli dei server: con più macchine vanno sincronizzati (NTP).
+    """
+    adesso = datetime.utcnow()
+    db = get_db_session()
+
+    try:
+        if db.get(SchedulerLeaseDB, NOME_LEASE) is None:
+            db.add(SchedulerLeaseDB(nome=NOME_LEASE, proprietario="", scade_il=adesso))
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()  # creato nel frattempo da un altro processo
+
+        risultato = db.execute(
+            update(SchedulerLeaseDB)
+            .where(
+                SchedulerLeaseDB.nome == NOME_LEASE,
+                or_(SchedulerLeaseDB.proprietario == PROPRIETARIO, SchedulerLeaseDB.scade_il <= adesso),
+            )
+            .values(
+                proprietario=PROPRIETARIO,
+                scade_il=adesso + timedelta(seconds=Config.SCHEDULER_LEASE_DURATA),
+                rinnovato_il=adesso,
+                acquisito_il=case(
+                    (SchedulerLeaseDB.proprietario == PROPRIETARIO, SchedulerLeaseDB.acquisito_il),
+                    else_=adesso,
+                ),
+            )
+        )
+        db.commit()
+        return risultato.rowcount == 1
+
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _rilascia_lease():
+    """Lascia subito il lease (spegnimento pulito): il failover non aspetta la scadenza"""
+    db = get_db_session()
+    try:
+        db.execute(
+            update(SchedulerLeaseDB)
+            .where(SchedulerLeaseDB.nome == NOME_LEASE, SchedulerLeaseDB.proprietario == PROPRIETARIO)
+            .values(scade_il=datetime.utcnow())
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _imposta_leader(leader):
+    """Avvia/riprende i task quando si diventa leader, li sospende quando si perde il lease"""
+    global _leader
+
+    if leader and not _leader:
+        print(f"👑 Scheduler leader: {PROPRIETARIO}")
+        if not scheduler.running:
+            scheduler.start(paused=True)
+            registra_task()
+        scheduler.resume()
         print("🟢 Scheduler avviato!\n")
+    elif not leader and _leader:
+        scheduler.pause()
+        print(f"⏸️  Scheduler: lease perso, task sospesi ({PROPRIETARIO})")
+
+    _leader = leader
+
+
+def _ciclo_lease():
+    """Thread di ogni processo: rinnova (o prova a prendere) il lease a intervalli"""
+    while True:
+        try:
+            leader = _rinnova_lease()
+        except Exception as e:
+            # Senza database non si può sapere se il lease è ancora nostro
+            print(f"   ❌ Errore rinnovo lease scheduler: {e}")
+            leader = False
+
+        try:
+            _imposta_leader(leader)
+        except Exception as e:
+            print(f"   ❌ Errore avvio scheduler: {e}")
+
+        if _fermo.wait(Config.SCHEDULER_LEASE_RINNOVO):
+            return
+
+
+def is_leader():
+    """True se in questo processo i task sono attivi"""
+    return _leader
+
+
+def stato_lease():
+    """Leader corrente secondo il database (per /admin/scheduler/status)"""
+    db = get_read_session()
+    try:
+        lease = db.get(SchedulerLeaseDB, NOME_LEASE)
+        if lease is None:
+            return None
+        return {
+            "proprietario": lease.proprietario,
+            "scade_il": lease.scade_il.isoformat(),
+            "acquisito_il": lease.acquisito_il.isoformat() if lease.acquisito_il else None,
+            "rinnovato_il": lease.rinnovato_il.isoformat() if lease.rinnovato_il else None,
+        }
+    finally:
+        db.close()
+
+
+def start_scheduler():
+    """
+    Avvia la contesa del lease: i task partono solo se (e quando) questo
+    processo diventa leader
+    """
+    global _thread_lease
+    if _thread_lease and _thread_lease.is_alive():
+        return
+
+    _fermo.clear()
+    _thread_lease = threading.Thread(target=_ciclo_lease, name="scheduler-lease", daemon=True)
+    _thread_lease.start()
+    print(f"⏳ Scheduler in attesa del lease ({PROPRIETARIO})")
 
 
 def stop_scheduler():
-    """Ferma lo scheduler"""
+    """Ferma lo scheduler e lascia il lease a un altro processo"""
+    global _leader
+
+    _fermo.set()
+    if _thread_lease and _thread_lease.is_alive():
+        _thread_lease.join(timeout=10)
+
     if scheduler.running:
         scheduler.shutdown()
         print("🔴 Scheduler fermato!\n")
+
+    if _leader:
+        _leader = False
+        try:
+            _rilascia_lease()
+        except Exception as e:
+            print(f"   ❌ Errore rilascio lease scheduler: {e}")
@@ -0,0 +1,276 @@
+"""
+Statistiche - Rollup giornaliero incrementale (tabella statistiche_giornaliere)
+
+Ogni messaggio e ogni nuovo cliente incrementano la riga (giorno, settore);
+un job notturno ricalcola gli ultimi giorni dai dati grezzi per correggere
+eventuali scarti (import in blocco, errori a metà richiesta, ...).
+
+Con la tabella vuota (primo avvio dopo l'aggiornamento, database nuovo)
+lo storico viene ricostruito da init_db. I messaggi più vecchi di
+Config.MESSAGGI_CONSERVAZIONE_GIORNI vengono eliminati da task_pulizia_dati,
+le righe del rollup no: per quei giorni il ricalcolo le lascia com'erano.
+"""
+
+from collections import Counter
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from config import Config
+from database import get_db_session, ClienteDB, MessaggioDB, StatisticaGiornalieraDB
+
+FUSO_ORARIO = ZoneInfo(Config.TIMEZONE)
+
+# Colonne contatore per tipo di risposta
+COLONNE_TIPO = {
+    "faq": "messaggi_faq",
+    "perplexity": "messaggi_perplexity",
+}
+
+
+# ============================================================================
+# GIORNI LOCALI
+# ============================================================================
+
+def giorno_locale(quando_utc):
+    """Datetime UTC naive (come salvato nel DB) -> data locale (Europe/Rome)"""
+    return quando_utc.replace(tzinfo=timezone.utc).astimezone(FUSO_ORARIO).date()
+
+
+def oggi_locale():
+    """Data di oggi nel fuso orario configurato"""
+    return datetime.now(FUSO_ORARIO).date()
+
+
+def inizio_giorno_utc(giorno):
+    """Mezzanotte locale del giorno, come datetime UTC naive per le query"""
+    inizio = datetime.combine(giorno, time.min, tzinfo=FUSO_ORARIO)
+    return inizio.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _settore(settore):
+    return settore or "generico"
+
+
+# ============================================================================
+# AGGIORNAMENTO INCREMENTALE
+# ============================================================================
+
+def incrementa_statistiche(db, giorno, settore, **incrementi):
+    """
+    Somma gli incrementi alla riga (giorno, settore), creandola se manca.
+
+    Su SQLite e PostgreSQL è un solo INSERT ... ON CONFLICT DO UPDATE,
+    atomico anche con più worker. Il commit resta al chiamante.
+    """
+    incrementi = {k: v for k, v in incrementi.items() if v}
+    if not incrementi:
+        return
+
+    tabella = StatisticaGiornalieraDB.__table__
+    settore = _settore(settore)
+    dialetto = db.get_bind().dialect.name
+
+    if dialetto in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialetto == "sqlite" else pg_insert
+        stmt = insert(tabella).values(giorno=giorno, settore=settore, **incrementi)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["giorno", "settore"],
+            set_={k: tabella.c[k] + stmt.excluded[k] for k in incrementi},
+        )
+        db.execute(stmt)
+        return
+
+    risultato = db.execute(
+        update(tabella)
+        .where(tabella.c.giorno == giorno, tabella.c.settore == settore)
+        .values({k: tabella.c[k] + v for k, v in incrementi.items()})
+    )
+    if risultato.rowcount == 0:
+        db.execute(tabella.insert().values(giorno=giorno, settore=settore, **incrementi))
+
+
+def registra_messaggio(db, settore, tipo_risposta, quando, primo_del_giorno):
+    """
+    Conta un messaggio nel rollup.
+
+    primo_del_giorno: True se è il primo messaggio del cliente nel giorno
+    locale (incrementa clienti_attivi).
+    """
+    incrementi = {"messaggi_totali": 1}
+    if tipo_risposta in COLONNE_TIPO:
+        incrementi[COLONNE_TIPO[tipo_risposta]] = 1
+    if primo_del_giorno:
+        incrementi["clienti_attivi"] = 1
+
+    incrementa_statistiche(db, giorno_locale(quando), settore, **incrementi)
+
+
+def registra_nuovi_clienti(db, clienti):
+    """Conta nel rollup i clienti appena creati (uno o più)"""
+    conteggi = Counter(
+        (giorno_locale(c.data_creazione or datetime.utcnow()), _settore(c.settore))
+        for c in clienti
+    )
+    for (giorno, settore), numero in conteggi.items():
+        incrementa_statistiche(db, giorno, settore, nuovi_clienti=numero)
+
+
+# ============================================================================
+# RICONCILIAZIONE
+# ============================================================================
+
+def _primo_giorno_conservato():
+    """Primo giorno locale con tutti i messaggi ancora presenti (vedi task_pulizia_dati)"""
+    limite = datetime.utcnow() - timedelta(days=Config.MESSAGGI_CONSERVAZIONE_GIORNI)
+    return giorno_locale(limite) + timedelta(days=1)
+
+
+def ricalcola_statistiche(giorno_da, giorno_a=None):
+    """
+    Ricostruisce le righe dei giorni [giorno_da, giorno_a] dai dati grezzi.
+
+    Usata dal job notturno (ieri e oggi), da popola_statistiche_se_vuote e
+    da scripts/ricalcola_statistiche.py. I giorni i cui messaggi sono già
+    stati (anche in parte) eliminati da task_pulizia_dati vengono ricalcolati
+    solo se non hanno ancora righe: altrimenti verrebbero azzerati.
+    """
+    giorno_a = giorno_a or giorno_da
+    primo_conservato = _primo_giorno_conservato()
+    db = get_db_session()
+
+    try:
+        giorno = giorno_da
+        righe_scritte = 0
+
+        while giorno <= giorno_a:
+            if giorno < primo_conservato and db.query(StatisticaGiornalieraDB.id).filter(
+                StatisticaGiornalieraDB.giorno == giorno
+            ).first() is not None:
+                giorno += timedelta(days=1)
+                continue
+
+            inizio = inizio_giorno_utc(giorno)
+            fine = inizio_giorno_utc(giorno + timedelta(days=1))
+            righe = {}
+
+            def riga(settore):
+                return righe.setdefault(_settore(settore), Counter())
+
+            settore_msg = func.coalesce(ClienteDB.settore, "generico")
+            messaggi = db.query(
+                settore_msg, MessaggioDB.tipo_risposta, func.count(MessaggioDB.id)
+            ).outerjoin(
+                ClienteDB, ClienteDB.id == MessaggioDB.cliente_id
+            ).filter(
+                MessaggioDB.data_messaggio >= inizio,
+                MessaggioDB.data_messaggio < fine
+            ).group_by(settore_msg, MessaggioDB.tipo_risposta).all()
+
+            for settore, tipo, numero in messaggi:
+                riga(settore)["messaggi_totali"] += numero
+                if tipo in COLONNE_TIPO:
+                    riga(settore)[COLONNE_TIPO[tipo]] += numero
+
+            attivi = db.query(
+                settore_msg, func.count(func.distinct(MessaggioDB.cliente_id))
+            ).outerjoin(
+                ClienteDB, ClienteDB.id == MessaggioDB.cliente_id
+            ).filter(
+                MessaggioDB.data_messaggio >= inizio,
+                MessaggioDB.data_messaggio < fine
+            ).group_by(settore_msg).all()
+
+            for settore, numero in attivi:
+                riga(settore)["clienti_attivi"] += numero
+
+            nuovi = db.query(
+                ClienteDB.settore, func.count(ClienteDB.id)
+            ).filter(
+                ClienteDB.data_creazione >= inizio,
+                ClienteDB.data_creazione < fine
+            ).group_by(ClienteDB.settore).all()
+
+            for settore, numero in nuovi:
+                riga(settore)["nuovi_clienti"] += numero
+
+            db.query(StatisticaGiornalieraDB).filter(
+                StatisticaGiornalieraDB.giorno == giorno
+            ).delete(synchronize_session=False)
+
+            db.add_all([
+                StatisticaGiornalieraDB(giorno=giorno, settore=settore, **{
+                    colonna: valori[colonna] for colonna in (
+                        "messaggi_totali", "messaggi_faq", "messaggi_perplexity",
+                        "nuovi_clienti", "clienti_attivi"
+                    )
+                })
+                for settore, valori in righe.items()
+            ])
+            db.commit()
+
+            righe_scritte += len(righe)
+            giorno += timedelta(days=1)
+
+        return righe_scritte
+
+    finally:
+        db.close()
+
+
+def popola_statistiche_se_vuote():
+    """
+    Primo popolamento del rollup: se la tabella è vuota ricalcola dal primo
+    messaggio o cliente fino a oggi. Ritorna le righe scritte (0 se il
+    rollup c'era già o non ci sono dati).
+    """
+    db = get_db_session()
+    try:
+        if db.query(StatisticaGiornalieraDB.id).first() is not None:
+            return 0
+        date = [
+            d for d in (
+                db.query(func.min(MessaggioDB.data_messaggio)).scalar(),
+                db.query(func.min(ClienteDB.data_creazione)).scalar(),
+            ) if d is not None
+        ]
+    finally:
+        db.close()
+
+    if not date:
+        return 0
+
+    giorno_da = giorno_locale(min(date))
+    print(f"📊 Rollup statistiche vuoto: ricalcolo dal {giorno_da} a oggi...")
+    righe = ricalcola_statistiche(giorno_da, oggi_locale())
+    print(f"   ✅ {righe} righe statistiche scritte")
+    return righe
+
+
+# ============================================================================
+# LETTURA
+# ============================================================================
+
+def somma_statistiche(db, giorno_da=None, giorno_a=None, settore=None):
+    """
+    Somma i contatori del rollup nell'intervallo di giorni (estremi inclusi).
+
+    Ritorna un dict colonna -> totale (0 se non ci sono righe).
+    """
+    colonne = (
+        "messaggi_totali", "messaggi_faq", "messaggi_perplexity",
+        "nuovi_clienti", "clienti_attivi"
+    )
+    query = db.query(*[
+        func.coalesce(func.sum(getattr(StatisticaGiornalieraDB, c)), 0) for c in colonne
+    ])
+
+    if giorno_da:
+        query = query.filter(StatisticaGiornalieraDB.giorno >= giorno_da)
+    if giorno_a:
+        query = query.filter(StatisticaGiornalieraDB.giorno <= giorno_a)
+    if settore:
+        query = query.filter(StatisticaGiornalieraDB.settore == settore)
+
+    return dict(zip(colonne, (int(v) for v in query.one())))
@@ -0,0 +1,109 @@
+"""
+Tag - Etichette clienti normalizzate (tabelle tag e cliente_tag)
+"""
+
+from sqlalchemy import select, func
+from database import ClienteDB, TagDB, ClienteTagDB
+
+# Separatore usato nel campo testuale ClienteDB.etichette
+SEPARATORE_ETICHETTE = "|"
+
+
+def parse_etichette(etichette):
+    """
+    Converte "VIP|Attivo" (o una lista) in una lista di tag puliti.
+
+    Rimuove spazi, valori vuoti e duplicati mantenendo l'ordine.
+    """
+    if not etichette:
+        return []
+
+    if isinstance(etichette, str):
+        etichette = etichette.split(SEPARATORE_ETICHETTE)
+
+    tags = []
+    for nome in etichette:
+        nome = str(nome).strip()
+        if nome and nome not in tags:
+            tags.append(nome)
+    return tags
+
+
+def formatta_etichette(tags):
+    """Lista di tag -> stringa "VIP|Attivo" per ClienteDB.etichette"""
+    return SEPARATORE_ETICHETTE.join(tags)
+
+
+def get_o_crea_tag(db, nomi):
+    """
+    Ritorna {nome: tag_id} per i nomi dati, creando i tag mancanti.
+
+    Una sola query per i tag esistenti, un flush per i nuovi.
+    """
+    if not nomi:
+        return {}
+
+    esistenti = dict(
+        db.query(TagDB.nome, TagDB.id).filter(TagDB.nome.in_(nomi)).all()
+    )
+
+    nuovi = [TagDB(nome=nome) for nome in nomi if nome not in esistenti]
+    if nuovi:
+        db.add_all(nuovi)
+        db.flush()
+        esistenti.update({t.nome: t.id for t in nuovi})
+
+    return esistenti
+
+
+def sincronizza_tag_cliente(db, cliente, etichette):
+    """
+    Imposta i tag di un cliente (sostituisce quelli esistenti).
+
+    Aggiorna sia cliente_tag sia la copia testuale ClienteDB.etichette.
+    Il cliente deve avere già un id (fare flush prima se è nuovo).
+    Il commit resta al chiamante.
+    """
+    tags = parse_etichette(etichette)
+    cliente.etichette = formatta_etichette(tags)
+
+    if cliente.id is None:
+        db.flush()
+
+    db.query(ClienteTagDB).filter(
+        ClienteTagDB.cliente_id == cliente.id
+    ).delete(synchronize_session=False)
+
+    tag_ids = get_o_crea_tag(db, tags)
+    db.add_all([
+        ClienteTagDB(cliente_id=cliente.id, tag_id=tag_ids[nome])
+        for nome in tags
+    ])
+
+
+def rimuovi_tag_cliente(db, cliente_id):
+    """Elimina le associazioni di un cliente (SQLite non applica ON DELETE)"""
+    db.query(ClienteTagDB).filter(
+        ClienteTagDB.cliente_id == cliente_id
+    ).delete(synchronize_session=False)
+
+
+def filtra_per_tag(query, tags):
+    """
+    Aggiunge a una query su ClienteDB il filtro "ha TUTTI questi tag".
+
+    Usa l'indice (tag_id, cliente_id): nessuna scansione di etichette.
+    """
+    tags = parse_etichette(tags)
+    if not tags:
+        return query
+
+    clienti_con_tag = (
+        select(ClienteTagDB.cliente_id)
+        .join(TagDB, TagDB.id == ClienteTagDB.tag_id)
+        .where(TagDB.nome.in_(tags))
+        .group_by(ClienteTagDB.cliente_id)
+        .having(func.count(ClienteTagDB.tag_id) == len(tags))
+    )
+
+    return query.filter(ClienteDB.id.in_(clienti_con_tag))
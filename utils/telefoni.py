@@ -0,0 +1,136 @@
+"""
+Telefoni - Normalizzazione dei numeri nel formato E.164 ("+393331234567")
+
+Ogni numero che entra nel sistema (webhook, dashboard, import, script)
+passa da qui, così "0039 333 1234567", "333 123 4567" e "+39 333-1234567"
+diventano lo stesso cliente e l'indice unico su clienti.phone li vede
+come duplicati.
+
+Regole (prefisso predefinito Config.TELEFONO_PREFISSO, Italia):
+- spazi, trattini, punti, parentesi e barre vengono rimossi
+- "+" o "00" iniziale: il numero ha già il prefisso internazionale
+- numero nazionale italiano (cellulare 3xx di 9-10 cifre, fisso 0x di
+  6-11 cifre): viene aggiunto +39, lo 0 dei fissi resta
+- 39 + numero nazionale valido: internazionale scritto senza "+"
+- altre sequenze di cifre: internazionali scritte senza "+"
+- risultato valido: 8-15 cifre, prefisso che non inizia con 0, e per +39
+  un numero nazionale italiano valido
+"""
+
+import re
+from config import Config
+
+_SEPARATORI = re.compile(r"[\s\-\.\(\)/]")
+# Già normalizzato: il caso più comune, riconosciuto senza altri passaggi
+_E164_ITALIANO = re.compile(r"\+39(?:3\d{8,9}|0\d{5,10})")
+
+
+def _nazionale_italiano(cifre):
+    """Cellulare 3xx (9-10 cifre) o fisso 0x (6-11 cifre, lo 0 fa parte del numero)"""
+    if cifre.startswith("3"):
+        return 9 <= len(cifre) <= 10
+    if cifre.startswith("0"):
+        return 6 <= len(cifre) <= 11
+    return False
+
+
+def _internazionale_valido(cifre):
+    """Cifre dopo il "+": lunghezza E.164 e, per l'Italia, numero nazionale valido"""
+    if not (cifre.isascii() and cifre.isdigit()):
+        return False
+    if not 8 <= len(cifre) <= 15 or cifre.startswith("0"):
+        return False
+    if cifre.startswith("39"):
+        return _nazionale_italiano(cifre[2:])
+    return True
+
+
+def _estero_valido(cifre):
+    """Cifre dopo il "+" valide per un prefisso diverso da +39 ("+354 5551234", Islanda)"""
+    return not cifre.startswith("39") and _internazionale_valido(cifre)
+
+
+def _aggiungi_prefisso(cifre, prefisso):
+    """Numero scritto senza "+" né "00" -> cifre con prefisso internazionale"""
+    if prefisso == "39":
+        # "390612345" è +39 06 12345 scritto senza "+", non un cellulare 390...
+        if cifre.startswith("39") and _nazionale_italiano(cifre[2:]):
+            return cifre
+        # Lo 0 dei fissi italiani resta nel numero internazionale
+        return "39" + cifre if _nazionale_italiano(cifre) else cifre
+    if cifre.startswith("0"):
+        return prefisso + cifre[1:]  # 0 nazionale (trunk) da togliere
+    return cifre
+
+
+def normalizza_telefono(numero, prefisso=None, internazionale=False, vecchio_formato=False):
+    """
+    Numero come scritto dall'utente -> "+<cifre>" E.164, None se non valido.
+
+    - prefisso: paese per i numeri nazionali (default Config.TELEFONO_PREFISSO)
+    - internazionale: le cifre includono già il prefisso anche senza "+"
+      (wa_id di WhatsApp: "393331234567")
+    - vecchio_formato: numeri salvati prima di questo modulo, quando a
+      qualunque input veniva aggiunto "+": il "+" non è affidabile
+      ("+3331234567" era il cellulare nazionale 333 1234567). Viene tolto
+      solo se il numero non è già un E.164 valido di un altro paese: quelli
+      restano com'erano (vedi ambiguo_vecchio_formato)
+    """
+    testo = _SEPARATORI.sub("", str(numero or ""))
+    if not testo:
+        return None
+
+    if _E164_ITALIANO.fullmatch(testo) and not vecchio_formato:
+        return testo
+
+    if testo.startswith("+") and vecchio_formato and not _estero_valido(testo[1:]):
+        testo = testo[1:]
+
+    if testo.startswith("+"):
+        cifre = testo[1:]
+    elif testo.startswith("00"):
+        cifre = testo[2:]
+    elif internazionale:
+        cifre = testo
+    else:
+        cifre = _aggiungi_prefisso(testo, prefisso or Config.TELEFONO_PREFISSO)
+
+    return "+" + cifre if _internazionale_valido(cifre) else None
+
+
+def ambiguo_vecchio_formato(numero):
+    """
+    True per i numeri salvati con il vecchio formato che hanno due letture:
+    "+3545551234" è un numero islandese (+354) valido, ma anche il cellulare
+    italiano 354 5551234 a cui veniva aggiunto il "+". Con vecchio_formato
+    normalizza_telefono li lascia come sono: va deciso caso per caso.
+    """
+    testo = _SEPARATORI.sub("", str(numero or ""))
+    if not testo.startswith("+"):
+        return False
+    cifre = testo[1:]
+    return _estero_valido(cifre) and _nazionale_italiano(cifre)
+
+
+def normalizza_telefoni(numeri, prefisso=None, internazionale=False, vecchio_formato=False):
+    """
+    normalizza_telefono su una lista (lista in, lista out, None = non valido).
+
+    È un ciclo valore per valore con una memo: ogni numero distinto viene
+    normalizzato una volta sola, i duplicati (frequenti negli export dei
+    CRM) riusano il risultato. Niente elaborazione in blocco: sui numeri
+    tutti diversi costa come chiamare normalizza_telefono per ciascuno.
+    """
+    prefisso = prefisso or Config.TELEFONO_PREFISSO
+    calcolati = {}
+    risultati = []
+
+    for numero in numeri:
+        try:
+            risultati.append(calcolati[numero])
+        except KeyError:
+            normalizzato = normalizza_telefono(numero, prefisso, internazionale, vecchio_formato)
+            calcolati[numero] = normalizzato
+            risultati.append(normalizzato)
+
+    return risultati